@@ -0,0 +1,32 @@
+import hmac
+import os
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from database import supabase, get_async_db
+
+# 維護用端點 (重建 / 修復 / 清除快取) 的存取控制 (routers/teams.py 以 dependencies=[Depends(require_admin)] 使用)
+# 排程呼叫：X-Cron-Secret 標頭帶入環境變數 CRON_SECRET；管理介面：Supabase JWT 且 manager_roles 為啟用中的 admin
+CRON_SECRET = os.getenv("CRON_SECRET")
+
+async def require_admin(request: Request) -> None:
+    """驗證排程密鑰或 admin JWT，未通過時回傳 401 / 403"""
+    cron_secret = request.headers.get("X-Cron-Secret")
+    if cron_secret is not None:
+        if CRON_SECRET and hmac.compare_digest(cron_secret.encode(), CRON_SECRET.encode()):
+            return
+        raise HTTPException(status_code=403, detail="Invalid cron secret")
+
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    try:
+        user_response = await run_in_threadpool(supabase.auth.get_user, auth_header.split(" ", 1)[1])
+        user = user_response.user
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Token verification failed: {str(e)}")
+    if not user or not user.email:
+        raise HTTPException(status_code=401, detail="Invalid token or missing email")
+
+    res = await get_async_db().table("manager_roles").select("role, is_active").eq("email", user.email).execute()
+    if not any(r.get("role") == "admin" and r.get("is_active") for r in res.data or []):
+        raise HTTPException(status_code=403, detail="Admin access required")
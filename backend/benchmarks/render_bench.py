@@ -0,0 +1,219 @@
+"""
+OG / 分享卡片渲染效能測試
+
+    python benchmarks/render_bench.py [--repeat 5] [--db 10] [--font PATH] [--json out.json]
+
+- 路線語料：2 km 短爬坡 ~ 200 km 長距離 (以固定亂數種子產生，點距約 10 m，接近 Strava 詳細 polyline)；
+  --db N 另外加入 segments 表中 N 條真實路段
+- 分段計時：decode / project (投影 + 簡化) / draw / encode，取 repeat 次的中位數
+- 記憶體：每個案例的 Python heap 峰值 (tracemalloc) 與整個行程的最大 RSS
+- 吞吐量：以每核心一個 worker 的 process pool 完整渲染整個語料，換算每核心每秒張數
+- 地圖圖磚使用離線替身 (固定的雜訊 PNG)，結果不受網路影響
+"""
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import polyline
+from PIL import Image
+from utils import render_assets
+from utils.route_geometry import decode, project, simplify_mask, simplify_latlon, DEFAULT_TOLERANCE_PX
+from utils.share_card import W, H, ROUTE_PADDING, draw_share_card, encode_png
+from utils.og_generator import OG_WIDTH, OG_HEIGHT, draw_race_og_image, encode_jpeg
+from utils.tile_cache import TileCache, TILE_SIZE
+
+# (名稱, 公里數, 起點)
+CORPUS = [
+    ("short climb 2 km", 2, (24.1436, 120.6597)),
+    ("KOM 8 km", 8, (25.1712, 121.5589)),
+    ("Wuling 25 km", 25, (24.0845, 121.1712)),
+    ("loop 100 km", 100, (23.4801, 120.4491)),
+    ("brevet 200 km", 200, (22.6273, 120.3014)),
+]
+POINT_SPACING_M = 10
+
+def synthetic_route(length_km: float, start: Tuple[float, float], seed: int) -> str:
+    """以平滑轉向的隨機路徑模擬真實路線 (含髮夾彎)，回傳 encoded polyline"""
+    rng = np.random.default_rng(seed)
+    n = int(length_km * 1000 / POINT_SPACING_M)
+    turn = np.convolve(rng.normal(0, 0.08, n), np.ones(25) / 25, mode="same")
+    # 偶爾出現髮夾彎
+    hairpins = rng.random(n) < 0.002
+    turn[hairpins] += rng.choice([-1, 1], hairpins.sum()) * math.pi / 3
+    heading = np.cumsum(turn)
+    d_lat = np.cos(heading) * POINT_SPACING_M / 111_320
+    d_lon = np.sin(heading) * POINT_SPACING_M / (111_320 * math.cos(math.radians(start[0])))
+    lat = start[0] + np.cumsum(d_lat)
+    lon = start[1] + np.cumsum(d_lon)
+    return polyline.encode(list(zip(lat.tolist(), lon.tolist())), 5)
+
+def load_corpus(db_limit: int = 0) -> List[Dict[str, Any]]:
+    corpus = [
+        {"name": name, "polyline": synthetic_route(km, start, seed=i), "distance": km * 1000, "elevation": 500}
+        for i, (name, km, start) in enumerate(CORPUS)
+    ]
+    if db_limit:
+        from database import supabase
+        res = supabase.table("segments").select("name, polyline, distance, elevation_gain") \
+            .not_.is_("polyline", "null").limit(db_limit).execute()
+        corpus += [
+            {"name": f"db: {r['name']}", "polyline": r["polyline"], "distance": r.get("distance") or 0, "elevation": r.get("elevation_gain") or 0}
+            for r in res.data or []
+        ]
+    return corpus
+
+class StandInTileCache(TileCache):
+    """離線圖磚替身：所有圖磚回傳同一張預先編碼的雜訊 PNG (保留 PNG 解碼成本)"""
+
+    def __init__(self):
+        super().__init__(offline=True)
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(20, 60, (TILE_SIZE, TILE_SIZE, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels, "RGB").save(buf, format="PNG")
+        self._tile = buf.getvalue()
+
+    def get_tile(self, z, x, y):
+        self.stats["hits"] += 1
+        return self._tile
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def share_card_stages(route: Dict[str, Any]) -> Dict[str, float]:
+    inputs = {"title": route["name"], "distance": f"{route['distance'] / 1000:.1f}km", "elevation": f"{route['elevation']}m", "grade": "5%"}
+    latlon, t_decode = _timed(decode, route["polyline"])
+
+    def _project():
+        pixels = project(latlon, W, H, ROUTE_PADDING)
+        return [tuple(p) for p in pixels[simplify_mask(pixels, DEFAULT_TOLERANCE_PX)].tolist()]
+
+    pixels, t_project = _timed(_project)
+    img, t_draw = _timed(draw_share_card, inputs, pixels)
+    data, t_encode = _timed(encode_png, img)
+    return {"decode": t_decode, "project": t_project, "draw": t_draw, "encode": t_encode, "points": len(latlon), "drawn": len(pixels), "bytes": len(data)}
+
+_tiles: Optional[StandInTileCache] = None
+
+def og_stages(route: Dict[str, Any]) -> Dict[str, float]:
+    global _tiles
+    if _tiles is None:
+        _tiles = StandInTileCache()
+    latlon, t_decode = _timed(decode, route["polyline"])
+    path, t_project = _timed(lambda: simplify_latlon(latlon, OG_WIDTH, OG_HEIGHT)[:, ::-1].tolist())
+    img, t_draw = _timed(draw_race_og_image, route["name"], path, route["distance"], route["elevation"], _tiles)
+    data, t_encode = _timed(encode_jpeg, img)
+    return {"decode": t_decode, "project": t_project, "draw": t_draw, "encode": t_encode, "points": len(latlon), "drawn": len(path), "bytes": len(data)}
+
+RENDERERS = {"share_image": share_card_stages, "og_generator": og_stages}
+STAGES = ("decode", "project", "draw", "encode")
+
+def bench_case(renderer: str, route: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    fn = RENDERERS[renderer]
+    fn(route)   # 暖機 (字型、底圖圖層)
+    runs = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        runs.append(fn(route))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {"renderer": renderer, "route": route["name"], "points": runs[0]["points"], "drawn": runs[0]["drawn"], "bytes": runs[0]["bytes"]}
+    for stage in STAGES:
+        result[f"{stage}_ms"] = round(statistics.median(r[stage] for r in runs), 2)
+    result["total_ms"] = round(sum(result[f"{s}_ms"] for s in STAGES), 2)
+    result["py_peak_kb"] = round(peak / 1024)
+    return result
+
+def _init_worker(font_path: Optional[str]):
+    if font_path:
+        render_assets.FONT_PATH = font_path
+    render_assets.preload()
+
+def _render_all(args) -> int:
+    renderer, corpus = args
+    for route in corpus:
+        RENDERERS[renderer](route)
+    return len(corpus)
+
+def bench_throughput(renderer: str, corpus: List[Dict[str, Any]], rounds: int, font_path: Optional[str]) -> Dict[str, Any]:
+    workers = os.cpu_count() or 1
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(font_path,)) as pool:
+        list(pool.map(_render_all, [(renderer, corpus)] * workers))   # 暖機
+        start = time.perf_counter()
+        rendered = sum(pool.map(_render_all, [(renderer, corpus)] * (workers * rounds)))
+        elapsed = time.perf_counter() - start
+    return {
+        "renderer": renderer,
+        "workers": workers,
+        "renders": rendered,
+        "renders_per_sec": round(rendered / elapsed, 2),
+        "renders_per_sec_per_core": round(rendered / elapsed / workers, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OG / share image rendering")
+    parser.add_argument("--repeat", type=int, default=5, help="每個案例重複次數 (取中位數)")
+    parser.add_argument("--rounds", type=int, default=2, help="吞吐量測試中每個 worker 渲染整個語料的次數")
+    parser.add_argument("--db", type=int, default=0, help="另外加入 segments 表中的路段數")
+    parser.add_argument("--font", help="覆寫字型路徑 (未內附 NotoSansTC 時使用)")
+    parser.add_argument("--renderer", choices=list(RENDERERS), action="append", help="只測試指定的渲染器")
+    parser.add_argument("--json", help="結果另存為 JSON")
+    args = parser.parse_args()
+
+    _init_worker(args.font)
+    if not os.path.exists(render_assets.FONT_PATH):
+        print(f"[WARN] {render_assets.FONT_PATH} not found; og_generator draws CJK text and needs a TrueType font (--font)")
+
+    corpus = load_corpus(args.db)
+    renderers = args.renderer or list(RENDERERS)
+
+    cases = []
+    print(f"{'renderer':<13} {'route':<20} {'points':>7} {'drawn':>6} " + " ".join(f"{s + '_ms':>10}" for s in STAGES) + f" {'total_ms':>9} {'py_peak_kb':>10} {'bytes':>8}")
+    for renderer in renderers:
+        for route in corpus:
+            try:
+                r = bench_case(renderer, route, args.repeat)
+            except Exception as e:
+                print(f"{renderer:<13} {route['name'][:20]:<20} failed: {e}")
+                continue
+            cases.append(r)
+            print(f"{r['renderer']:<13} {r['route'][:20]:<20} {r['points']:>7} {r['drawn']:>6} "
+                  + " ".join(f"{r[s + '_ms']:>10}" for s in STAGES)
+                  + f" {r['total_ms']:>9} {r['py_peak_kb']:>10} {r['bytes']:>8}")
+
+    throughput = []
+    for renderer in renderers:
+        try:
+            t = bench_throughput(renderer, corpus, args.rounds, args.font)
+        except Exception as e:
+            print(f"[WARN] Throughput for {renderer} failed: {e}")
+            continue
+        throughput.append(t)
+        print(f"{renderer}: {t['renders_per_sec']} renders/s on {t['workers']} cores ({t['renders_per_sec_per_core']} per core)")
+
+    max_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(f"Max RSS (main process): {max_rss_mb} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cases": cases, "throughput": throughput, "max_rss_mb": max_rss_mb}, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
-
 import os
+from typing import Dict, Optional, Union
+from httpx import AsyncClient, Limits, Timeout
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
@@ -12,6 +15,40 @@ key: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 if not url or not key:
     raise ValueError("SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY not set")
 
+# 同步 client：批次工作、背景 thread 與 def 路由 (FastAPI 於 thread pool 執行) 使用
 supabase: Client = create_client(url, key)
 
-
+# async 路由使用的 PostgREST client：共用 httpx 連線池，查詢等待期間不佔用 event loop
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "50"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+
+class _PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout: Union[int, float, Timeout]) -> AsyncClient:
+        return AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=Limits(max_connections=DB_POOL_SIZE, max_keepalive_connections=DB_POOL_SIZE),
+        )
+
+_async_db: Optional[AsyncPostgrestClient] = None
+
+def get_async_db() -> AsyncPostgrestClient:
+    """
+    取得 async PostgREST client (與 supabase.table() 相同的查詢語法，execute() 需 await)。
+    例：res = await get_async_db().table("segments").select("*").eq("id", 1).execute()
+    """
+    global _async_db
+    if _async_db is None:
+        _async_db = _PooledAsyncPostgrestClient(
+            f"{url}/rest/v1",
+            headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, "apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=DB_TIMEOUT,
+        )
+    return _async_db
+
+async def close_async_db():
+    global _async_db
+    if _async_db is not None:
+        await _async_db.aclose()
+        _async_db = None
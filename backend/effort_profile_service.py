@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from database import supabase
+from stream_store import StreamStore
+from utils.effort_profile import build_profile, PROFILE_VERSION
+
+class EffortProfileService:
+    """
+    路段 effort 的配速剖面 (segment_effort_profiles)。
+    Webhook 收到活動時先記錄每個 effort 的 stream 視窗 (start_index / end_index)，
+    streams 寫入後於 post-ingest 階段切片並存成小型陣列，頭對頭比較直接查表。
+    """
+
+    @staticmethod
+    def register_efforts(activity_id: int, efforts: List[Dict[str, Any]]) -> int:
+        """記錄 Strava segment effort 的 stream 視窗，剖面待 streams 可用時產生"""
+        rows = [
+            {
+                "effort_id": e["id"],
+                "activity_id": activity_id,
+                "segment_id": e.get("segment", {}).get("id"),
+                "athlete_id": e.get("athlete", {}).get("id"),
+                "start_index": e["start_index"],
+                "end_index": e["end_index"],
+                "elapsed_time": e.get("elapsed_time"),
+            }
+            for e in efforts
+            if e.get("start_index") is not None and e.get("end_index") is not None
+        ]
+        if rows:
+            supabase.table("segment_effort_profiles").upsert(rows).execute()
+        return len(rows)
+
+    @staticmethod
+    def build_for_activity(activity_id: int, streams: Any = None) -> int:
+        """為活動的所有 effort 產生剖面，streams 已解碼時直接傳入以免重複讀取"""
+        res = supabase.table("segment_effort_profiles").select("effort_id, start_index, end_index") \
+            .eq("activity_id", activity_id).execute()
+        windows = res.data or []
+        if not windows:
+            return 0
+
+        if streams is None:
+            streams = StreamStore.fetch_streams(activity_id)
+            if not streams:
+                return 0
+
+        computed_at = datetime.now(timezone.utc).isoformat()
+        updates = []
+        for w in windows:
+            profile = build_profile(streams, w["start_index"], w["end_index"])
+            if not profile:
+                print(f"[WARN] Effort {w['effort_id']} window could not be sliced, skipping profile")
+                continue
+            updates.append({
+                "effort_id": w["effort_id"],
+                "profile_version": PROFILE_VERSION,
+                "segment_distance": profile["distance"][-1],
+                "distance": profile["distance"],
+                "time": profile["time"],
+                "speed": profile["speed"],
+                "watts": profile["watts"],
+                "heartrate": profile["heartrate"],
+                "computed_at": computed_at,
+            })
+        for u in updates:
+            supabase.table("segment_effort_profiles").update(u).eq("effort_id", u["effort_id"]).execute()
+        return len(updates)
+
+    @staticmethod
+    def get_segment_profiles(segment_id: int, effort_ids: Optional[List[int]] = None, athlete_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        query = supabase.table("segment_effort_profiles").select(
+            "effort_id, athlete_id, activity_id, elapsed_time, segment_distance, distance, time, speed, watts, heartrate"
+        ).eq("segment_id", segment_id).eq("profile_version", PROFILE_VERSION)
+        if effort_ids:
+            query = query.in_("effort_id", effort_ids)
+        if athlete_ids:
+            query = query.in_("athlete_id", athlete_ids)
+        res = query.order("elapsed_time").execute()
+        return res.data or []
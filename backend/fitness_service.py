@@ -0,0 +1,170 @@
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Optional, Dict, Any, List
+import numpy as np
+from database import supabase
+from utils.fitness_model import propagate
+
+UPSERT_CHUNK = 500
+QUERY_PAGE = 1000
+
+# 同一選手的更新需依序進行，避免兩筆活動同時往後重算互相覆蓋
+_athlete_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+
+def activity_day(activity: Dict[str, Any]) -> Optional[date]:
+    """活動所屬的訓練日 (以當地時間為準)"""
+    value = activity.get("start_date_local") or activity.get("start_date")
+    if not value:
+        return None
+    return date.fromisoformat(str(value)[:10])
+
+class FitnessService:
+    """
+    選手每日 TSS 與 CTL/ATL/TSB 時間序列 (athlete_fitness_daily)。
+    新增或刪除活動時只從變動當天往後重算，圖表查詢即為單純的區間讀取。
+    """
+
+    @staticmethod
+    def _upsert_rows(athlete_id: int, start: date, tss: np.ndarray, ctl: np.ndarray, atl: np.ndarray, tsb: np.ndarray):
+        rows = [
+            {
+                "athlete_id": athlete_id,
+                "date": (start + timedelta(days=i)).isoformat(),
+                "tss": round(float(tss[i]), 1),
+                "ctl": round(float(ctl[i]), 2),
+                "atl": round(float(atl[i]), 2),
+                "tsb": round(float(tsb[i]), 2),
+            }
+            for i in range(len(tss))
+        ]
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            supabase.table("athlete_fitness_daily").upsert(rows[i:i + UPSERT_CHUNK]).execute()
+
+    @staticmethod
+    def apply_tss(athlete_id: int, day: date, delta: float):
+        """
+        將某天的 TSS 增減 delta，並往後重算至今天 (或已存在的最後一天)。
+        重算由 day 之前最後一筆紀錄的隔天開始：中間沒有紀錄的日子以 TSS=0 補上，
+        CTL/ATL 才會先衰減再套用當天的變動。
+        """
+        with _athlete_locks[athlete_id]:
+            seed_res = supabase.table("athlete_fitness_daily").select("date, ctl, atl") \
+                .eq("athlete_id", athlete_id).lt("date", day.isoformat()) \
+                .order("date", desc=True).limit(1).execute()
+            seed = seed_res.data[0] if seed_res.data else None
+            start = date.fromisoformat(seed["date"]) + timedelta(days=1) if seed else day
+            ctl0 = float(seed["ctl"]) if seed else 0.0
+            atl0 = float(seed["atl"]) if seed else 0.0
+
+            rows = []
+            offset = 0
+            while True:
+                rows_res = supabase.table("athlete_fitness_daily").select("date, tss") \
+                    .eq("athlete_id", athlete_id).gte("date", start.isoformat()) \
+                    .order("date").range(offset, offset + QUERY_PAGE).execute()
+                page = rows_res.data or []
+                rows.extend(page)
+                if len(page) < QUERY_PAGE:
+                    break
+                offset += QUERY_PAGE
+
+            end = date.today()
+            if rows:
+                end = max(end, date.fromisoformat(rows[-1]["date"]))
+            end = max(end, day)
+
+            tss = np.zeros((end - start).days + 1, dtype=np.float64)
+            for r in rows:
+                tss[(date.fromisoformat(r["date"]) - start).days] = float(r["tss"] or 0)
+            i = (day - start).days
+            tss[i] = max(0.0, tss[i] + delta)
+
+            ctl, atl, tsb = propagate(tss, ctl0, atl0)
+            FitnessService._upsert_rows(athlete_id, start, tss, ctl, atl, tsb)
+
+    @staticmethod
+    def add_activity(athlete_id: int, day: date, tss: float):
+        if tss:
+            FitnessService.apply_tss(athlete_id, day, tss)
+
+    @staticmethod
+    def remove_activity(athlete_id: int, day: date, tss: float):
+        if tss:
+            FitnessService.apply_tss(athlete_id, day, -tss)
+
+    @staticmethod
+    def get_series(athlete_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+        """
+        讀取區間內的每日 CTL/ATL/TSB。
+        最後一筆紀錄之後沒有訓練的日子，直接以 TSS=0 由最後狀態往後衰減。
+        """
+        res = supabase.table("athlete_fitness_daily").select("date, tss, ctl, atl, tsb") \
+            .eq("athlete_id", athlete_id).gte("date", start.isoformat()).lte("date", end.isoformat()) \
+            .order("date").execute()
+        series = res.data or []
+
+        last = series[-1] if series else None
+        if last is None:
+            prev_res = supabase.table("athlete_fitness_daily").select("date, tss, ctl, atl, tsb") \
+                .eq("athlete_id", athlete_id).lt("date", start.isoformat()) \
+                .order("date", desc=True).limit(1).execute()
+            last = prev_res.data[0] if prev_res.data else None
+
+        if last is None:
+            return series
+
+        last_day = date.fromisoformat(last["date"])
+        if last_day < end:
+            first = last_day + timedelta(days=1)
+            zeros = np.zeros((end - last_day).days, dtype=np.float64)
+            ctl, atl, tsb = propagate(zeros, float(last["ctl"]), float(last["atl"]))
+            for i in range(len(zeros)):
+                d = first + timedelta(days=i)
+                if d < start:
+                    continue
+                series.append({
+                    "date": d.isoformat(),
+                    "tss": 0,
+                    "ctl": round(float(ctl[i]), 2),
+                    "atl": round(float(atl[i]), 2),
+                    "tsb": round(float(tsb[i]), 2),
+                })
+        return series
+
+    @staticmethod
+    def rebuild_athlete(athlete_id: int) -> int:
+        """
+        由 activity_metrics 重建整條序列 (初次建置或資料修復用)。
+        日常更新請使用 add_activity / remove_activity。
+        """
+        daily: Dict[date, float] = defaultdict(float)
+        offset = 0
+        while True:
+            res = supabase.table("activity_metrics").select("tss, start_date, start_date_local") \
+                .eq("athlete_id", athlete_id).gt("tss", 0) \
+                .order("start_date").order("activity_id") \
+                .range(offset, offset + QUERY_PAGE).execute()
+            page = res.data or []
+            for row in page:
+                day = activity_day(row)
+                if day:
+                    daily[day] += float(row["tss"])
+            if len(page) < QUERY_PAGE:
+                break
+            offset += QUERY_PAGE
+
+        if not daily:
+            return 0
+
+        start = min(daily)
+        end = date.today()
+        tss = np.zeros((end - start).days + 1, dtype=np.float64)
+        for d, v in daily.items():
+            tss[(d - start).days] = v
+
+        with _athlete_locks[athlete_id]:
+            supabase.table("athlete_fitness_daily").delete().eq("athlete_id", athlete_id).execute()
+            ctl, atl, tsb = propagate(tss)
+            FitnessService._upsert_rows(athlete_id, start, tss, ctl, atl, tsb)
+        return len(daily)
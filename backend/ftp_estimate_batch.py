@@ -0,0 +1,97 @@
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from database import supabase
+from utils.power_curve import merge_curves, CURVE_VERSION
+from utils.power_metrics import DEFAULT_FTP
+from utils.ftp_estimator import estimate_ftp
+
+# 全隊 FTP 估計：只讀取 activity_power_curves 快取曲線，不重新讀取 strava_streams
+# 估計值與 athletes.ftp 差距超過 FLAG_THRESHOLD 時標記，供選手或教練確認後更新
+
+ESTIMATE_DAYS = 90
+FLAG_THRESHOLD = 0.08
+QUERY_CHUNK = 100
+QUERY_PAGE = 1000
+UPSERT_CHUNK = 200
+
+def _fetch_all(query) -> List[Dict[str, Any]]:
+    """PostgREST 單次回應上限 1000 筆，依已排序的 query 分頁讀完 (postgrest 的 range 結尾不含)"""
+    rows = []
+    offset = 0
+    while True:
+        res = query.range(offset, offset + QUERY_PAGE).execute()
+        page = res.data or []
+        rows.extend(page)
+        if len(page) < QUERY_PAGE:
+            return rows
+        offset += QUERY_PAGE
+
+def fetch_athletes() -> List[Dict[str, Any]]:
+    return _fetch_all(supabase.table("athletes").select("id, ftp").order("id"))
+
+def fetch_curves(athlete_ids: List[int], since: datetime) -> Dict[int, List[List[int]]]:
+    """一次讀取多位選手期間內的快取曲線"""
+    by_athlete: Dict[int, List[List[int]]] = defaultdict(list)
+    for i in range(0, len(athlete_ids), QUERY_CHUNK):
+        rows = _fetch_all(
+            supabase.table("activity_power_curves").select("athlete_id, mmp")
+            .in_("athlete_id", athlete_ids[i:i + QUERY_CHUNK])
+            .eq("curve_version", CURVE_VERSION)
+            .gte("start_date", since.isoformat())
+            .order("activity_id")
+        )
+        for r in rows:
+            by_athlete[r["athlete_id"]].append(r.get("mmp"))
+    return by_athlete
+
+def build_estimate(athlete: Dict[str, Any], curves: List[List[int]], threshold: float = FLAG_THRESHOLD) -> Optional[Dict[str, Any]]:
+    """合併選手曲線並估計 FTP，沒有可用功率資料時回傳 None"""
+    if not curves:
+        return None
+    estimate = estimate_ftp(merge_curves(curves).tolist())
+    if not estimate:
+        return None
+
+    stored = athlete.get("ftp") or DEFAULT_FTP
+    diff_pct = (estimate["ftp"] - stored) / stored
+    return {
+        "athlete_id": athlete["id"],
+        "stored_ftp": stored,
+        "estimated_ftp": estimate["ftp"],
+        "method": estimate["method"],
+        "p20": estimate["p20"],
+        "cp": estimate["cp"],
+        "w_prime": estimate["w_prime"],
+        "activity_count": len(curves),
+        "diff_pct": round(diff_pct * 100, 1),
+        "flagged": abs(diff_pct) > threshold,
+    }
+
+def run_batch(days: int = ESTIMATE_DAYS, threshold: float = FLAG_THRESHOLD) -> int:
+    """估計所有選手的 FTP 並寫入 ftp_estimates，回傳被標記的選手數"""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    athletes = fetch_athletes()
+    curves = fetch_curves([a["id"] for a in athletes], since)
+
+    estimated_at = datetime.now(timezone.utc).isoformat()
+    rows = []
+    for athlete in athletes:
+        row = build_estimate(athlete, curves.get(athlete["id"], []), threshold)
+        if row:
+            row.update({"window_days": days, "estimated_at": estimated_at})
+            rows.append(row)
+
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        supabase.table("ftp_estimates").upsert(rows[i:i + UPSERT_CHUNK]).execute()
+
+    flagged = [r for r in rows if r["flagged"]]
+    print(f"Estimated FTP for {len(rows)} athletes, {len(flagged)} flagged")
+    for r in flagged:
+        print(f"  athlete {r['athlete_id']}: stored {r['stored_ftp']}W, estimated {r['estimated_ftp']}W ({r['diff_pct']:+}%)")
+    return len(flagged)
+
+if __name__ == "__main__":
+    # 排程執行：python ftp_estimate_batch.py [天數]
+    run_batch(days=int(sys.argv[1]) if len(sys.argv) > 1 else ESTIMATE_DAYS)
@@ -6,8 +6,9 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import leaderboard, activities, auth, teams, webhooks, share
-from database import supabase
+from routers import leaderboard, activities, auth, teams, webhooks, share, analytics
+from database import supabase, close_async_db
+from utils import render_executor
 
 app = FastAPI()
 
@@ -47,6 +48,15 @@ app.include_router(auth.router)
 app.include_router(teams.router)
 app.include_router(webhooks.router)
 app.include_router(share.router)
+app.include_router(analytics.router)
+
+@app.on_event("shutdown")
+def shutdown_render_pool():
+    render_executor.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_async_db():
+    await close_async_db()
 
 @app.get("/")
 def read_root():
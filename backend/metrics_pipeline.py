@@ -0,0 +1,372 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+import numpy as np
+from database import supabase
+from fitness_service import FitnessService, activity_day
+from power_curve_service import PowerCurveService
+from stream_store import StreamStore
+from effort_profile_service import EffortProfileService
+from utils.streams import STREAM_COLUMNS, load_1hz_stream, load_streams
+from utils.power_curve import compute_mmp
+from utils.power_metrics import normalized_power, intensity_factor, training_stress_score, zone_seconds, DEFAULT_FTP
+from utils.hr_analytics import analyze_batch, zone_bounds_from_strava, DEFAULT_MAX_HR
+
+# 公式或欄位定義變更時遞增，recompute_stale() 會批次重算舊版本的紀錄
+# v2：心率指標 (hrTSS / 心率漂移 / decoupling)，無功率活動改以 hrTSS 計算 TSS
+METRICS_VERSION = 2
+
+HR_FIELDS = ("avg_heartrate", "hr_zone_seconds", "trimp", "hr_tss", "hr_drift", "decoupling")
+
+METRICS_WORKERS = int(os.getenv("METRICS_WORKERS", "2"))
+HR_BATCH_SIZE = 50
+
+_executor = ThreadPoolExecutor(max_workers=METRICS_WORKERS, thread_name_prefix="metrics")
+
+# 同一活動的處理需序列化：兩個 worker 同時讀到舊的 activity_metrics 會重複套用 TSS 差額。
+# _queued 為已排入但尚未開始的工作，重複 submit 直接併入；_locks 以引用計數管理，用完即移除
+_state_lock = threading.Lock()
+_queued: Dict[int, Future] = {}
+_locks: Dict[int, List[Any]] = {}
+
+@contextmanager
+def _activity_lock(activity_id: int):
+    with _state_lock:
+        entry = _locks.setdefault(activity_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _state_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _locks.pop(activity_id, None)
+
+def _log_failure(activity_id: int, future: Future):
+    error = future.exception()
+    if error:
+        print(f"[ERROR] Metrics for activity {activity_id} failed: {error}")
+
+def hr_inputs(streams: Any):
+    """取出心率分析所需的 (心率, 對齊的輸出)；輸出以功率優先，沒有功率時使用速度"""
+    hr = load_1hz_stream(streams, "heartrate")
+    output = load_1hz_stream(streams, "watts")
+    if len(output) == 0:
+        output = load_1hz_stream(streams, "velocity_smooth")
+    return hr, (output if len(output) == len(hr) else None)
+
+def apply_hr_metrics(metrics: Dict[str, Any], hr_result: Dict[str, Any]) -> Dict[str, Any]:
+    """寫入心率指標；沒有功率 (np 為空) 但有心率時以 hrTSS 作為 TSS"""
+    metrics.update({k: hr_result.get(k) for k in HR_FIELDS})
+    if not metrics.get("np") and hr_result.get("hr_tss") is not None:
+        metrics["tss"] = hr_result["hr_tss"]
+        metrics["tss_source"] = "hr"
+    return metrics
+
+def compute_activity_metrics(
+    streams: Any,
+    ftp: float,
+    max_hr: float,
+    moving_time: Optional[int] = None,
+    strava_zones: Any = None,
+    sex: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    由單一活動的 streams 計算所有衍生指標 (純計算，不存取資料庫)。
+    回傳的 mmp 另存於 activity_power_curves。
+    """
+    metrics: Dict[str, Any] = {
+        "ftp": ftp,
+        "max_heartrate": max_hr,
+        "duration": moving_time,
+        "avg_power": None,
+        "max_power": None,
+        "np": None,
+        "intensity_factor": None,
+        "tss": 0,
+        "tss_source": "power",
+        "zone_seconds": None,
+        "mmp": None,
+    }
+
+    watts = load_1hz_stream(streams, "watts")
+    if len(watts) > 0:
+        np_watts = normalized_power(watts)
+        duration = moving_time or len(watts)
+        metrics.update({
+            "duration": duration,
+            "avg_power": int(round(float(np.mean(watts)))),
+            "max_power": int(np.max(watts)),
+            "np": np_watts,
+            "intensity_factor": intensity_factor(np_watts, ftp),
+            "tss": training_stress_score(np_watts, ftp, duration),
+            "zone_seconds": zone_seconds(watts, ftp),
+            "mmp": compute_mmp(watts).tolist(),
+        })
+
+    hr, output = hr_inputs(streams)
+    hr_result = analyze_batch(
+        [hr], [max_hr],
+        zone_bounds=[zone_bounds_from_strava(strava_zones)],
+        output_streams=[output],
+        sexes=[sex],
+    )[0]
+    return apply_hr_metrics(metrics, hr_result)
+
+def _apply_fitness_delta(athlete_id: int, old: Optional[Dict[str, Any]], activity: Dict[str, Any], new_tss: float):
+    """體能序列：先扣除舊值再加上新值，兩者同一天時合併為一次重算"""
+    new_day = activity_day(activity)
+    old_day = activity_day(old) if old else None
+    old_tss = float(old.get("tss") or 0) if old else 0.0
+    if old_day and old_day == new_day:
+        if new_tss != old_tss:
+            FitnessService.apply_tss(athlete_id, new_day, new_tss - old_tss)
+    else:
+        if old_day:
+            FitnessService.remove_activity(athlete_id, old_day, old_tss)
+        if new_day:
+            FitnessService.add_activity(athlete_id, new_day, new_tss)
+
+class MetricsPipeline:
+    """
+    Post-ingest 階段：活動 streams 寫入 strava_streams 後，於背景 worker pool 計算
+    NP / IF / TSS / 功率區間 / 心率區間 / TRIMP / hrTSS / MMP 並寫入 activity_metrics，
+    報表讀取時只需查表。
+    """
+
+    @staticmethod
+    def submit(activity_id: int) -> Future:
+        """將活動排入背景 worker pool；同一活動已在佇列中尚未開始時併入該工作"""
+        with _state_lock:
+            queued = _queued.get(activity_id)
+            if queued is not None:
+                return queued
+            future = _executor.submit(MetricsPipeline._run_queued, activity_id)
+            _queued[activity_id] = future
+        future.add_done_callback(lambda f: _log_failure(activity_id, f))
+        return future
+
+    @staticmethod
+    def _run_queued(activity_id: int) -> Optional[Dict[str, Any]]:
+        # 開始執行即移出佇列，執行期間的新 submit 會另排一次，確保讀到最新資料
+        with _state_lock:
+            _queued.pop(activity_id, None)
+        return MetricsPipeline.process_activity(activity_id)
+
+    @staticmethod
+    def process_activity(activity_id: int) -> Optional[Dict[str, Any]]:
+        """計算並寫入單一活動的指標；讀取舊 TSS 到套用差額之間持有該活動的鎖"""
+        with _activity_lock(activity_id):
+            return MetricsPipeline._process_activity(activity_id)
+
+    @staticmethod
+    def _process_activity(activity_id: int) -> Optional[Dict[str, Any]]:
+        stream_row = StreamStore.fetch_row(activity_id, "ftp, max_heartrate, strava_zones")
+        if not stream_row:
+            print(f"[WARN] No streams for activity {activity_id}, skipping metrics")
+            return None
+        streams = load_streams(stream_row)
+
+        # 新寫入的 streams 順便編碼為 streams_bin，之後的讀取不必再解析 JSON
+        if not stream_row.get("streams_bin") and stream_row.get("streams"):
+            try:
+                StreamStore.compact(activity_id, stream_row["streams"])
+            except Exception as e:
+                print(f"[WARN] Compact streams for activity {activity_id} failed: {e}")
+
+        act_res = supabase.table("strava_activities").select(
+            "athlete_id, start_date, start_date_local, moving_time, distance, total_elevation_gain"
+        ).eq("id", activity_id).execute()
+        if not act_res.data:
+            print(f"[WARN] Activity {activity_id} not found in strava_activities, skipping metrics")
+            return None
+        activity = act_res.data[0]
+        athlete_id = activity["athlete_id"]
+
+        # FTP / 最大心率：活動當時的快照優先，其次為選手目前設定
+        ath_res = supabase.table("athletes").select("ftp, max_heartrate, sex").eq("id", athlete_id).execute()
+        athlete = ath_res.data[0] if ath_res.data else {}
+        ftp = stream_row.get("ftp") or athlete.get("ftp") or DEFAULT_FTP
+        max_hr = stream_row.get("max_heartrate") or athlete.get("max_heartrate") or DEFAULT_MAX_HR
+
+        metrics = compute_activity_metrics(
+            streams, ftp, max_hr, activity.get("moving_time"),
+            strava_zones=stream_row.get("strava_zones"), sex=athlete.get("sex"),
+        )
+        mmp = metrics.pop("mmp")
+
+        old_res = supabase.table("activity_metrics").select("tss, start_date_local, start_date").eq("activity_id", activity_id).execute()
+        old = old_res.data[0] if old_res.data else None
+
+        row = {
+            "activity_id": activity_id,
+            "athlete_id": athlete_id,
+            "start_date": activity.get("start_date"),
+            "start_date_local": activity.get("start_date_local"),
+            "distance": activity.get("distance"),
+            "elevation_gain": activity.get("total_elevation_gain"),
+            "metrics_version": METRICS_VERSION,
+            "computed_at": datetime.now(timezone.utc).isoformat(),
+            **metrics,
+        }
+        supabase.table("activity_metrics").upsert(row).execute()
+
+        if mmp:
+            PowerCurveService.save_curve(activity_id, athlete_id, activity.get("start_date"), mmp)
+
+        _apply_fitness_delta(athlete_id, old, activity, float(metrics["tss"] or 0))
+
+        # 路段 effort 配速剖面 (沿用已解碼的 streams)
+        EffortProfileService.build_for_activity(activity_id, streams)
+        return row
+
+    @staticmethod
+    def submit_effort_profiles(activity_id: int) -> Future:
+        """只產生路段 effort 剖面；streams 尚未寫入時不做任何事，待 post-ingest 再產生"""
+        future = _executor.submit(EffortProfileService.build_for_activity, activity_id)
+        future.add_done_callback(lambda f: _log_failure(activity_id, f))
+        return future
+
+    @staticmethod
+    def submit_removal(activity_id: int) -> Future:
+        future = _executor.submit(MetricsPipeline.remove_activity, activity_id)
+        future.add_done_callback(lambda f: _log_failure(activity_id, f))
+        return future
+
+    @staticmethod
+    def remove_activity(activity_id: int):
+        """活動刪除時扣除其 TSS，並移除衍生資料"""
+        with _activity_lock(activity_id):
+            MetricsPipeline._remove_activity(activity_id)
+
+    @staticmethod
+    def _remove_activity(activity_id: int):
+        res = supabase.table("activity_metrics").select("athlete_id, tss, start_date_local, start_date").eq("activity_id", activity_id).execute()
+        if res.data:
+            old = res.data[0]
+            day = activity_day(old)
+            if day:
+                FitnessService.remove_activity(old["athlete_id"], day, float(old.get("tss") or 0))
+        supabase.table("activity_metrics").delete().eq("activity_id", activity_id).execute()
+        supabase.table("activity_power_curves").delete().eq("activity_id", activity_id).execute()
+
+    @staticmethod
+    def find_stale(limit: int = 1000) -> List[int]:
+        """
+        需要重算的活動：
+        1. metrics_version 低於目前版本 (公式變更)
+        2. activity_metrics_backlog 檢視表：尚未計算，或 FTP / 最大心率已變更
+        """
+        ids = set()
+        res = supabase.table("activity_metrics").select("activity_id").lt("metrics_version", METRICS_VERSION).limit(limit).execute()
+        ids.update(r["activity_id"] for r in res.data or [])
+        res = supabase.table("activity_metrics_backlog").select("activity_id").limit(limit).execute()
+        ids.update(r["activity_id"] for r in res.data or [])
+        return sorted(ids)
+
+    @staticmethod
+    def recompute_stale(limit: int = 1000, wait: bool = False) -> int:
+        """批次重算過期的活動指標 (排入 worker pool)"""
+        ids = MetricsPipeline.find_stale(limit)
+        futures = [MetricsPipeline.submit(aid) for aid in ids]
+        if wait:
+            for f in futures:
+                f.exception()
+        return len(ids)
+
+    @staticmethod
+    def backfill_hr_metrics(batch_size: int = HR_BATCH_SIZE, limit: Optional[int] = None) -> int:
+        """
+        批次回補舊版本紀錄的心率指標，不重算功率與 MMP。
+        每批以 in_ 一次讀取 streams 與選手資料，並以單次 analyze_batch 計算整批活動。
+        """
+        total = 0
+        last_id = 0
+        while limit is None or total < limit:
+            size = batch_size if limit is None else min(batch_size, limit - total)
+            res = supabase.table("activity_metrics").select("activity_id") \
+                .lt("metrics_version", METRICS_VERSION).gt("activity_id", last_id) \
+                .order("activity_id").limit(size).execute()
+            ids = [r["activity_id"] for r in res.data or []]
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            # 與 process_activity 相同，讀取舊 TSS 到寫回之間持有各活動的鎖 (依 id 排序取得)
+            with ExitStack() as stack:
+                for activity_id in ids:
+                    stack.enter_context(_activity_lock(activity_id))
+                MetricsPipeline._backfill_hr_batch(ids)
+            total += len(ids)
+            print(f"Backfilled HR metrics for {total} activities")
+        return total
+
+    @staticmethod
+    def _backfill_hr_batch(ids: List[int]):
+        # 取得鎖後重新讀取，略過等待期間已由 worker 重算為新版本的活動
+        res = supabase.table("activity_metrics").select(
+            "activity_id, athlete_id, start_date, start_date_local, np, tss, max_heartrate"
+        ).in_("activity_id", ids).lt("metrics_version", METRICS_VERSION).order("activity_id").execute()
+        rows = res.data or []
+        if not rows:
+            return
+
+        ids = [r["activity_id"] for r in rows]
+        stream_res = supabase.table("strava_streams").select(f"activity_id, {STREAM_COLUMNS}, strava_zones") \
+            .in_("activity_id", ids).execute()
+        stream_rows = {s["activity_id"]: s for s in stream_res.data or []}
+        athlete_ids = list({r["athlete_id"] for r in rows})
+        ath_res = supabase.table("athletes").select("id, sex").in_("id", athlete_ids).execute()
+        sexes = {a["id"]: a.get("sex") for a in ath_res.data or []}
+
+        hr_streams, outputs, zones = [], [], []
+        for r in rows:
+            stream_row = stream_rows.get(r["activity_id"])
+            hr, output = hr_inputs(load_streams(stream_row)) if stream_row else (np.zeros(0), None)
+            hr_streams.append(hr)
+            outputs.append(output)
+            zones.append(zone_bounds_from_strava(stream_row.get("strava_zones")) if stream_row else None)
+
+        results = analyze_batch(
+            hr_streams,
+            [r.get("max_heartrate") or DEFAULT_MAX_HR for r in rows],
+            zone_bounds=zones,
+            output_streams=outputs,
+            sexes=[sexes.get(r["athlete_id"]) for r in rows],
+        )
+
+        updates = []
+        for r, hr_result in zip(rows, results):
+            update = apply_hr_metrics({
+                "activity_id": r["activity_id"],
+                "athlete_id": r["athlete_id"],
+                "np": r.get("np"),
+                "tss": r.get("tss"),
+                "tss_source": "power",
+                "metrics_version": METRICS_VERSION,
+            }, hr_result)
+            update.pop("np")
+            updates.append(update)
+            if update["tss_source"] == "hr":
+                _apply_fitness_delta(r["athlete_id"], r, r, float(update["tss"] or 0))
+        supabase.table("activity_metrics").upsert(updates).execute()
+
+    @staticmethod
+    def get_metrics(activity_id: int) -> Optional[Dict[str, Any]]:
+        res = supabase.table("activity_metrics").select("*").eq("activity_id", activity_id).execute()
+        return res.data[0] if res.data else None
+
+if __name__ == "__main__":
+    # 批次重算：python metrics_pipeline.py
+    # 只回補心率指標：python metrics_pipeline.py --hr
+    if "--hr" in sys.argv:
+        count = MetricsPipeline.backfill_hr_metrics()
+        print(f"Backfilled HR metrics for {count} activities")
+    else:
+        count = MetricsPipeline.recompute_stale(limit=5000, wait=True)
+        print(f"Recomputed metrics for {count} activities")
@@ -0,0 +1,23 @@
+-- 每個活動的平均最大功率 (MMP) 曲線快取
+-- mmp[i] 對應 utils/power_curve.py 中 MMP_DURATIONS[i] 秒的最佳平均功率 (W)，0 表示活動長度不足
+-- 以 SMALLINT[] 儲存，一條曲線約 64 bytes
+
+CREATE TABLE IF NOT EXISTS activity_power_curves (
+    activity_id BIGINT PRIMARY KEY,
+    athlete_id BIGINT NOT NULL,
+    start_date TIMESTAMP WITH TIME ZONE,
+    curve_version SMALLINT NOT NULL DEFAULT 1,
+    mmp SMALLINT[] NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_activity_power_curves_athlete_date
+    ON activity_power_curves(athlete_id, start_date DESC);
+
+ALTER TABLE activity_power_curves ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON activity_power_curves;
+CREATE POLICY "Service role full access" ON activity_power_curves FOR ALL TO service_role USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Public read access" ON activity_power_curves;
+CREATE POLICY "Public read access" ON activity_power_curves FOR SELECT TO anon, authenticated USING (true);
+
+COMMENT ON TABLE activity_power_curves IS 'Per-activity mean-maximal power curves; season/42-day curves are element-wise max over these rows.';
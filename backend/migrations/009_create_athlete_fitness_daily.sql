@@ -0,0 +1,21 @@
+-- 選手每日訓練負荷序列 (Performance Management Chart)
+-- 由 fitness_service.py 維護：新增/刪除活動時只從變動當天往後重算
+
+CREATE TABLE IF NOT EXISTS athlete_fitness_daily (
+    athlete_id BIGINT NOT NULL,
+    date DATE NOT NULL,
+    tss REAL NOT NULL DEFAULT 0,
+    ctl REAL NOT NULL DEFAULT 0,
+    atl REAL NOT NULL DEFAULT 0,
+    tsb REAL NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (athlete_id, date)
+);
+
+ALTER TABLE athlete_fitness_daily ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON athlete_fitness_daily;
+CREATE POLICY "Service role full access" ON athlete_fitness_daily FOR ALL TO service_role USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Public read access" ON athlete_fitness_daily;
+CREATE POLICY "Public read access" ON athlete_fitness_daily FOR SELECT TO anon, authenticated USING (true);
+
+COMMENT ON TABLE athlete_fitness_daily IS 'Daily TSS with incrementally maintained CTL/ATL/TSB per athlete.';
@@ -0,0 +1,47 @@
+-- 每個活動的衍生指標 (於 streams 寫入後由 metrics_pipeline.py 計算)
+-- MMP 曲線另存於 activity_power_curves (008)
+
+CREATE TABLE IF NOT EXISTS activity_metrics (
+    activity_id BIGINT PRIMARY KEY,
+    athlete_id BIGINT NOT NULL,
+    start_date TIMESTAMP WITH TIME ZONE,
+    start_date_local TIMESTAMP WITH TIME ZONE,
+    metrics_version SMALLINT NOT NULL DEFAULT 1,
+    ftp INTEGER,                 -- 計算時使用的 FTP
+    max_heartrate INTEGER,       -- 計算時使用的最大心率
+    duration INTEGER,            -- 秒 (moving_time 或功率資料長度)
+    distance REAL,
+    elevation_gain REAL,
+    avg_power INTEGER,
+    max_power INTEGER,
+    np INTEGER,
+    intensity_factor REAL,
+    tss REAL DEFAULT 0,
+    zone_seconds INTEGER[],      -- Z1 ~ Z7 秒數
+    avg_heartrate INTEGER,
+    hr_zone_seconds INTEGER[],   -- Z1 ~ Z5 秒數
+    trimp REAL,
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_activity_metrics_athlete_date ON activity_metrics(athlete_id, start_date DESC);
+CREATE INDEX IF NOT EXISTS idx_activity_metrics_version ON activity_metrics(metrics_version);
+
+ALTER TABLE activity_metrics ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON activity_metrics;
+CREATE POLICY "Service role full access" ON activity_metrics FOR ALL TO service_role USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Public read access" ON activity_metrics;
+CREATE POLICY "Public read access" ON activity_metrics FOR SELECT TO anon, authenticated USING (true);
+
+-- 待計算清單：已有 streams 但尚未計算，或計算時的 FTP / 最大心率與目前設定不同
+CREATE OR REPLACE VIEW activity_metrics_backlog AS
+SELECT s.activity_id
+FROM strava_streams s
+JOIN strava_activities a ON a.id = s.activity_id
+LEFT JOIN athletes ath ON ath.id = a.athlete_id
+LEFT JOIN activity_metrics m ON m.activity_id = s.activity_id
+WHERE m.activity_id IS NULL
+   OR m.ftp IS DISTINCT FROM COALESCE(s.ftp, ath.ftp, 200)
+   OR m.max_heartrate IS DISTINCT FROM COALESCE(s.max_heartrate, ath.max_heartrate, 190);
+
+COMMENT ON TABLE activity_metrics IS 'Per-activity power/HR metrics computed at ingest; metrics_version drives bulk recomputes.';
@@ -0,0 +1,12 @@
+-- strava_streams 精簡二進位格式 (TCUS，見 utils/stream_codec.py)
+-- 以 delta / zigzag / varint + zlib 編碼，長距離活動約為 JSON 的 1/10
+-- 現有前端仍直接讀取 streams (JSON)，待改用 /api/analytics/streams 後可執行
+-- `python stream_store.py --drop-json` 釋放 JSON 欄位空間
+
+ALTER TABLE public.strava_streams
+ADD COLUMN IF NOT EXISTS streams_bin BYTEA;
+
+-- 讓 bytea 不再被 TOAST 重複壓縮 (內容已經 zlib 壓縮)
+ALTER TABLE public.strava_streams ALTER COLUMN streams_bin SET STORAGE EXTERNAL;
+
+COMMENT ON COLUMN public.strava_streams.streams_bin IS 'Compact TCUS binary encoding of streams (typed arrays, delta/zigzag/varint, zlib)';
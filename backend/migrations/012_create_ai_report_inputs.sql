@@ -0,0 +1,20 @@
+-- 42 天 AI 訓練報告的輸入彙整 (由 power_report_batch.py 批次產生)
+
+-- 選手是否開啟 AI 報告 (需主動開啟)
+ALTER TABLE public.athletes
+ADD COLUMN IF NOT EXISTS ai_report_enabled BOOLEAN DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS ai_report_inputs (
+    athlete_id BIGINT NOT NULL,
+    period_end DATE NOT NULL,
+    payload JSONB NOT NULL,
+    generated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (athlete_id, period_end)
+);
+
+ALTER TABLE ai_report_inputs ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON ai_report_inputs;
+CREATE POLICY "Service role full access" ON ai_report_inputs FOR ALL TO service_role USING (true) WITH CHECK (true);
+
+COMMENT ON COLUMN public.athletes.ai_report_enabled IS 'Athlete opted in to the scheduled 42-day AI training report';
+COMMENT ON TABLE ai_report_inputs IS 'Per-athlete 42-day summary JSON (same shape as the n8n power-analysis node output).';
@@ -0,0 +1,10 @@
+-- 心率指標 (utils/hr_analytics.py)，metrics_version 2
+-- 無功率計的活動以 hrTSS 作為 TSS，tss_source 標示來源
+
+ALTER TABLE activity_metrics
+    ADD COLUMN IF NOT EXISTS hr_tss REAL,
+    ADD COLUMN IF NOT EXISTS hr_drift REAL,        -- 後半段平均心率相對前半段的變化 (%)
+    ADD COLUMN IF NOT EXISTS decoupling REAL,      -- Pa:Hr (功率或速度 / 心率) 前後半段效率下降 (%)
+    ADD COLUMN IF NOT EXISTS tss_source TEXT DEFAULT 'power';
+
+COMMENT ON COLUMN activity_metrics.tss_source IS 'power: TSS from NP/FTP; hr: TSS from hrTSS (no power data)';
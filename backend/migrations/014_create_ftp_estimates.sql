@@ -0,0 +1,24 @@
+-- 由快取 MMP 曲線估計的 FTP (由 ftp_estimate_batch.py 批次產生)，每位選手保留最新一筆
+
+CREATE TABLE IF NOT EXISTS ftp_estimates (
+    athlete_id BIGINT PRIMARY KEY,
+    stored_ftp INTEGER,          -- 估計時 athletes.ftp
+    estimated_ftp INTEGER NOT NULL,
+    method TEXT NOT NULL,        -- cp: 臨界功率擬合 (3 ~ 20 分鐘)；p20: 20 分鐘最佳功率 x 95%
+    p20 INTEGER,
+    cp REAL,
+    w_prime INTEGER,             -- 焦耳
+    activity_count INTEGER,
+    window_days INTEGER,
+    diff_pct REAL,               -- (估計 - 目前) / 目前 x 100
+    flagged BOOLEAN DEFAULT FALSE,
+    estimated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ftp_estimates_flagged ON ftp_estimates(flagged) WHERE flagged;
+
+ALTER TABLE ftp_estimates ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON ftp_estimates;
+CREATE POLICY "Service role full access" ON ftp_estimates FOR ALL TO service_role USING (true) WITH CHECK (true);
+
+COMMENT ON TABLE ftp_estimates IS 'Latest FTP estimate per athlete from cached power curves; flagged when far from athletes.ftp.';
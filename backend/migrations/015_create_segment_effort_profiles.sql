@@ -0,0 +1,31 @@
+-- 路段 effort 配速剖面 (effort_profile_service.py)
+-- webhook 記錄 stream 視窗，streams 寫入後切片並依路段距離降採樣為固定點數的陣列
+
+CREATE TABLE IF NOT EXISTS segment_effort_profiles (
+    effort_id BIGINT PRIMARY KEY,          -- segment_efforts_v2.id
+    activity_id BIGINT NOT NULL,
+    segment_id BIGINT,
+    athlete_id BIGINT,
+    start_index INTEGER NOT NULL,          -- Strava effort 在活動 streams 中的樣本索引
+    end_index INTEGER NOT NULL,
+    elapsed_time INTEGER,
+    profile_version SMALLINT,              -- NULL 表示尚未產生剖面
+    segment_distance REAL,
+    distance REAL[],                       -- 每個區間終點距起點的距離 (m)
+    time REAL[],                           -- 到達該點的經過秒數
+    speed REAL[],                          -- m/s
+    watts SMALLINT[],
+    heartrate SMALLINT[],
+    computed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_segment_effort_profiles_segment ON segment_effort_profiles(segment_id, elapsed_time);
+CREATE INDEX IF NOT EXISTS idx_segment_effort_profiles_activity ON segment_effort_profiles(activity_id);
+
+ALTER TABLE segment_effort_profiles ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON segment_effort_profiles;
+CREATE POLICY "Service role full access" ON segment_effort_profiles FOR ALL TO service_role USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Public read access" ON segment_effort_profiles;
+CREATE POLICY "Public read access" ON segment_effort_profiles FOR SELECT TO anon, authenticated USING (true);
+
+COMMENT ON TABLE segment_effort_profiles IS 'Per-effort pacing profile (time/speed/power/HR by % of segment distance) sliced from activity streams at ingest.';
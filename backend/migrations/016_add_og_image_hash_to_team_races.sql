@@ -0,0 +1,4 @@
+-- OG Image 內容雜湊 (utils/og_generator.og_image_key)，批次預先渲染時略過未變更的賽事
+ALTER TABLE team_races ADD COLUMN IF NOT EXISTS og_image_hash TEXT;
+
+COMMENT ON COLUMN team_races.og_image_hash IS 'Content hash of the generated OG image inputs; og_prerender.py skips races whose hash is unchanged.';
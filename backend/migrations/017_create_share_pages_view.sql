@@ -0,0 +1,33 @@
+-- 分享頁一次查詢取得賽事、路段與 segment_metadata (routers/share.py)
+-- 同一路段有多筆 team_races 時取 id 最小者；只存在於 team_races 的路段也列出
+
+CREATE OR REPLACE VIEW share_pages AS
+SELECT
+    s.id AS segment_id,
+    to_jsonb(tr.*) AS team_race,
+    to_jsonb(s.*) AS segment,
+    m.og_image AS metadata_og_image,
+    m.race_description
+FROM segments s
+LEFT JOIN LATERAL (
+    SELECT * FROM team_races t WHERE t.segment_id = s.id ORDER BY t.id LIMIT 1
+) tr ON true
+LEFT JOIN segment_metadata m ON m.segment_id = s.id
+UNION ALL
+(
+    SELECT DISTINCT ON (t.segment_id)
+        t.segment_id,
+        to_jsonb(t.*) AS team_race,
+        NULL::jsonb AS segment,
+        m.og_image AS metadata_og_image,
+        m.race_description
+    FROM team_races t
+    LEFT JOIN segment_metadata m ON m.segment_id = t.segment_id
+    WHERE NOT EXISTS (SELECT 1 FROM segments s WHERE s.id = t.segment_id)
+    -- DISTINCT ON 需搭配 ORDER BY 才能確定保留 id 最小的賽事
+    ORDER BY t.segment_id, t.id
+);
+
+GRANT SELECT ON share_pages TO anon, authenticated, service_role;
+
+COMMENT ON VIEW share_pages IS 'One row per shareable segment: team race (preferred), segment and metadata for OG share pages.';
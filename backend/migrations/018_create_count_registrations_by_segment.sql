@@ -0,0 +1,15 @@
+-- 賽事列表的報名人數：一次 GROUP BY 取得多個路段的報名數 (routers/teams.py get_team_races)
+
+CREATE OR REPLACE FUNCTION count_registrations_by_segment(segment_ids BIGINT[])
+RETURNS TABLE (segment_id BIGINT, participant_count BIGINT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT r.segment_id, COUNT(*)::BIGINT
+    FROM registrations r
+    WHERE r.segment_id = ANY(segment_ids)
+    GROUP BY r.segment_id;
+$$;
+
+GRANT EXECUTE ON FUNCTION count_registrations_by_segment(BIGINT[]) TO anon, authenticated, service_role;
+
+CREATE INDEX IF NOT EXISTS idx_registrations_segment_id ON registrations(segment_id);
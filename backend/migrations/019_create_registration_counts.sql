@@ -0,0 +1,103 @@
+-- 報名人數計數表：依 (segment_id, team) 維護報名數，由 registrations 觸發器即時更新
+-- 路段總數 = 同一 segment_id 各車隊加總 (未填車隊者 team = '')
+-- 定期以 repair_registration_counts() 重新計算修正漂移 (registration_counts.py)
+
+CREATE TABLE IF NOT EXISTS registration_counts (
+    segment_id BIGINT NOT NULL,
+    team TEXT NOT NULL DEFAULT '',
+    participant_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (segment_id, team)
+);
+
+ALTER TABLE registration_counts ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON registration_counts;
+CREATE POLICY "Service role full access" ON registration_counts FOR ALL TO service_role USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Public read access" ON registration_counts;
+CREATE POLICY "Public read access" ON registration_counts FOR SELECT TO anon, authenticated USING (true);
+
+CREATE OR REPLACE FUNCTION bump_registration_count(p_segment_id BIGINT, p_team TEXT, p_delta INTEGER)
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO registration_counts (segment_id, team, participant_count, updated_at)
+    VALUES (p_segment_id, COALESCE(p_team, ''), GREATEST(p_delta, 0), NOW())
+    ON CONFLICT (segment_id, team) DO UPDATE
+    SET participant_count = GREATEST(registration_counts.participant_count + p_delta, 0),
+        updated_at = NOW();
+$$;
+
+-- 只由下方 SECURITY DEFINER 觸發器呼叫，不開放 RPC (函式預設對 PUBLIC 開放 EXECUTE)
+REVOKE EXECUTE ON FUNCTION bump_registration_count(BIGINT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- SECURITY DEFINER：前端以 anon / authenticated 身分報名時也能更新計數表
+CREATE OR REPLACE FUNCTION registrations_count_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.segment_id IS NOT NULL THEN
+        PERFORM bump_registration_count(OLD.segment_id, OLD.team, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.segment_id IS NOT NULL THEN
+        PERFORM bump_registration_count(NEW.segment_id, NEW.team, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_registrations_count ON registrations;
+CREATE TRIGGER trg_registrations_count
+AFTER INSERT OR DELETE OR UPDATE OF segment_id, team ON registrations
+FOR EACH ROW EXECUTE FUNCTION registrations_count_trigger();
+
+-- 依 registrations 重新計算，回傳被修正的 (segment_id, team) 筆數
+CREATE OR REPLACE FUNCTION repair_registration_counts()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    fixed INTEGER := 0;
+    n INTEGER;
+BEGIN
+    CREATE TEMP TABLE _actual_counts ON COMMIT DROP AS
+    SELECT segment_id, COALESCE(team, '') AS team, COUNT(*)::INTEGER AS participant_count
+    FROM registrations
+    WHERE segment_id IS NOT NULL
+    GROUP BY segment_id, COALESCE(team, '');
+
+    INSERT INTO registration_counts (segment_id, team, participant_count, updated_at)
+    SELECT a.segment_id, a.team, a.participant_count, NOW()
+    FROM _actual_counts a
+    LEFT JOIN registration_counts c ON c.segment_id = a.segment_id AND c.team = a.team
+    WHERE c.participant_count IS DISTINCT FROM a.participant_count
+    ON CONFLICT (segment_id, team) DO UPDATE
+    SET participant_count = EXCLUDED.participant_count, updated_at = NOW();
+    GET DIAGNOSTICS n = ROW_COUNT;
+    fixed := fixed + n;
+
+    DELETE FROM registration_counts c
+    WHERE NOT EXISTS (
+        SELECT 1 FROM _actual_counts a WHERE a.segment_id = c.segment_id AND a.team = c.team
+    );
+    GET DIAGNOSTICS n = ROW_COUNT;
+    fixed := fixed + n;
+
+    RETURN fixed;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION repair_registration_counts() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION repair_registration_counts() TO service_role;
+
+-- 初次建立時以現有報名資料填入
+SELECT repair_registration_counts();
+
+-- 賽事列表改讀計數表後 018 的 GROUP BY 函式已無呼叫端 (保留其 registrations(segment_id) 索引)
+DROP FUNCTION IF EXISTS count_registrations_by_segment(BIGINT[]);
+
+COMMENT ON TABLE registration_counts IS 'Registration totals per segment and team, maintained by trigger on registrations.';
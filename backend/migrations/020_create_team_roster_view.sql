@@ -0,0 +1,33 @@
+-- 車隊成員名單：tcu_members + strava_member_bindings + athletes 一次查詢 (team_roster.py)
+-- 含生日等個資，只開放給 service_role
+
+CREATE OR REPLACE VIEW team_roster AS
+SELECT
+    m.team,
+    m.real_name,
+    m.nickname,
+    m.birthday,
+    m.self_introduction,
+    m.skills,
+    m.tcu_id,
+    m.member_type,
+    m.profile_photo,
+    b.strava_id,
+    COALESCE(a.profile_medium, a.profile) AS strava_avatar
+FROM tcu_members m
+-- 同一 email 可能有多筆綁定 (003 為 IF NOT EXISTS，先前已存在的表不一定有 UNIQUE)，只取最新一筆，避免成員重複出現
+LEFT JOIN LATERAL (
+    SELECT sb.strava_id
+    FROM strava_member_bindings sb
+    WHERE sb.tcu_member_email = m.email AND m.email IS NOT NULL
+    ORDER BY sb.updated_at DESC NULLS LAST, sb.bound_at DESC NULLS LAST, sb.id DESC
+    LIMIT 1
+) b ON true
+LEFT JOIN athletes a ON a.id::text = b.strava_id;
+
+REVOKE ALL ON team_roster FROM anon, authenticated;
+GRANT SELECT ON team_roster TO service_role;
+
+CREATE INDEX IF NOT EXISTS idx_tcu_members_team ON tcu_members(team);
+
+COMMENT ON VIEW team_roster IS 'Team members joined with Strava binding and avatar, for cached team roster pages.';
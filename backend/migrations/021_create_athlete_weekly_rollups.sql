@@ -0,0 +1,165 @@
+-- 選手每週活動彙總 (車隊作戰室 /api/teams/dashboard，team_dashboard.py)
+-- strava_activities 與 activity_metrics 的觸發器增量維護；rebuild_weekly_rollups() 依來源表重建修正漂移
+-- 週以星期一為起始，日期採活動當地時間
+
+CREATE TABLE IF NOT EXISTS athlete_weekly_rollups (
+    athlete_id BIGINT NOT NULL,
+    week_start DATE NOT NULL,
+    activities INTEGER NOT NULL DEFAULT 0,
+    moving_time INTEGER NOT NULL DEFAULT 0,      -- 秒
+    distance REAL NOT NULL DEFAULT 0,            -- 公尺
+    elevation_gain REAL NOT NULL DEFAULT 0,      -- 公尺
+    tss REAL NOT NULL DEFAULT 0,
+    last_activity_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (athlete_id, week_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_athlete_weekly_rollups_week ON athlete_weekly_rollups(week_start);
+
+ALTER TABLE athlete_weekly_rollups ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON athlete_weekly_rollups;
+CREATE POLICY "Service role full access" ON athlete_weekly_rollups FOR ALL TO service_role USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Public read access" ON athlete_weekly_rollups;
+CREATE POLICY "Public read access" ON athlete_weekly_rollups FOR SELECT TO anon, authenticated USING (true);
+
+CREATE OR REPLACE FUNCTION rollup_week(p_local TEXT, p_utc TIMESTAMP WITH TIME ZONE)
+RETURNS DATE
+LANGUAGE sql STABLE
+AS $$
+    SELECT date_trunc('week', COALESCE(LEFT(p_local, 10)::date, (p_utc AT TIME ZONE 'UTC')::date))::date;
+$$;
+
+CREATE OR REPLACE FUNCTION bump_weekly_rollup(
+    p_athlete_id BIGINT, p_week DATE, p_activities INTEGER, p_moving_time INTEGER,
+    p_distance REAL, p_elevation REAL, p_tss REAL, p_last_at TIMESTAMP WITH TIME ZONE
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO athlete_weekly_rollups AS r
+        (athlete_id, week_start, activities, moving_time, distance, elevation_gain, tss, last_activity_at, updated_at)
+    VALUES (p_athlete_id, p_week, GREATEST(p_activities, 0), GREATEST(p_moving_time, 0),
+            GREATEST(p_distance, 0), GREATEST(p_elevation, 0), GREATEST(p_tss, 0), p_last_at, NOW())
+    ON CONFLICT (athlete_id, week_start) DO UPDATE SET
+        activities = GREATEST(r.activities + p_activities, 0),
+        moving_time = GREATEST(r.moving_time + p_moving_time, 0),
+        distance = GREATEST(r.distance + p_distance, 0),
+        elevation_gain = GREATEST(r.elevation_gain + p_elevation, 0),
+        tss = GREATEST(r.tss + p_tss, 0),
+        last_activity_at = GREATEST(r.last_activity_at, p_last_at),
+        updated_at = NOW();
+$$;
+
+-- 只由下方 SECURITY DEFINER 觸發器呼叫，不開放 RPC
+REVOKE EXECUTE ON FUNCTION bump_weekly_rollup(BIGINT, DATE, INTEGER, INTEGER, REAL, REAL, REAL, TIMESTAMP WITH TIME ZONE) FROM PUBLIC, anon, authenticated;
+
+CREATE OR REPLACE FUNCTION strava_activities_rollup_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.start_date IS NOT NULL THEN
+        PERFORM bump_weekly_rollup(
+            OLD.athlete_id, rollup_week(OLD.start_date_local::text, OLD.start_date), -1,
+            -COALESCE(OLD.moving_time, 0), -COALESCE(OLD.distance, 0)::real,
+            -COALESCE(OLD.total_elevation_gain, 0)::real, 0, NULL
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.start_date IS NOT NULL THEN
+        PERFORM bump_weekly_rollup(
+            NEW.athlete_id, rollup_week(NEW.start_date_local::text, NEW.start_date), 1,
+            COALESCE(NEW.moving_time, 0), COALESCE(NEW.distance, 0)::real,
+            COALESCE(NEW.total_elevation_gain, 0)::real, 0, NEW.start_date
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_strava_activities_rollup ON strava_activities;
+CREATE TRIGGER trg_strava_activities_rollup
+AFTER INSERT OR DELETE OR UPDATE OF athlete_id, start_date, start_date_local, moving_time, distance, total_elevation_gain
+ON strava_activities
+FOR EACH ROW EXECUTE FUNCTION strava_activities_rollup_trigger();
+
+-- TSS 來自 activity_metrics (metrics_pipeline.py)，只累加 tss
+CREATE OR REPLACE FUNCTION activity_metrics_rollup_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.start_date IS NOT NULL AND COALESCE(OLD.tss, 0) <> 0 THEN
+        PERFORM bump_weekly_rollup(
+            OLD.athlete_id, rollup_week(OLD.start_date_local::text, OLD.start_date), 0, 0, 0, 0, -OLD.tss, NULL
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.start_date IS NOT NULL AND COALESCE(NEW.tss, 0) <> 0 THEN
+        PERFORM bump_weekly_rollup(
+            NEW.athlete_id, rollup_week(NEW.start_date_local::text, NEW.start_date), 0, 0, 0, 0, NEW.tss, NULL
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_activity_metrics_rollup ON activity_metrics;
+CREATE TRIGGER trg_activity_metrics_rollup
+AFTER INSERT OR DELETE OR UPDATE OF athlete_id, start_date, start_date_local, tss
+ON activity_metrics
+FOR EACH ROW EXECUTE FUNCTION activity_metrics_rollup_trigger();
+
+-- 依來源表重建 p_since 之後的週彙總，回傳寫入筆數
+CREATE OR REPLACE FUNCTION rebuild_weekly_rollups(p_since DATE DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    since_week DATE := date_trunc('week', COALESCE(p_since, '1970-01-01'::date))::date;
+    n INTEGER;
+BEGIN
+    DELETE FROM athlete_weekly_rollups WHERE week_start >= since_week;
+
+    INSERT INTO athlete_weekly_rollups
+        (athlete_id, week_start, activities, moving_time, distance, elevation_gain, tss, last_activity_at, updated_at)
+    SELECT
+        COALESCE(a.athlete_id, m.athlete_id),
+        COALESCE(a.week_start, m.week_start),
+        COALESCE(a.activities, 0), COALESCE(a.moving_time, 0), COALESCE(a.distance, 0),
+        COALESCE(a.elevation_gain, 0), COALESCE(m.tss, 0), a.last_activity_at, NOW()
+    FROM (
+        SELECT athlete_id, rollup_week(start_date_local::text, start_date) AS week_start,
+               COUNT(*)::INTEGER AS activities,
+               COALESCE(SUM(moving_time), 0)::INTEGER AS moving_time,
+               COALESCE(SUM(distance), 0)::REAL AS distance,
+               COALESCE(SUM(total_elevation_gain), 0)::REAL AS elevation_gain,
+               MAX(start_date) AS last_activity_at
+        FROM strava_activities
+        WHERE start_date IS NOT NULL AND rollup_week(start_date_local::text, start_date) >= since_week
+        GROUP BY 1, 2
+    ) a
+    FULL OUTER JOIN (
+        SELECT athlete_id, rollup_week(start_date_local::text, start_date) AS week_start,
+               COALESCE(SUM(tss), 0)::REAL AS tss
+        FROM activity_metrics
+        WHERE start_date IS NOT NULL AND rollup_week(start_date_local::text, start_date) >= since_week
+        GROUP BY 1, 2
+    ) m ON m.athlete_id = a.athlete_id AND m.week_start = a.week_start;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END;
+$$;
+
+-- 函式預設對 PUBLIC 開放 EXECUTE：重建只允許 service_role (POST /api/teams/dashboard/rebuild 或命令列)
+REVOKE EXECUTE ON FUNCTION rebuild_weekly_rollups(DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rebuild_weekly_rollups(DATE) TO service_role;
+
+SELECT rebuild_weekly_rollups(NULL);
+
+COMMENT ON TABLE athlete_weekly_rollups IS 'Weekly activity totals per athlete, maintained by triggers for the team war-room dashboard.';
@@ -0,0 +1,28 @@
+-- 車隊賽事團體成績 (team_race_scoring.py)
+-- team_races 新增計分規則；team_race_standings 為各隊成績，每筆新成績寫入時增量更新
+
+ALTER TABLE team_races
+    ADD COLUMN IF NOT EXISTS scoring_rule TEXT NOT NULL DEFAULT 'top_n',   -- top_n / average / points
+    ADD COLUMN IF NOT EXISTS scoring_top_n INTEGER DEFAULT 3,              -- 每隊計分人數 (points 為 NULL 時全部計分)
+    ADD COLUMN IF NOT EXISTS scoring_points INTEGER[];                     -- 名次積分表，NULL 使用預設
+
+CREATE TABLE IF NOT EXISTS team_race_standings (
+    race_id INTEGER NOT NULL REFERENCES team_races(id) ON DELETE CASCADE,
+    team TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    score REAL,                  -- top_n / average：秒數；points：積分
+    finishers INTEGER NOT NULL DEFAULT 0,
+    counted INTEGER NOT NULL DEFAULT 0,
+    complete BOOLEAN NOT NULL DEFAULT false,
+    riders JSONB,                -- [{ athlete_id, athlete_name, effort_id, elapsed_time, counted, points }]
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (race_id, team)
+);
+
+ALTER TABLE team_race_standings ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Service role full access" ON team_race_standings;
+CREATE POLICY "Service role full access" ON team_race_standings FOR ALL TO service_role USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Public read access" ON team_race_standings;
+CREATE POLICY "Public read access" ON team_race_standings FOR SELECT TO anon, authenticated USING (true);
+
+COMMENT ON TABLE team_race_standings IS 'Team standings per team race, recomputed incrementally as segment efforts arrive.';
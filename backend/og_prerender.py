@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from database import supabase
+from utils import render_executor
+from utils.og_generator import generate_race_og_renditions, og_image_key
+from utils.render_assets import preload
+from utils.render_cache import render_cache, CONTENT_TYPES
+from utils.share_card import render_share_card, share_card_inputs, share_card_key, share_page_data
+
+# 批次預先產生所有啟用中賽事的分享圖片，讓第一個分享的人不必等待渲染：
+# 1. team_races 的 OG Image (地圖底圖 JPEG 與 WebP 卡片 / 縮圖，上傳至 race-previews 並寫回 team_races.og_image)
+# 2. /api/share/image 的分享卡片 (PNG，寫入渲染快取)
+# 內容雜湊未變更者略過，其餘平行渲染後以 thread pool 上傳。
+# 命令列 (run_prerender) 使用自己的 process pool；由 API 觸發時 (run_prerender_shared)
+# 改送進 web 行程共用的 utils/render_executor，不另開 pool，也受其併發上限約束。
+
+OG_BUCKET = "race-previews"
+PRERENDER_WORKERS = int(os.getenv("PRERENDER_WORKERS", str(os.cpu_count() or 2)))
+UPLOAD_WORKERS = 8
+QUEUE_FULL_RETRIES = 5
+QUEUE_FULL_BACKOFF = 2.0   # 秒，每次重試加倍
+QUERY_CHUNK = 200
+
+def og_storage_path(race_id: int, key: str, name: str = "og.jpg") -> str:
+    # 路徑含內容雜湊：內容變更時 URL 跟著變，CDN 與社群平台不會拿到舊圖
+    # og.jpg 為主圖，其餘為 og_{key}_card.webp 等 App 內使用的版本
+    stem, ext = name.rsplit(".", 1)
+    suffix = "" if stem == "og" else f"_{stem}"
+    return f"races/{race_id}/og_{key}{suffix}.{ext}"
+
+def upload_og_image(race_id: int, key: str, files: Dict[str, bytes]) -> str:
+    """上傳 OG Image 各版本 (generate_race_og_renditions 的結果) 並寫回 team_races，回傳主圖公開 URL"""
+    bucket = supabase.storage.from_(OG_BUCKET)
+    for name, data in files.items():
+        ext = name.rsplit(".", 1)[1]
+        bucket.upload(
+            path=og_storage_path(race_id, key, name),
+            file=data,
+            file_options={"content-type": CONTENT_TYPES.get(ext, "application/octet-stream"), "x-upsert": "true"},
+        )
+
+    file_path = og_storage_path(race_id, key)
+    public_url = bucket.get_public_url(file_path)
+    # 有些版本的 get_public_url 回傳可能包含額外資訊，確保取得字串
+    if hasattr(public_url, "public_url"):  # 處理不同版本 SDK
+        public_url = public_url.public_url
+    elif isinstance(public_url, dict):
+        public_url = public_url.get("publicURL") or public_url.get("public_url")
+
+    supabase.table("team_races").update({"og_image": public_url, "og_image_hash": key}).eq("id", race_id).execute()
+    return public_url
+
+def _og_args(race: Dict[str, Any]) -> Tuple:
+    return (
+        race.get("name") or f"路段 {race.get('segment_id')}",
+        race.get("polyline"),
+        race.get("distance") or 0,
+        race.get("elevation_gain") or 0,
+    )
+
+def fetch_card_sources(segment_ids) -> Dict[str, Dict[str, Any]]:
+    """由 share_pages 取得各路段分享卡片的資料來源 (segment_id 字串 -> race_data)"""
+    ids = sorted(segment_ids)
+    sources = {}
+    for i in range(0, len(ids), QUERY_CHUNK):
+        res = supabase.table("share_pages").select("*").in_("segment_id", ids[i:i + QUERY_CHUNK]).execute()
+        for row in res.data or []:
+            data = share_page_data(row)
+            if data:
+                sources[str(row["segment_id"])] = data
+    return sources
+
+def collect_jobs(force: bool = False) -> List[Tuple[str, Any, str, Tuple]]:
+    """
+    列出需要渲染的工作：(種類, 對象 id, 內容雜湊, 渲染參數)
+    種類為 og (team_races OG Image) 或 card (分享卡片)
+    """
+    races = supabase.table("team_races").select("*").eq("is_active", True).execute().data or []
+    segments = supabase.table("segments").select("*").eq("is_active", True).execute().data or []
+
+    jobs = []
+    for race in races:
+        if not race.get("polyline"):
+            continue
+        args = _og_args(race)
+        key = og_image_key(*args)
+        if force or race.get("og_image_hash") != key or not race.get("og_image"):
+            jobs.append(("og", race["id"], key, args))
+
+    # 分享卡片與 /api/share/image 相同，經由 share_pages 解析 (同一路段取 id 最小的 team_races)
+    segment_ids = {s["id"] for s in segments} | {r["segment_id"] for r in races if r.get("segment_id")}
+    for segment_id, data in fetch_card_sources(segment_ids).items():
+        inputs = share_card_inputs(data)
+        key = share_card_key(inputs)
+        if force or render_cache.get(key, "png") is None:
+            jobs.append(("card", segment_id, key, (inputs,)))
+    return jobs
+
+def _render_job(job: Tuple[str, Any, str, Tuple]) -> Tuple[str, Any, str, Any]:
+    kind, target, key, args = job
+    data = generate_race_og_renditions(*args) if kind == "og" else render_share_card(*args)
+    return kind, target, key, data
+
+def _store(result: Tuple[str, Any, str, Any]) -> bool:
+    kind, target, key, data = result
+    if not data:
+        print(f"[ERROR] Pre-render {kind} for {target} produced no image")
+        return False
+    try:
+        if kind == "og":
+            upload_og_image(target, key, data)
+        else:
+            render_cache.put(key, "png", data)
+        return True
+    except Exception as e:
+        print(f"[ERROR] Store pre-rendered {kind} for {target} failed: {e}")
+        return False
+
+def run_prerender(force: bool = False, workers: int = PRERENDER_WORKERS) -> Dict[str, int]:
+    jobs = collect_jobs(force)
+    if not jobs:
+        print("All share images are up to date")
+        return {"rendered": 0, "stored": 0}
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=preload) as pool:
+        results = list(pool.map(_render_job, jobs))
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as uploader:
+        stored = sum(uploader.map(_store, results))
+
+    print(f"Pre-rendered {len(results)} share images, stored {stored}")
+    return {"rendered": len(results), "stored": stored}
+
+def _render_shared(job: Tuple[str, Any, str, Tuple]) -> Tuple[str, Any, str, Any]:
+    """經由共用 render_executor 渲染；佇列被線上請求占滿時退避重試，讓線上請求優先"""
+    kind, target, key, args = job
+    fn = generate_race_og_renditions if kind == "og" else render_share_card
+    delay = QUEUE_FULL_BACKOFF
+    for attempt in range(QUEUE_FULL_RETRIES + 1):
+        try:
+            return kind, target, key, render_executor.render_sync(fn, *args)
+        except render_executor.RenderQueueFull:
+            if attempt == QUEUE_FULL_RETRIES:
+                print(f"[WARN] Render queue full, skipping pre-render {kind} for {target}")
+                return kind, target, key, None
+            time.sleep(delay)
+            delay *= 2
+        except Exception as e:
+            print(f"[ERROR] Pre-render {kind} for {target} failed: {e}")
+            return kind, target, key, None
+
+def run_prerender_shared(force: bool = False) -> Dict[str, int]:
+    """
+    API 觸發用 (POST /api/share/prerender)：同時送出的工作數不超過 render pool 的 worker 數，
+    保留佇列空間給線上的 /api/share/image 請求
+    """
+    jobs = collect_jobs(force)
+    if not jobs:
+        print("All share images are up to date")
+        return {"rendered": 0, "stored": 0}
+
+    with ThreadPoolExecutor(max_workers=render_executor.RENDER_WORKERS) as renderer:
+        results = list(renderer.map(_render_shared, jobs))
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as uploader:
+        stored = sum(uploader.map(_store, results))
+
+    print(f"Pre-rendered {len(results)} share images, stored {stored}")
+    return {"rendered": len(results), "stored": stored}
+
+if __name__ == "__main__":
+    # 排程執行：python og_prerender.py [--force]
+    run_prerender(force="--force" in sys.argv)
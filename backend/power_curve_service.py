@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List
+from database import supabase
+from stream_store import StreamStore
+from utils.streams import load_1hz_stream
+from utils.power_curve import compute_mmp, merge_curves, curve_to_points, MMP_DURATIONS, CURVE_VERSION
+
+QUERY_PAGE = 1000
+
+class PowerCurveService:
+    """
+    每個活動的 MMP 曲線只從 strava_streams 計算一次並快取於 activity_power_curves，
+    賽季 / 42 天曲線一律由快取曲線逐元素取最大值而來，不重新讀取原始 streams。
+    """
+
+    @staticmethod
+    def compute_curve_from_streams(streams: Any) -> Optional[List[int]]:
+        watts = load_1hz_stream(streams, "watts")
+        if len(watts) == 0:
+            return None
+        return compute_mmp(watts).tolist()
+
+    @staticmethod
+    def save_curve(activity_id: int, athlete_id: int, start_date: Optional[str], curve: List[int]):
+        supabase.table("activity_power_curves").upsert({
+            "activity_id": activity_id,
+            "athlete_id": athlete_id,
+            "start_date": start_date,
+            "curve_version": CURVE_VERSION,
+            "mmp": curve,
+        }).execute()
+
+    @staticmethod
+    def compute_activity_curve(activity_id: int) -> Optional[List[int]]:
+        """從 strava_streams 計算單一活動曲線並寫入快取"""
+        streams = StreamStore.fetch_streams(activity_id)
+        if not streams:
+            return None
+
+        curve = PowerCurveService.compute_curve_from_streams(streams)
+        if curve is None:
+            return None
+
+        act_res = supabase.table("strava_activities").select("athlete_id, start_date").eq("id", activity_id).execute()
+        if not act_res.data:
+            print(f"[WARN] Activity {activity_id} not found in strava_activities, curve not cached")
+            return curve
+
+        activity = act_res.data[0]
+        PowerCurveService.save_curve(activity_id, activity["athlete_id"], activity.get("start_date"), curve)
+        return curve
+
+    @staticmethod
+    def get_activity_curve(activity_id: int) -> Optional[List[int]]:
+        """讀取快取曲線，快取不存在或版本過舊時才重新計算"""
+        res = supabase.table("activity_power_curves").select("mmp, curve_version").eq("activity_id", activity_id).execute()
+        if res.data and res.data[0].get("curve_version") == CURVE_VERSION:
+            return res.data[0]["mmp"]
+        return PowerCurveService.compute_activity_curve(activity_id)
+
+    @staticmethod
+    def get_athlete_curve(athlete_id: int, days: Optional[int] = 42, since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        合併選手於期間內所有快取曲線。
+        days=None 且未指定 since 時為全部歷史 (賽季曲線)。
+        """
+        query = supabase.table("activity_power_curves").select("activity_id, mmp") \
+            .eq("athlete_id", athlete_id) \
+            .eq("curve_version", CURVE_VERSION)
+
+        if since is None and days:
+            since = datetime.now(timezone.utc) - timedelta(days=days)
+        if since is not None:
+            query = query.gte("start_date", since.isoformat())
+
+        # PostgREST 單次回應上限 1000 筆：賽季曲線依 activity_id 分頁讀完 (postgrest 的 range 結尾不含)
+        query = query.order("activity_id")
+        rows = []
+        offset = 0
+        while True:
+            page = query.range(offset, offset + QUERY_PAGE).execute().data or []
+            rows.extend(page)
+            if len(page) < QUERY_PAGE:
+                break
+            offset += QUERY_PAGE
+        curve = merge_curves(r.get("mmp") for r in rows)
+
+        return {
+            "athlete_id": athlete_id,
+            "since": since.isoformat() if since else None,
+            "activity_count": len(rows),
+            "durations": list(MMP_DURATIONS),
+            "curve": curve.tolist(),
+            "points": curve_to_points(curve),
+        }
@@ -0,0 +1,198 @@
+import multiprocessing
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from database import supabase
+from utils.power_metrics import POWER_ZONES, DEFAULT_FTP
+from utils.hr_analytics import DEFAULT_MAX_HR
+
+# 42 天 AI 訓練報告的輸入彙整 (原 n8n-workflows/power-analysis-code-node.js)
+# 改為讀取 activity_metrics 快取，以 process pool 一次產生所有已開啟報告的選手
+
+REPORT_DAYS = 42
+QUERY_CHUNK = 100
+QUERY_PAGE = 1000
+UPSERT_CHUNK = 200
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", str(os.cpu_count() or 2)))
+
+def _round1(x: float) -> float:
+    return round(x * 10) / 10
+
+def build_report_input(athlete: Dict[str, Any], rows: List[Dict[str, Any]], today: date) -> Dict[str, Any]:
+    """
+    由單一選手 42 天內的 activity_metrics 產生與 n8n Code 節點相同結構的彙整 JSON。
+    純計算函式，於 process pool 中執行。
+    """
+    ftp = athlete.get("ftp") or DEFAULT_FTP
+    max_hr = athlete.get("max_heartrate") or DEFAULT_MAX_HR
+    name = f"{athlete.get('firstname') or ''} {athlete.get('lastname') or ''}".strip() or "選手"
+
+    activities = []
+    daily_tss: Dict[str, float] = defaultdict(float)
+    zone_totals = [0] * len(POWER_ZONES)
+    total_duration = 0
+    total_distance = 0.0
+
+    for r in sorted(rows, key=lambda x: x.get("start_date") or "", reverse=True):
+        if not r.get("np"):
+            continue  # 與 n8n 相同：沒有功率資料的活動不列入
+        date_key = str(r.get("start_date"))[:10]
+        tss = float(r.get("tss") or 0)
+        duration = int(r.get("duration") or 0)
+        distance = float(r.get("distance") or 0)
+
+        daily_tss[date_key] += tss
+        total_duration += duration
+        total_distance += distance
+        for i, sec in enumerate(r.get("zone_seconds") or []):
+            zone_totals[i] += sec
+
+        activities.append({
+            "id": r["activity_id"],
+            "date": date_key,
+            "name": r.get("name") or f"活動 {r['activity_id']}",
+            "duration": duration,
+            "distance": distance,
+            "np": r.get("np"),
+            "tss": tss,
+            "intensityFactor": r.get("intensity_factor") or 0,
+            "avgPower": r.get("avg_power"),
+            "maxPower": r.get("max_power"),
+        })
+
+    seven_days_ago = today - timedelta(days=7)
+    forty_two_days_ago = today - timedelta(days=REPORT_DAYS)
+
+    total_tss = sum(daily_tss.values())
+    weekly_tss = sum(v for d, v in daily_tss.items() if date.fromisoformat(d) >= seven_days_ago)
+
+    ctl = round(total_tss / REPORT_DAYS)
+    atl = round(weekly_tss / 7)
+
+    weekly_trend = []
+    for week in range(6):
+        week_start = forty_two_days_ago + timedelta(days=week * 7)
+        week_end = week_start + timedelta(days=7)
+        in_week = [a for a in activities if week_start <= date.fromisoformat(a["date"]) < week_end]
+        weekly_trend.append({
+            "week": week + 1,
+            "startDate": week_start.isoformat(),
+            "tss": round(sum(a["tss"] for a in in_week)),
+            "hours": _round1(sum(a["duration"] for a in in_week) / 3600),
+            "activities": len(in_week),
+        })
+
+    zone_total = sum(zone_totals)
+    zone_distribution = {
+        f"zone{z['zone']}": round(zone_totals[i] / zone_total * 100) if zone_total > 0 else 0
+        for i, z in enumerate(POWER_ZONES)
+    }
+
+    by_tss = max(activities, key=lambda a: a["tss"], default=None)
+    by_duration = max(activities, key=lambda a: a["duration"], default=None)
+    by_if = max(activities, key=lambda a: a["intensityFactor"], default=None)
+
+    return {
+        "athlete": {"name": name, "ftp": ftp, "maxHR": max_hr},
+        "period": {
+            "startDate": forty_two_days_ago.isoformat(),
+            "endDate": today.isoformat(),
+            "totalDays": REPORT_DAYS,
+        },
+        "summary": {
+            "totalActivities": len(activities),
+            "totalTSS": round(total_tss),
+            "avgDailyTSS": round(total_tss / REPORT_DAYS),
+            "ctl": ctl,
+            "atl": atl,
+            "tsb": ctl - atl,
+            "totalDuration": round(total_duration),
+            "totalDistance": round(total_distance / 1000),  # km
+        },
+        "weeklyTrend": weekly_trend,
+        "zoneDistribution": zone_distribution,
+        "highlights": {
+            "bestTSSDay": {"date": by_tss["date"], "tss": by_tss["tss"], "name": by_tss["name"]} if by_tss else None,
+            "longestRide": {"date": by_duration["date"], "duration": by_duration["duration"], "name": by_duration["name"]} if by_duration else None,
+            "highestIF": {"date": by_if["date"], "if": by_if["intensityFactor"], "name": by_if["name"]} if by_if else None,
+        },
+        "recentActivities": activities[:10],
+    }
+
+def _build_job(args):
+    athlete, rows, today = args
+    return athlete["id"], build_report_input(athlete, rows, today)
+
+def _fetch_all(query) -> List[Dict[str, Any]]:
+    """PostgREST 單次回應上限 1000 筆，依已排序的 query 分頁讀完"""
+    rows = []
+    offset = 0
+    while True:
+        res = query.range(offset, offset + QUERY_PAGE).execute()
+        page = res.data or []
+        rows.extend(page)
+        if len(page) < QUERY_PAGE:
+            return rows
+        offset += QUERY_PAGE
+
+def fetch_opted_in_athletes() -> List[Dict[str, Any]]:
+    return _fetch_all(
+        supabase.table("athletes").select("id, firstname, lastname, ftp, max_heartrate")
+        .eq("ai_report_enabled", True).order("id")
+    )
+
+def fetch_metrics(athlete_ids: List[int], since: datetime) -> Dict[int, List[Dict[str, Any]]]:
+    """一次讀取多位選手期間內的 activity_metrics，並補上活動名稱"""
+    by_athlete: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for i in range(0, len(athlete_ids), QUERY_CHUNK):
+        chunk = athlete_ids[i:i + QUERY_CHUNK]
+        rows = _fetch_all(
+            supabase.table("activity_metrics").select(
+                "activity_id, athlete_id, start_date, duration, distance, np, intensity_factor, tss, avg_power, max_power, zone_seconds"
+            ).in_("athlete_id", chunk).gte("start_date", since.isoformat()).order("activity_id")
+        )
+
+        activity_ids = [r["activity_id"] for r in rows]
+        names = {}
+        for j in range(0, len(activity_ids), QUERY_CHUNK):
+            name_res = supabase.table("strava_activities").select("id, name") \
+                .in_("id", activity_ids[j:j + QUERY_CHUNK]).execute()
+            names.update({a["id"]: a.get("name") for a in name_res.data or []})
+
+        for r in rows:
+            r["name"] = names.get(r["activity_id"])
+            by_athlete[r["athlete_id"]].append(r)
+    return by_athlete
+
+def run_batch(today: Optional[date] = None, workers: int = REPORT_WORKERS) -> int:
+    """產生所有已開啟 AI 報告選手的 42 天輸入並寫入 ai_report_inputs，回傳筆數"""
+    today = today or date.today()
+    since = datetime.combine(today - timedelta(days=REPORT_DAYS), datetime.min.time(), tzinfo=timezone.utc)
+
+    athletes = fetch_opted_in_athletes()
+    if not athletes:
+        print("No athletes opted in for AI reports")
+        return 0
+
+    metrics = fetch_metrics([a["id"] for a in athletes], since)
+    jobs = [(a, metrics.get(a["id"], []), today) for a in athletes]
+
+    # 使用 spawn：由 API 觸發時在 web 行程的 thread pool 中執行，fork 多執行緒且持有 HTTP client 的行程不安全
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = list(pool.map(_build_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+    generated_at = datetime.now(timezone.utc).isoformat()
+    rows = [
+        {"athlete_id": athlete_id, "period_end": today.isoformat(), "payload": payload, "generated_at": generated_at}
+        for athlete_id, payload in results
+    ]
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        supabase.table("ai_report_inputs").upsert(rows[i:i + UPSERT_CHUNK]).execute()
+
+    print(f"Generated {len(rows)} AI report inputs for {today.isoformat()}")
+    return len(rows)
+
+if __name__ == "__main__":
+    run_batch()
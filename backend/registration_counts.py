@@ -0,0 +1,44 @@
+from typing import Dict, Any, Iterable
+from database import supabase
+
+# 報名人數計數 (registration_counts，migrations/019 由觸發器維護)
+# 讀取為 O(路段數)，不再對 registrations 做 count="exact" 掃描
+
+QUERY_CHUNK = 200
+
+def get_counts(segment_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    批次讀取多個路段的報名人數。
+    回傳 { segment_id: { "total": n, "by_team": { team: n } } }，沒有報名的路段 total 為 0。
+    未填車隊的報名以 "" 為 key (與計數表 team = '' 相同)。
+    """
+    ids = sorted({int(s) for s in segment_ids if s is not None})
+    result: Dict[int, Dict[str, Any]] = {
+        sid: {"total": 0, "by_team": {}} for sid in ids
+    }
+    for i in range(0, len(ids), QUERY_CHUNK):
+        res = supabase.table("registration_counts").select("segment_id, team, participant_count") \
+            .in_("segment_id", ids[i:i + QUERY_CHUNK]).execute()
+        for row in res.data or []:
+            entry = result[row["segment_id"]]
+            entry["total"] += row["participant_count"]
+            if row["participant_count"]:
+                entry["by_team"][row["team"] or ""] = row["participant_count"]
+    return result
+
+def get_totals(segment_ids: Iterable[int]) -> Dict[int, int]:
+    """只取各路段報名總數"""
+    return {sid: c["total"] for sid, c in get_counts(segment_ids).items()}
+
+def repair() -> int:
+    """依 registrations 重新計算計數表，回傳修正筆數 (供排程定期執行)"""
+    res = supabase.rpc("repair_registration_counts", {}).execute()
+    fixed = res.data or 0
+    if fixed:
+        print(f"[WARN] Repaired {fixed} drifted registration counts")
+    else:
+        print("Registration counts are consistent")
+    return fixed
+
+if __name__ == "__main__":
+    repair()
@@ -1,6 +1,6 @@
 import httpx
 from fastapi import APIRouter, HTTPException
-from database import supabase
+from database import supabase, get_async_db
 
 router = APIRouter(prefix="/api/activities", tags=["activities"])
 
@@ -20,8 +20,9 @@ async def check_activity(activity_id: str):
     """
     檢查特定 activity 在本地 Supabase 與 Strava 遠端的狀態。
     """
+    db = get_async_db()
     # 1. 檢查 Supabase 是否有此筆紀錄
-    db_res = supabase.table("strava_activities").select("id, athlete_id, name, start_date").eq("id", activity_id).execute()
+    db_res = await db.table("strava_activities").select("id, athlete_id, name, start_date").eq("id", activity_id).execute()
     db_exists = len(db_res.data) > 0
     activity_data = db_res.data[0] if db_exists else None
 
@@ -32,7 +33,7 @@ async def check_activity(activity_id: str):
     if db_exists:
         # 2. 取得 Athlete 的 Access Token
         athlete_id = activity_data['athlete_id']
-        token_res = supabase.table("strava_tokens").select("access_token").eq("athlete_id", athlete_id).execute()
+        token_res = await db.table("strava_tokens").select("access_token").eq("athlete_id", athlete_id).execute()
         
         if len(token_res.data) > 0:
             access_token = token_res.data[0]['access_token']
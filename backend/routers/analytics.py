@@ -0,0 +1,211 @@
+from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, Depends
+from fastapi.responses import Response
+from typing import Optional
+from datetime import date, timedelta
+from power_curve_service import PowerCurveService
+from fitness_service import FitnessService
+from metrics_pipeline import MetricsPipeline
+from stream_store import StreamStore
+from effort_profile_service import EffortProfileService
+from power_report_batch import run_batch
+from ftp_estimate_batch import run_batch as run_ftp_estimates
+from database import supabase
+from admin_auth import require_admin
+from utils.stream_codec import encode_streams, decode_streams, decoded_to_json, from_pg_bytea, MEDIA_TYPE
+from utils.power_curve import MMP_DURATIONS, curve_to_points
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+@router.get("/power-curve/{athlete_id}")
+def get_athlete_power_curve(athlete_id: int, days: Optional[int] = 42):
+    """
+    取得選手的功率-時間曲線 (MMP)。
+    days: 期間天數，預設 42 天；傳入 0 代表全部歷史 (賽季曲線)。
+    """
+    try:
+        return PowerCurveService.get_athlete_curve(athlete_id, days=days or None)
+    except Exception as e:
+        print(f"[ERROR] Get power curve error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/activities/{activity_id}/power-curve")
+def get_activity_power_curve(activity_id: int):
+    """取得單一活動的 MMP 曲線 (快取不存在時從 strava_streams 計算一次)"""
+    try:
+        curve = PowerCurveService.get_activity_curve(activity_id)
+    except Exception as e:
+        print(f"[ERROR] Get activity power curve error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if curve is None:
+        raise HTTPException(status_code=404, detail="No power data for this activity")
+
+    return {
+        "activity_id": activity_id,
+        "durations": list(MMP_DURATIONS),
+        "curve": curve,
+        "points": curve_to_points(curve),
+    }
+
+@router.get("/fitness/{athlete_id}")
+def get_athlete_fitness(athlete_id: int, start: Optional[date] = None, end: Optional[date] = None):
+    """
+    取得選手每日 TSS 與 CTL/ATL/TSB (體能/疲勞/狀態)。
+    未指定區間時回傳最近 90 天。
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=89)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    try:
+        return {
+            "athlete_id": athlete_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "series": FitnessService.get_series(athlete_id, start, end),
+        }
+    except Exception as e:
+        print(f"[ERROR] Get fitness series error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/fitness/{athlete_id}/rebuild", dependencies=[Depends(require_admin)])
+def rebuild_athlete_fitness(athlete_id: int):
+    """由 activity_metrics 重建選手的體能序列 (初次建置或資料修復用，需 admin 或排程密鑰)"""
+    try:
+        days = FitnessService.rebuild_athlete(athlete_id)
+        return {"success": True, "training_days": days}
+    except Exception as e:
+        print(f"[ERROR] Rebuild fitness error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/activities/{activity_id}/metrics")
+def get_activity_metrics(activity_id: int):
+    """取得活動於 ingest 時計算好的指標 (NP / IF / TSS / 區間 / TRIMP)"""
+    try:
+        metrics = MetricsPipeline.get_metrics(activity_id)
+    except Exception as e:
+        print(f"[ERROR] Get activity metrics error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics not computed for this activity")
+    return metrics
+
+@router.post("/metrics/recompute", dependencies=[Depends(require_admin)])
+def recompute_metrics(limit: int = 1000):
+    """
+    批次重算過期指標 (公式版本更新、FTP 或最大心率變更；需 admin 或排程密鑰)。
+    計算於背景 worker pool 進行，此端點只回傳排入數量。
+    """
+    try:
+        queued = MetricsPipeline.recompute_stale(limit=limit)
+        return {"success": True, "queued": queued}
+    except Exception as e:
+        print(f"[ERROR] Recompute metrics error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/metrics/hr-backfill", dependencies=[Depends(require_admin)])
+def backfill_hr_metrics(background_tasks: BackgroundTasks, limit: Optional[int] = None):
+    """批次回補舊紀錄的心率指標 (hrTSS / 心率漂移 / decoupling，需 admin 或排程密鑰)，於背景執行"""
+    background_tasks.add_task(MetricsPipeline.backfill_hr_metrics, limit=limit)
+    return {"success": True, "message": "HR metrics backfill started"}
+
+@router.get("/streams/{activity_id}")
+def get_activity_streams(activity_id: int, request: Request, format: Optional[str] = None):
+    """
+    取得活動 streams。
+    format=binary 或 Accept: application/x-tcu-streams 時回傳 TCUS 二進位格式 (utils/stream_codec.py)，
+    其餘回傳 Strava 原始 JSON 陣列格式。
+    """
+    want_binary = format == "binary" or MEDIA_TYPE in request.headers.get("accept", "")
+
+    try:
+        row = StreamStore.fetch_row(activity_id)
+    except Exception as e:
+        print(f"[ERROR] Get streams error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Streams not found")
+
+    blob = from_pg_bytea(row.get("streams_bin"))
+    if want_binary:
+        if blob is None:
+            blob = encode_streams(row.get("streams"))
+        return Response(content=blob, media_type=MEDIA_TYPE, headers={"Cache-Control": "private, max-age=3600"})
+
+    if row.get("streams") is not None:
+        return row["streams"]
+    return decoded_to_json(decode_streams(blob)) if blob else []
+
+@router.post("/reports/42d/run", dependencies=[Depends(require_admin)])
+def run_ai_report_batch(background_tasks: BackgroundTasks):
+    """觸發 42 天 AI 報告輸入的批次產生 (供排程呼叫，需 admin 或排程密鑰，於背景執行)"""
+    background_tasks.add_task(run_batch)
+    return {"success": True, "message": "AI report batch started"}
+
+@router.get("/reports/42d/{athlete_id}")
+def get_ai_report_input(athlete_id: int):
+    """取得選手最新一次批次產生的 42 天報告輸入"""
+    try:
+        res = supabase.table("ai_report_inputs").select("period_end, payload, generated_at") \
+            .eq("athlete_id", athlete_id).order("period_end", desc=True).limit(1).execute()
+    except Exception as e:
+        print(f"[ERROR] Get AI report input error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not res.data:
+        raise HTTPException(status_code=404, detail="No report input generated for this athlete")
+    return res.data[0]
+
+@router.post("/ftp-estimates/run", dependencies=[Depends(require_admin)])
+def run_ftp_estimate_batch(background_tasks: BackgroundTasks, days: int = 90):
+    """觸發全隊 FTP 估計 (只讀取快取曲線，供排程呼叫，需 admin 或排程密鑰，於背景執行)"""
+    background_tasks.add_task(run_ftp_estimates, days=days)
+    return {"success": True, "message": "FTP estimate batch started"}
+
+@router.get("/ftp-estimates")
+def list_ftp_estimates(flagged: bool = False):
+    """列出 FTP 估計結果，flagged=true 時只列出與目前設定差距過大的選手"""
+    try:
+        query = supabase.table("ftp_estimates").select("*")
+        if flagged:
+            query = query.eq("flagged", True)
+        res = query.order("diff_pct", desc=True).execute()
+        return res.data or []
+    except Exception as e:
+        print(f"[ERROR] List FTP estimates error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ftp-estimates/{athlete_id}")
+def get_ftp_estimate(athlete_id: int):
+    try:
+        res = supabase.table("ftp_estimates").select("*").eq("athlete_id", athlete_id).execute()
+    except Exception as e:
+        print(f"[ERROR] Get FTP estimate error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not res.data:
+        raise HTTPException(status_code=404, detail="No FTP estimate for this athlete")
+    return res.data[0]
+
+@router.get("/segments/{segment_id}/pacing")
+def get_segment_pacing(segment_id: int, effort_ids: Optional[str] = None, athlete_ids: Optional[str] = None):
+    """
+    路段配速比較：回傳預先計算的 effort 剖面 (依路段距離對齊)。
+    effort_ids / athlete_ids 為逗號分隔，未指定時回傳該路段所有剖面 (依完成時間排序)。
+    """
+    try:
+        efforts = [int(x) for x in effort_ids.split(",") if x] if effort_ids else None
+        athletes = [int(x) for x in athlete_ids.split(",") if x] if athlete_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="effort_ids / athlete_ids must be comma-separated integers")
+
+    try:
+        profiles = EffortProfileService.get_segment_profiles(segment_id, efforts, athletes)
+    except Exception as e:
+        print(f"[ERROR] Get segment pacing error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"segment_id": segment_id, "efforts": profiles}
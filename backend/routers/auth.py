@@ -1,14 +1,18 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-import urllib.request
 import json
-import ssl
-from database import supabase
+import asyncio
+from database import supabase, get_async_db
+import team_auth
+from utils.data_loader import Loaders, get_loaders
+import team_roster
 from typing import Optional
 from datetime import datetime, timezone
 import os
 import requests
+import httpx
 from fastapi.responses import RedirectResponse, HTMLResponse
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -159,6 +163,7 @@ async def proxy_member_binding(request: Request):
     2. 檢查 strava_member_bindings 中是否已有綁定
     3. 若未綁定，代理請求至 n8n 發送 OTP
     """
+    db = get_async_db()
     try:
         body = await request.json()
         print(f"[DEBUG] Received body: {body}")
@@ -177,7 +182,7 @@ async def proxy_member_binding(request: Request):
 
         # --- 驗證會員存在性 (從 tcu_members) ---
         print(f"[DEBUG] Verifying member exists in tcu_members by email: {email}")
-        member_res = supabase.table("tcu_members").select("email, real_name, account").eq("email", email).execute()
+        member_res = await db.table("tcu_members").select("email, real_name, account").eq("email", email).execute()
         members = member_res.data
         print(f"[DEBUG] tcu_members query result: {len(members) if members else 0} members found")
         
@@ -192,7 +197,7 @@ async def proxy_member_binding(request: Request):
 
         # --- 檢查綁定狀態 (從 strava_member_bindings) ---
         print(f"[DEBUG] Checking strava_member_bindings for email: {email}")
-        binding_res = supabase.table("strava_member_bindings").select("*").eq("tcu_member_email", email).execute()
+        binding_res = await db.table("strava_member_bindings").select("*").eq("tcu_member_email", email).execute()
         bindings = binding_res.data
         print(f"[DEBUG] strava_member_bindings query result: {len(bindings) if bindings else 0} bindings found")
         
@@ -223,39 +228,35 @@ async def proxy_member_binding(request: Request):
         
         print(f"[DEBUG] Proxying request to n8n: {n8n_url}")
         
-        req = urllib.request.Request(
-            n8n_url,
-            data=json.dumps(body).encode('utf-8'),
-            headers={
-                'Content-Type': 'application/json',
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            },
-            method='POST'
-        )
-        
         try:
             # 設定 30 秒 timeout 以應對 n8n 處理較慢的情況
-            with urllib.request.urlopen(req, context=ssl._create_unverified_context(), timeout=30) as response:
-                status = response.getcode()
-                res_data = response.read().decode('utf-8')
-                print(f"[DEBUG] n8n response status: {status}, data: {res_data}")
-                
-                if not res_data.strip():
-                    return {"success": True, "message": "Webhook received with empty response"}
-                
-                try:
-                    # 嘗試解析 JSON
-                    parsed_res = json.loads(res_data)
-                    if isinstance(parsed_res, dict):
-                         return parsed_res
-                    return {"success": True, "message": "Webhook received", "data": parsed_res}
-                except json.JSONDecodeError:
-                    print(f"[DEBUG] n8n response is not JSON: {res_data}")
-                    return {"success": True, "message": "Webhook received", "raw_response": res_data}
-        except urllib.error.HTTPError as e:
-            error_content = e.read().decode('utf-8')
-            print(f"[DEBUG] n8n HTTP Error {e.code}: {error_content}")
-            return {"success": False, "message": f"n8n 服務回傳錯誤 ({e.code})"}
+            async with httpx.AsyncClient(verify=False, timeout=30) as client:
+                response = await client.post(
+                    n8n_url,
+                    json=body,
+                    headers={
+                        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+                    },
+                )
+            status = response.status_code
+            res_data = response.text
+            if status >= 400:
+                print(f"[DEBUG] n8n HTTP Error {status}: {res_data}")
+                return {"success": False, "message": f"n8n 服務回傳錯誤 ({status})"}
+            print(f"[DEBUG] n8n response status: {status}, data: {res_data}")
+            
+            if not res_data.strip():
+                return {"success": True, "message": "Webhook received with empty response"}
+            
+            try:
+                # 嘗試解析 JSON
+                parsed_res = json.loads(res_data)
+                if isinstance(parsed_res, dict):
+                     return parsed_res
+                return {"success": True, "message": "Webhook received", "data": parsed_res}
+            except json.JSONDecodeError:
+                print(f"[DEBUG] n8n response is not JSON: {res_data}")
+                return {"success": True, "message": "Webhook received", "raw_response": res_data}
         except Exception as e:
             print(f"[DEBUG] Proxy connection error: {str(e)}")
             return {"success": False, "message": f"與轉發服務連線失敗: {str(e)}"}
@@ -270,6 +271,7 @@ async def confirm_binding(request: Request):
     """
     OTP 驗證成功後，將綁定關係寫入 strava_member_bindings 表格。
     """
+    db = get_async_db()
     try:
         body = await request.json()
         email = body.get("email")
@@ -294,16 +296,19 @@ async def confirm_binding(request: Request):
         if user_id:
             data_to_save["user_id"] = user_id
             
-        res = supabase.table("strava_member_bindings").upsert(data_to_save, on_conflict="tcu_member_email").execute()
+        res = await db.table("strava_member_bindings").upsert(data_to_save, on_conflict="tcu_member_email").execute()
         
         # 取得完整會員資料以回傳給前端顯示 (優先使用 account)
         if tcu_account:
             print(f"[DEBUG] Fetching member for response by account: {tcu_account}")
-            member_res = supabase.table("tcu_members").select("*").eq("account", tcu_account).execute()
+            member_res = await db.table("tcu_members").select("*").eq("account", tcu_account).execute()
         else:
-            member_res = supabase.table("tcu_members").select("*").eq("email", email).execute()
+            member_res = await db.table("tcu_members").select("*").eq("email", email).execute()
             
         member_data = member_res.data[0] if member_res.data else {}
+        # 綁定改變了名單上的 strava_id 與頭像
+        team_roster.invalidate(member_data.get("team"))
+        team_auth.invalidate(strava_id)
         
         print(f"[DEBUG] Binding confirmed. Result: {res.data}")
         return {
@@ -326,6 +331,7 @@ async def unbind_member(request: Request):
     解除會員綁定（從 strava_member_bindings 刪除記錄）。
     增強安全驗證：使用 JWT Token 確認身份。
     """
+    db = get_async_db()
     try:
         # 1. 驗證 Authorization Header
         auth_header = request.headers.get("Authorization")
@@ -334,7 +340,7 @@ async def unbind_member(request: Request):
             
         token = auth_header.split(" ")[1]
         try:
-            user_response = supabase.auth.get_user(token)
+            user_response = await run_in_threadpool(supabase.auth.get_user, token)
             user = user_response.user
             if not user or not user.email:
                  raise HTTPException(status_code=401, detail="Invalid token or missing email")
@@ -358,7 +364,7 @@ async def unbind_member(request: Request):
         if not is_self:
             try:
                 # 查詢 manager_roles 表，確認該呼叫者是否具備 admin 權限
-                admin_check = supabase.table("manager_roles")\
+                admin_check = await db.table("manager_roles")\
                     .select("role, is_active")\
                     .eq("email", caller_email)\
                     .execute()
@@ -378,14 +384,17 @@ async def unbind_member(request: Request):
             return {"success": False, "message": "Permission denied"}
 
         # 3. 從 strava_member_bindings 刪除記錄
-        res = supabase.table("strava_member_bindings").delete().eq("tcu_member_email", email).execute()
+        res = await db.table("strava_member_bindings").delete().eq("tcu_member_email", target_email).execute()
 
         # 4. 清除 tcu_members 中的綁定資料
-        supabase.table("tcu_members").update({
+        member_res = await db.table("tcu_members").update({
             "strava_id": None,
             "otp_code": None,
             "otp_expires_at": None
-        }).eq("email", email).execute()
+        }).eq("email", target_email).execute()
+        team_roster.invalidate(member_res.data[0].get("team") if member_res.data else None)
+        for binding in res.data or []:
+            team_auth.invalidate(binding.get("strava_id"))
 
         return {"success": True, "message": "Unbound successfully"}
     except Exception as e:
@@ -395,9 +404,10 @@ async def unbind_member(request: Request):
 
 # ========== 檢查綁定狀態 API ==========
 @router.get("/binding-status/{strava_id}")
-async def get_binding_status(strava_id: str):
+async def get_binding_status(strava_id: str, loaders: Loaders = Depends(get_loaders)):
     """
     根據 Strava ID 查詢綁定狀態。
+    綁定與 strava_tokens 名稱同時查詢 (utils/data_loader.py)。
     """
     print(f"[DEBUG] Checking binding status for strava_id: {strava_id}")
     
@@ -406,45 +416,44 @@ async def get_binding_status(strava_id: str):
         "strava_name": None
     }
 
-    try:
-        res = supabase.table("strava_member_bindings").select("*").eq("strava_id", str(strava_id)).execute()
-        
-        if res.data and len(res.data) > 0:
-            binding = res.data[0]
-            email = binding.get("tcu_member_email")
-            tcu_account = binding.get("tcu_account")
-            print(f"[DEBUG] Binding found for {strava_id}: {binding.get('member_name')}")
+    async def load_token_name():
+        token = await loaders.get("strava_tokens", "athlete_id", "name").load(int(strava_id))
+        return token.get("name") if token else None
 
-            member_data = {}
-            try:
-                member_res = None
-                if tcu_account:
-                    member_res = supabase.table("tcu_members").select("*").eq("account", tcu_account).execute()
-                elif email:
-                    member_res = supabase.table("tcu_members").select("*").eq("email", email).execute()
-                
-                if member_res and member_res.data:
-                    member_data = member_res.data[0]
-            except Exception as e_member:
-                 print(f"[WARN] Failed to fetch member data: {e_member}")
-
-            result.update({
-                "isBound": True,
-                "email": email,
-                "tcu_account": tcu_account,
-                "member_name": binding.get("member_name"),
-                "bound_at": binding.get("bound_at"),
-                "member_data": member_data
-            })
+    binding, token_name = await asyncio.gather(
+        loaders.bindings_by_strava_id.load(str(strava_id)), load_token_name(), return_exceptions=True
+    )
 
-    except Exception as e:
-        print(f"[ERROR] Failed to query strava_member_bindings: {e}")
-    
-    try:
-        token_res = supabase.table("strava_tokens").select("name").eq("athlete_id", int(strava_id)).execute()
-        if token_res.data and len(token_res.data) > 0:
-            result["strava_name"] = token_res.data[0].get("name")
-    except Exception as e:
-        print(f"[WARN] Failed to fetch name from tokens: {e}")
+    if isinstance(binding, Exception):
+        print(f"[ERROR] Failed to query strava_member_bindings: {binding}")
+    elif binding:
+        email = binding.get("tcu_member_email")
+        tcu_account = binding.get("tcu_account")
+        print(f"[DEBUG] Binding found for {strava_id}: {binding.get('member_name')}")
+
+        member_data = {}
+        try:
+            member = None
+            if tcu_account:
+                member = await loaders.tcu_members_by_account.load(tcu_account)
+            elif email:
+                member = await loaders.tcu_members_by_email.load(email)
+            member_data = member or {}
+        except Exception as e_member:
+             print(f"[WARN] Failed to fetch member data: {e_member}")
+
+        result.update({
+            "isBound": True,
+            "email": email,
+            "tcu_account": tcu_account,
+            "member_name": binding.get("member_name"),
+            "bound_at": binding.get("bound_at"),
+            "member_data": member_data
+        })
+
+    if isinstance(token_name, Exception):
+        print(f"[WARN] Failed to fetch name from tokens: {token_name}")
+    elif token_name:
+        result["strava_name"] = token_name
 
     return result
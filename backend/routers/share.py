@@ -1,12 +1,28 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+import os
+import re
+from fastapi import APIRouter, HTTPException, Depends, Request, BackgroundTasks
 from fastapi.responses import HTMLResponse, Response
-from database import supabase
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from database import get_async_db
+from admin_auth import require_admin
+from og_prerender import run_prerender_shared
+from utils import render_executor, renditions
+from utils.render_cache import render_cache
+from utils.ttl_cache import TTLCache
+from utils.share_card import render_share_card, share_card_inputs, share_card_key, share_page_data
 
 router = APIRouter(
     prefix="/api/share",
     tags=["share"]
 )
 
+IMAGE_BASE_URL = "https://tcuapi.zeabur.app/api/share/image"
+
+# 帶有內容雜湊 (?v=) 的圖片 URL 內容永不改變，可長期快取；未帶版本的 URL 需定期重新驗證
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=3600"
+
 # NOTE: 社群平台爬蟲 User-Agent 列表，用於區分爬蟲與人類訪客
 BOT_USER_AGENTS = [
     'facebookexternalhit',  # Facebook 爬蟲
@@ -28,70 +44,50 @@ def _is_bot(user_agent: str) -> bool:
     ua_lower = user_agent.lower()
     return any(bot.lower() in ua_lower for bot in BOT_USER_AGENTS)
 
-@router.get("/race/{segment_id}", response_class=HTMLResponse)
-async def share_race(segment_id: str, request: Request):
-    """
-    Generate an HTML page with Open Graph tags for Facebook sharing.
-    爬蟲訪問時只回傳 OG 標籤（不重導），人類訪問時自動重導至前端頁面。
-    """
-    try:
-        # 1. Fetch race details from team_races (preferred)
-        race_res = supabase.table("team_races").select("*").eq("segment_id", segment_id).execute()
-        
-        race_data = None
-        if race_res.data and len(race_res.data) > 0:
-            race_data = race_res.data[0]
-        
-        # 2. If not found in team_races, fetch from segments (fallback)
-        if not race_data:
-            seg_res = supabase.table("segments").select("*").eq("id", segment_id).execute()
-            if seg_res.data and len(seg_res.data) > 0:
-                race_data = seg_res.data[0]
-                # Fetch metadata from extension table
-                meta_res = supabase.table("segment_metadata").select("og_image").eq("segment_id", segment_id).execute()
-                if meta_res.data and len(meta_res.data) > 0:
-                    race_data["og_image"] = meta_res.data[0].get("og_image")
-        
-        if not race_data:
-            raise HTTPException(status_code=404, detail="Race or Segment not found")
-
-        # 3. Construct OG Tag Content
-        # NOTE: OG 標題優先使用 description（賽事副標題），再回退至 name（Strava 路段原名）
-        title = race_data.get("description") or race_data.get("name", "Unknown Race")
-
-        # 從 segment_metadata 取得 race_description（挑戰內容長文）作為 OG 描述
-        meta_desc_res = supabase.table("segment_metadata").select("race_description").eq("segment_id", segment_id).execute()
-        race_description = ""
-        if meta_desc_res.data and len(meta_desc_res.data) > 0:
-            race_description = meta_desc_res.data[0].get("race_description", "") or ""
+# 分享頁 HTML 快取：key 為 (segment_id, is_bot)；賽事編輯時由 routers/teams.py 呼叫 invalidate_share_page()
+# 直接在 Supabase 後台修改 segments / segment_metadata 時最多過期 SHARE_PAGE_TTL 秒
+SHARE_PAGE_TTL = int(os.getenv("SHARE_PAGE_TTL", "300"))
+_share_page_cache = TTLCache(ttl=SHARE_PAGE_TTL, maxsize=2048)
 
-        # OG 描述：優先使用 race_description，再回退至距離/爬升摘要
-        if race_description.strip():
-            description = race_description.strip()
-        else:
-            distance_km = f"{float(race_data.get('distance', 0)) / 1000:.1f}km"
-            elevation = f"{race_data.get('total_elevation_gain', race_data.get('elevation_gain', 0))}m"
-            description = f"挑戰賽事：{title} | 距離：{distance_km} | 爬升：{elevation}"
-            
-        # Use automated image generation if no custom image is set
-        custom_image = race_data.get("og_image")
-        if custom_image and custom_image.startswith('http'):
-            image_url = custom_image
-        else:
-            # Automated generation URL (Add ?v=2 to bust FB cache)
-            import time
-            ts = int(time.time())
-            image_url = f"https://tcuapi.zeabur.app/api/share/image/{segment_id}?v={ts}"
-        
-        # Redirect URL (Frontend Dashboard)
-        redirect_url = f"https://strava.criterium.tw/dashboard?segment_id={segment_id}"
+def invalidate_share_page(segment_id):
+    """清除指定路段的分享頁快取 (爬蟲與人類兩種版本)"""
+    segment_id = str(segment_id)
+    _share_page_cache.invalidate_where(lambda key: key[0] == segment_id)
 
-        # NOTE: 偵測是否為社群爬蟲，爬蟲只需要 OG 標籤不需要重導
-        user_agent = request.headers.get("user-agent", "")
-        is_bot = _is_bot(user_agent)
-
-        # OG 標籤區塊（爬蟲和人類共用）
-        og_tags = f"""
+async def _resolve_share_page(segment_id: str) -> Optional[dict]:
+    """
+    以 share_pages view (migrations/017) 一次取得賽事、路段與 segment_metadata。
+    回傳與原本相同語意的 race_data (utils/share_card.share_page_data)。
+    """
+    res = await get_async_db().table("share_pages").select("*").eq("segment_id", segment_id).limit(1).execute()
+    return share_page_data(res.data[0]) if res.data else None
+
+def _render_share_page(segment_id: str, race_data: dict, is_bot: bool) -> str:
+    # NOTE: OG 標題優先使用 description（賽事副標題），再回退至 name（Strava 路段原名）
+    title = race_data.get("description") or race_data.get("name", "Unknown Race")
+
+    # OG 描述：優先使用 race_description（挑戰內容長文），再回退至距離/爬升摘要
+    race_description = race_data.get("race_description", "") or ""
+    if race_description.strip():
+        description = race_description.strip()
+    else:
+        distance_km = f"{float(race_data.get('distance', 0)) / 1000:.1f}km"
+        elevation = f"{race_data.get('total_elevation_gain', race_data.get('elevation_gain', 0))}m"
+        description = f"挑戰賽事：{title} | 距離：{distance_km} | 爬升：{elevation}"
+
+    # Use automated image generation if no custom image is set
+    custom_image = race_data.get("og_image")
+    if custom_image and custom_image.startswith('http'):
+        image_url = custom_image
+    else:
+        # 自動產生的圖片：URL 帶內容雜湊，內容不變時 URL 不變，爬蟲與 CDN 可以命中快取
+        image_url = f"{IMAGE_BASE_URL}/{segment_id}?v={share_card_key(share_card_inputs(race_data))}"
+
+    # Redirect URL (Frontend Dashboard)
+    redirect_url = f"https://strava.criterium.tw/dashboard?segment_id={segment_id}"
+
+    # OG 標籤區塊（爬蟲和人類共用）
+    og_tags = f"""
             <meta charset="utf-8">
             <title>{title}</title>
             
@@ -113,9 +109,9 @@ async def share_race(segment_id: str, request: Request):
             <meta property="twitter:image" content="{image_url}">
         """
 
-        if is_bot:
-            # 爬蟲版本：只有 OG 標籤，不含任何重導邏輯
-            html_content = f"""
+    if is_bot:
+        # 爬蟲版本：只有 OG 標籤，不含任何重導邏輯
+        return f"""
             <!DOCTYPE html>
             <html>
             <head>
@@ -128,9 +124,8 @@ async def share_race(segment_id: str, request: Request):
             </body>
             </html>
             """
-        else:
-            # 人類版本：OG 標籤 + JavaScript 重導至前端頁面
-            html_content = f"""
+    # 人類版本：OG 標籤 + JavaScript 重導至前端頁面
+    return f"""
             <!DOCTYPE html>
             <html>
             <head>
@@ -145,7 +140,26 @@ async def share_race(segment_id: str, request: Request):
             </body>
             </html>
             """
-        
+
+@router.get("/race/{segment_id}", response_class=HTMLResponse)
+async def share_race(segment_id: str, request: Request):
+    """
+    Generate an HTML page with Open Graph tags for Facebook sharing.
+    爬蟲訪問時只回傳 OG 標籤（不重導），人類訪問時自動重導至前端頁面。
+    賽事資料以單一查詢取得，產生的 HTML 依 (路段, 是否爬蟲) 快取。
+    """
+    try:
+        # NOTE: 偵測是否為社群爬蟲，爬蟲只需要 OG 標籤不需要重導
+        is_bot = _is_bot(request.headers.get("user-agent", ""))
+        cache_key = (segment_id, is_bot)
+        html_content = _share_page_cache.get(cache_key)
+        if html_content is None:
+            race_data = await _resolve_share_page(segment_id)
+            if not race_data:
+                raise HTTPException(status_code=404, detail="Race or Segment not found")
+            html_content = _render_share_page(segment_id, race_data, is_bot)
+            _share_page_cache.set(cache_key, html_content)
+
         return HTMLResponse(content=html_content)
 
     except Exception as e:
@@ -154,241 +168,83 @@ async def share_race(segment_id: str, request: Request):
         fail_safe_url = "https://strava.criterium.tw/dashboard"
         return HTMLResponse(content=f'<script>window.location.href="{fail_safe_url}";</script>', status_code=500)
 
-import polyline
-
-def find_polyline_in_data(data: dict) -> str:
-    """
-    Recursively find a polyline string in a dictionary.
-    Prioritizes 'polyline', 'summary_polyline', 'map.polyline'.
-    """
-    if not data:
-        return ""
-    
-    # Direct keys
-    if isinstance(data.get("polyline"), str) and len(data["polyline"]) > 5:
-        return data["polyline"]
-    if isinstance(data.get("summary_polyline"), str) and len(data["summary_polyline"]) > 5:
-        return data["summary_polyline"]
-    
-    # Map object
-    map_obj = data.get("map")
-    if isinstance(map_obj, dict):
-        if isinstance(map_obj.get("polyline"), str) and len(map_obj["polyline"]) > 5:
-            return map_obj["polyline"]
-        if isinstance(map_obj.get("summary_polyline"), str) and len(map_obj["summary_polyline"]) > 5:
-            return map_obj["summary_polyline"]
-    elif isinstance(map_obj, str) and len(map_obj) > 5:
-        return map_obj
-        
-    return ""
-
-from PIL import Image, ImageDraw, ImageFont
-import io
-import math
-
-def latlon_to_pixels(lat, lon, min_lat, max_lat, min_lon, max_lon, width, height, padding):
-    """Convert lat/lon to pixel coordinates using Mercator projection"""
-    # Convert all to radians for consistency
-    lat_rad = math.radians(lat)
-    lon_rad = math.radians(lon)
-    max_lat_rad = math.radians(max_lat)
-    min_lat_rad = math.radians(min_lat)
-    max_lon_rad = math.radians(max_lon)
-    min_lon_rad = math.radians(min_lon)
-    
-    # Mercator projection-like scaling
-    def y_merc(l): return math.log(math.tan(math.pi/4 + l/2))
-    
-    y = y_merc(lat_rad)
-    y_min = y_merc(min_lat_rad)
-    y_max = y_merc(max_lat_rad)
-    
-    # Use radians for X to match Y's scale
-    x = lon_rad
-    x_min = min_lon_rad
-    x_max = max_lon_rad
-    
-    # Scale to fit width/height
-    x_span = x_max - x_min
-    y_span = y_max - y_min
-    
-    if x_span == 0 or y_span == 0:
-        return width/2, height/2
-
-    available_w = width - 2*padding
-    available_h = height - 2*padding
-    
-    scale_x = available_w / x_span
-    scale_y = available_h / y_span
-    scale = min(scale_x, scale_y)
-    
-    # Center
-    drawn_w = x_span * scale
-    drawn_h = y_span * scale
-    offset_x = padding + (available_w - drawn_w) / 2
-    offset_y = padding + (available_h - drawn_h) / 2
-    
-    px = (x - x_min) * scale + offset_x
-    py = height - ((y - y_min) * scale + offset_y) # Invert Y for image coords
-    
-    return px, py
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return f'"{etag}"' in if_none_match or if_none_match.strip() == "*"
+
+def _image_response(content: Optional[bytes], etag: str, fmt: str, immutable: bool) -> Response:
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        # 格式依 Accept 決定，CDN 需分開快取
+        "Vary": "Accept",
+    }
+    if content is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=renditions.content_type(fmt), headers=headers)
+
+def _rendition_name(key: str, size: str) -> str:
+    # og 尺寸 PNG 即為主圖本身
+    return key if size == "og" else f"{key}-{size}"
+
+async def _render_rendition(key: str, inputs: dict, size: str, fmt: str) -> Optional[bytes]:
+    """先取得 (或渲染) 主圖，再衍生指定尺寸與格式；每個版本各自快取"""
+    master = await render_executor.render_cached(render_cache, key, "png", render_share_card, inputs)
+    if size == "og" and fmt == "png":
+        return master
+    return await render_executor.render_cached(
+        render_cache, _rendition_name(key, size), fmt, renditions.make_rendition, master, size, fmt
+    )
 
 @router.get("/image/{segment_id}")
-async def share_image(segment_id: str):
+async def share_image(segment_id: str, request: Request, v: Optional[str] = None, size: str = "og", format: Optional[str] = None):
     """
-    Dynamically generate a PNG image for Open Graph sharing.
-    Uses Pillow to draw text and polyline on a background.
+    Dynamically generate an image for Open Graph sharing.
+    渲染結果以內容雜湊快取 (utils/render_cache.py)，同一張圖只渲染一次；
+    支援 ETag / If-None-Match 條件式請求。渲染佇列已滿時回傳 503 + Retry-After。
+
+    size: og (1200x630) / card / thumb；format: webp / jpg / png，未指定時依 Accept 標頭決定
     """
-    # from fastapi.responses import Response # Moved to top-level
-    try:
-        # 1. Fetch Data
-        race_res = supabase.table("team_races").select("*").eq("segment_id", segment_id).execute()
-        race_data = race_res.data[0] if race_res.data else None
-        
-        if not race_data:
-            # Fallback to segments table
-            seg_res = supabase.table("segments").select("*").eq("id", segment_id).execute()
-            race_data = seg_res.data[0] if seg_res.data else None
+    if size not in renditions.SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(renditions.SIZES)}")
+    if v is not None and not re.fullmatch(r"[0-9a-f]{16}", v):
+        raise HTTPException(status_code=400, detail="Invalid image version")
+    fmt = renditions.normalize_format(format) or renditions.negotiate_format(request.headers.get("accept", ""))
 
+    try:
+        # 版本化 URL：v 即為內容雜湊，快取命中時不需查詢資料庫
+        if v:
+            etag = f"{_rendition_name(v, size)}.{fmt}"
+            if _etag_matches(request, etag):
+                return _image_response(None, etag, fmt, immutable=True)
+            cached = await run_in_threadpool(render_cache.get, _rendition_name(v, size), fmt)
+            if cached is not None:
+                return _image_response(cached, etag, fmt, immutable=True)
+
+        race_data = await _resolve_share_page(segment_id)
         if not race_data:
             raise Exception("Segment not found")
-            
-        # 2. Setup Image
-        W, H = 1200, 630
-        img = Image.new('RGB', (W, H), color='#0f172a')
-        draw = ImageDraw.Draw(img)
-        
-        # Background pattern (subtle lines)
-        for y in range(H):
-            r = int(30 - (y/H)*15)
-            g = int(41 - (y/H)*18)
-            b = int(59 - (y/H)*17)
-            draw.line([(0, y), (W, y)], fill=(r, g, b))
 
-        # 3. Load Fonts (Moved up)
-        try:
-            import os
-            current_dir = os.path.dirname(__file__)
-            # Path to bundled font: backend/assets/fonts/NotoSansTC-Bold.otf
-            # We are in backend/routers/, so go up one level then to assets/fonts
-            font_path = os.path.join(current_dir, "../assets/fonts/NotoSansTC-Bold.otf")
-            
-            print(f"DEBUG: Checking font path: {font_path}")
-            
-            if os.path.exists(font_path):
-                # Use bundled Noto Sans TC
-                try:
-                    print("DEBUG: Loading bundled font...")
-                    title_font = ImageFont.truetype(font_path, 60)
-                    stat_label_font = ImageFont.truetype(font_path, 24)
-                    stat_value_font = ImageFont.truetype(font_path, 48)
-                    stat_value_font_large = ImageFont.truetype(font_path, 64)
-                    footer_font = ImageFont.truetype(font_path, 20)
-                except Exception as ie:
-                    print(f"Failed to load bundled font: {ie}")
-                    raise ie
-            else:
-                print(f"DEBUG: Bundled font not found at {font_path}")
-                # Fallback to macOS system font for local dev
-                title_font = ImageFont.truetype("/System/Library/Fonts/HelveticaNeue.ttc", 60, index=1)
-                stat_label_font = ImageFont.truetype("/System/Library/Fonts/HelveticaNeue.ttc", 24)
-                stat_value_font = ImageFont.truetype("/System/Library/Fonts/HelveticaNeue.ttc", 48, index=1)
-                stat_value_font_large = ImageFont.truetype("/System/Library/Fonts/HelveticaNeue.ttc", 64, index=1)
-                footer_font = ImageFont.truetype("/System/Library/Fonts/HelveticaNeue.ttc", 20, index=1)
-        except Exception as e:
-            print(f"Font loading error: {e}, using default")
-            # Fallback to default
-            title_font = ImageFont.load_default()
-            stat_label_font = ImageFont.load_default()
-            stat_value_font = ImageFont.load_default()
-            stat_value_font_large = ImageFont.load_default()
-            footer_font = ImageFont.load_default()
+        inputs = share_card_inputs(race_data)
+        key = share_card_key(inputs)
+        etag = f"{_rendition_name(key, size)}.{fmt}"
+        if _etag_matches(request, etag):
+            return _image_response(None, etag, fmt, immutable=(v == key))
 
-        # 4. Draw Text & Logo (Background Layer)
-        try:
-            # Title
-            description = race_data.get("description")
-            name = race_data.get("name", "Unknown Race")
-            title_text = description if description and description.strip() else name
-            
-            # Center Title: X=W/2, anchor='mm' (middle-middle)
-            # Y=200 seems okay, maybe slightly lower if text is big? Keep 200.
-            draw.text((W/2, 200), title_text, font=title_font, fill="white", anchor="mm")
-
-            # Stats
-            dist = f"{float(race_data.get('distance', 0)) / 1000:.1f}km"
-            elev = f"{race_data.get('total_elevation_gain', race_data.get('elevation_gain', 0))}m"
-            grade = f"{race_data.get('average_grade', 0)}%"
-            
-            # Label Y=480 -> 510
-            # Value Y=530 -> 560
-            # Footer Bar starts at 580
-            
-            draw.text((300, 510), "DISTANCE", font=stat_label_font, fill="#94a3b8", anchor="md")
-            draw.text((300, 560), dist, font=stat_value_font_large, fill="white", anchor="md")
-            
-            draw.text((600, 510), "ELEVATION", font=stat_label_font, fill="#94a3b8", anchor="md")
-            draw.text((600, 560), elev, font=stat_value_font_large, fill="white", anchor="md")
-            
-            draw.text((900, 510), "AVG GRADE", font=stat_label_font, fill="#94a3b8", anchor="md")
-            draw.text((900, 560), grade, font=stat_value_font_large, fill="white", anchor="md")
-
-            # Footer
-            draw.rectangle([(0, 580), (W, 630)], fill="#38bdf8")
-            draw.text((600, 605), "JOIN THE CHALLENGE AT STRAVA.CRITERIUM.TW", font=footer_font, fill="#0f172a", anchor="mm")
-            
-            # Draw Logo (Top Left)
-            logo_path = os.path.join(current_dir, "../assets/images/logo.png")
-            if os.path.exists(logo_path):
-                try:
-                     logo_img = Image.open(logo_path).convert("RGBA")
-                     # Resize logo to width 100 or something reasonable
-                     # aspect ratio preserve
-                     logo_h = 80
-                     aspect = logo_img.width / logo_img.height
-                     logo_w = int(logo_h * aspect)
-                     logo_img = logo_img.resize((logo_w, logo_h), Image.Resampling.LANCZOS)
-                     
-                     # Paste at (40, 40)
-                     img.paste(logo_img, (40, 40), logo_img)
-                except Exception as e:
-                    print(f"Failed to load logo: {e}")
-
-        except UnicodeEncodeError:
-            print("Font encoding error, falling back to ASCII")
-            try:
-                draw.text((W/2, 200), "Race Info Available", font=ImageFont.load_default(), fill="white", anchor="mm")
-                draw.text((600, 605), "strava.criterium.tw", font=ImageFont.load_default(), fill="#0f172a", anchor="mm")
-            except Exception as e2:
-                 print(f"Fallback text drawing failed: {e2}")
-
-        # 5. Draw Polyline (Foreground Layer - On Top)
-        poly_str = find_polyline_in_data(race_data)
-        if poly_str:
-            points = polyline.decode(poly_str)
-            if points:
-                lats = [p[0] for p in points]
-                lons = [p[1] for p in points]
-                min_lat, max_lat = min(lats), max(lats)
-                min_lon, max_lon = min(lons), max(lons)
-                
-                pixels = []
-                for lat, lon in points:
-                    px, py = latlon_to_pixels(lat, lon, min_lat, max_lat, min_lon, max_lon, W, H, 50)
-                    pixels.append((px, py))
-                
-                if len(pixels) > 1:
-                    draw.line(pixels, fill="#fc4c02", width=10)
-
-        # Save to buffer
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-
-        return Response(content=img_byte_arr, media_type="image/png")
+        # Pillow 渲染於 process pool 執行，不阻塞 event loop
+        img_bytes = await _render_rendition(key, inputs, size, fmt)
+        return _image_response(img_bytes, etag, fmt, immutable=(v == key))
 
+    except render_executor.RenderQueueFull:
+        return Response(status_code=503, headers={"Retry-After": "5", "Cache-Control": "no-store"})
     except Exception as e:
         print(f"Error generating OG image: {e}")
         # Return a 1x1 transparent PNG as fallback
         fallback = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xb4\x00\x00\x00\x00IEND\xaeB`\x82'
-        return Response(content=fallback, media_type="image/png")
+        return Response(content=fallback, media_type="image/png", headers={"Cache-Control": "no-store"})
+
+@router.post("/prerender", dependencies=[Depends(require_admin)])
+def prerender_share_images(background_tasks: BackgroundTasks, force: bool = False):
+    """觸發批次預先渲染所有啟用中賽事的分享圖片 (供排程呼叫，需 admin 或排程密鑰，於背景執行)"""
+    background_tasks.add_task(run_prerender_shared, force=force)
+    return {"success": True, "message": "Share image pre-render started"}
@@ -1,49 +1,95 @@
 
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
-from database import supabase
-from datetime import datetime
-from utils.og_generator import generate_race_og_image
+from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, Depends
+from typing import Optional
+from database import get_async_db
+from datetime import date, datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+from utils import render_executor
+import registration_counts
+from admin_auth import require_admin
+import team_auth
+import team_dashboard
+from team_race_scoring import TeamRaceScoring
+from utils.team_scoring import SCORING_RULES
+from utils.race_time import parse_race_time
+import team_roster
+from og_prerender import upload_og_image
+from routers.share import invalidate_share_page
+from utils.og_generator import generate_race_og_renditions, og_image_key
+from utils.render_cache import render_cache
+from utils.share_card import render_share_card, share_card_inputs, share_card_key
 
 router = APIRouter(prefix="/api/teams", tags=["teams"])
 
 async def generate_and_upload_og_image_task(race_id: int, name: str, polyline_str: str, distance: float, elevation: float):
     """
-    背景任務：產生 OG Image 並上傳至 Supabase Storage
+    背景任務：產生 OG Image 並上傳至 Supabase Storage，同時預先渲染分享卡片。
+    內容雜湊與 team_races.og_image_hash 相同時略過 (例如只修改日期)。
     """
     if not polyline_str:
         print(f"[WARN] No polyline for race {race_id}, skipping OG generation")
         return
+
+    race_res = await get_async_db().table("team_races").select("*").eq("id", race_id).execute()
+    race = race_res.data[0] if race_res.data else {}
+
+    # 分享卡片 (/api/share/image)：第一個分享的人不必等待渲染
+    try:
+        inputs = share_card_inputs(race)
+        await render_executor.render_cached(render_cache, share_card_key(inputs), "png", render_share_card, inputs)
+    except Exception as e:
+        print(f"[WARN] Share card pre-render for race {race_id} failed: {e}")
+
+    key = og_image_key(name, polyline_str, distance, elevation)
+    if race.get("og_image_hash") == key and race.get("og_image"):
+        print(f"[INFO] OG image for race {race_id} unchanged, skipping")
+        return
     
-    # 1. 產生圖片
-    img_data = generate_race_og_image(name, polyline_str, distance, elevation)
-    if not img_data:
+    # 1. 產生圖片 (於 render process pool 執行，不阻塞 event loop)
+    try:
+        img_files = await render_executor.render(generate_race_og_renditions, name, polyline_str, distance, elevation)
+    except (render_executor.RenderQueueFull, render_executor.RenderTimeout) as e:
+        print(f"[ERROR] OG image render for race {race_id} not completed: {e}")
+        return
+    if not img_files:
         print(f"[ERROR] Failed to generate OG image for race {race_id}")
         return
         
-    # 2. 上傳至 Supabase Storage (Bucket: race-previews)
-    file_path = f"races/{race_id}/og_image.jpg"
+    # 2. 上傳至 Supabase Storage (Bucket: race-previews) 並更新資料庫
+    # Storage SDK 為同步呼叫，放到 thread pool 執行
     try:
-        # 使用 upsert=True
-        bucket = supabase.storage.from_("race-previews")
-        bucket.upload(path=file_path, file=img_data, file_options={"content-type": "image/jpeg", "x-upsert": "true"})
-        
-        # 3. 取得公用連結
-        public_url = bucket.get_public_url(file_path)
-        # 有些版本的 get_public_url 回傳可能包含額外資訊，確保取得字串
-        if isinstance(public_url, str):
-            pass
-        elif hasattr(public_url, "public_url"): # 處理不同版本 SDK
-            public_url = public_url.public_url
-        elif isinstance(public_url, dict):
-            public_url = public_url.get("publicURL") or public_url.get("public_url")
-            
-        # 4. 更新資料庫
-        supabase.table("team_races").update({"og_image": public_url}).eq("id", race_id).execute()
-        
+        public_url = await run_in_threadpool(upload_og_image, race_id, key, img_files)
+        if race.get("segment_id"):
+            invalidate_share_page(race["segment_id"])
         print(f"[INFO] OG Image generated and uploaded for race {race_id}: {public_url}")
     except Exception as e:
         print(f"[ERROR] Upload OG image error for race {race_id}: {str(e)}")
 
+async def _require_team_manager(strava_id: str, team_name: str, action: str):
+    """驗證 strava_id 為該車隊的隊長或管理員，否則拋出 403"""
+    context = await run_in_threadpool(team_auth.get_context, strava_id)
+    if not context["is_bound"]:
+        raise HTTPException(status_code=403, detail="未綁定 Strava 帳號")
+    if not context["member"]:
+        raise HTTPException(status_code=403, detail="找不到 TCU 成員資料")
+    if context["team"] != team_name:
+        raise HTTPException(status_code=403, detail="您不屬於此車隊")
+    if not context["can_manage"]:
+        raise HTTPException(status_code=403, detail=f"只有隊長或管理員可以{action}賽事")
+    return context
+
+def _validate_scoring(body: dict):
+    """計分人數須為 >= 1 的整數、積分表須為非負整數陣列 (皆可為 null 使用預設)，否則拋出 400"""
+    top_n = body.get("scoring_top_n")
+    if top_n is not None and (isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1):
+        raise HTTPException(status_code=400, detail="scoring_top_n 必須為大於等於 1 的整數")
+    points = body.get("scoring_points")
+    if points is not None and (
+        not isinstance(points, list) or not points
+        or any(isinstance(p, bool) or not isinstance(p, int) or p < 0 for p in points)
+    ):
+        raise HTTPException(status_code=400, detail="scoring_points 必須為非負整數陣列")
+
 @router.get("/my-team")
 async def get_my_team(strava_id: str):
     """
@@ -51,39 +97,16 @@ async def get_my_team(strava_id: str):
     從 strava_member_bindings 取得 tcu_account，再從 tcu_members 取得 team 資訊。
     """
     try:
-        # 1. 從 strava_member_bindings 取得綁定資訊
-        binding_res = supabase.table("strava_member_bindings").select("*").eq("strava_id", strava_id).execute()
-        if not binding_res.data:
+        # 1. 綁定與 tcu_members 成員資料 (team_auth.py 快取)
+        context = await run_in_threadpool(team_auth.get_context, strava_id)
+        if not context["is_bound"]:
             return {"has_team": False, "message": "User not bound"}
-            
-        binding = binding_res.data[0]
-        email = binding.get("tcu_member_email")
-        tcu_account = binding.get("tcu_account")
-        member_name_from_binding = binding.get("member_name")
-        
-        # 2. 嘗試從 tcu_members 取得成員資料 (包含 Team)
-        member = None
-        team_name = None
-        member_name = member_name_from_binding  # 預設使用 strava_member_bindings 的 member_name
-        member_type = "隊員"  # 預設為隊員
-        
-        if tcu_account:
-            member_res = supabase.table("tcu_members").select("team, real_name, member_type").eq("account", tcu_account).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        if not member and email:
-            member_res = supabase.table("tcu_members").select("team, real_name, member_type").eq("email", email).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        # 3. 如果找到 tcu_members 資料，使用它；否則 fallback
-        if member:
-            team_name = member.get("team")
-            member_name = member.get("real_name") or member_name_from_binding
-            member_type = member.get("member_type") or "隊員"
-        
-        # 4. 如果沒有車隊資訊，回傳無車隊但保留成員資訊
+
+        team_name = context["team"]
+        member_name = context["member_name"]
+        member_type = context["member_type"] or "隊員"  # 預設為隊員
+        
+        # 2. 如果沒有車隊資訊，回傳無車隊但保留成員資訊
         if not team_name:
             return {
                 "has_team": False, 
@@ -92,8 +115,8 @@ async def get_my_team(strava_id: str):
                 "is_bound": True
             }
 
-        # 5. 判斷是否為管理員（根據 member_type 判斷）
-        is_admin = member_type in ["付費車隊管理員", "隊長", "管理員"] if member_type else False
+        # 3. 判斷是否為管理員（根據 member_type 判斷）
+        is_admin = context["is_admin"]
 
         return {
             "has_team": True,
@@ -119,86 +142,43 @@ async def get_team_members(team_name: str):
     取得車隊成員列表 (含詳細資料)
     strava_id 從 strava_member_bindings 取得
     排序：付費車隊管理員 > 隊長 > 隊員
+    名單以單一查詢組成並快取於記憶體 (team_roster.py)，會員匯入或綁定變更時失效
     """
     try:
-        # 1. 從 tcu_members 撈取該車隊的所有成員 (包含 skills)
-        member_res = supabase.table("tcu_members").select(
-            "real_name, nickname, birthday, self_introduction, skills, tcu_id, member_type, profile_photo, email"
-        ).eq("team", team_name).execute()
-        members = member_res.data if member_res.data else []
-
-        if not members:
-            return []
-        
-        # 2. 從 strava_member_bindings 獲取 strava_id (用 email 關聯)
-        emails = [m["email"] for m in members if m.get("email")]
-        binding_map = {}
-        if emails:
-            binding_res = supabase.table("strava_member_bindings").select("tcu_member_email, strava_id").in_("tcu_member_email", emails).execute()
-            binding_map = {b["tcu_member_email"]: b["strava_id"] for b in binding_res.data}
-        
-        # 3. 收集 strava_ids 用於 fallback 頭像 (當 profile_photo 為空時)
-        sids = [str(sid) for sid in binding_map.values() if sid]
-        
-        avatar_map = {}
-        if sids:
-            athlete_res = supabase.table("athletes").select("id, profile, profile_medium").in_("id", sids).execute()
-            if athlete_res.data:
-                for a in athlete_res.data:
-                    avatar_map[str(a["id"])] = a.get("profile_medium") or a.get("profile")
-                    
-        # 4. 組合資料
-        enriched_members = []
-        for m in members:
-            sid = binding_map.get(m.get("email"))
-            role = m.get("member_type") or "隊員"
-            
-            # 計算年齡
-            age = None
-            birthday = m.get("birthday")
-            if birthday:
-                try:
-                    from datetime import date
-                    birth_date = date.fromisoformat(str(birthday)[:10])
-                    today = date.today()
-                    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-                except:
-                    pass
-            
-            # 頭像優先使用 profile_photo，否則從 athletes 表抓
-            avatar = m.get("profile_photo") or (avatar_map.get(str(sid)) if sid else None)
-            
-            enriched_members.append({
-                "real_name": m.get("real_name"),
-                "nickname": m.get("nickname"),
-                "age": age,
-                "self_intro": m.get("self_introduction"),
-                "skills": m.get("skills"),
-                "tcu_id": m.get("tcu_id"),
-                "member_type": role,
-                "strava_id": sid,
-                "avatar": avatar
-            })
-        
-        # 5. 排序：付費車隊管理員 > 隊長 > 其他
-        def sort_key(x):
-            role = x["member_type"]
-            if "付費車隊管理員" in role:
-                return 0
-            elif "隊長" in role:
-                return 1
-            else:
-                return 2
-        
-        enriched_members.sort(key=sort_key)
-            
-        return enriched_members
-        
+        return await run_in_threadpool(team_roster.get_roster, team_name)
     except Exception as e:
         print(f"[ERROR] Get team members error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/roster/invalidate", dependencies=[Depends(require_admin)])
+def invalidate_team_roster(team_name: Optional[str] = None):
+    """清除車隊名單快取 (每日會員匯入完成後呼叫，需 admin 或排程密鑰；未指定 team_name 時清除全部)"""
+    team_roster.invalidate(team_name)
+    # 匯入可能改變成員的車隊與角色
+    team_auth.invalidate()
+    return {"success": True}
+
+@router.get("/dashboard")
+async def get_team_dashboard(team_name: str, weeks: int = team_dashboard.DEFAULT_WEEKS, inactive_days: int = team_dashboard.DEFAULT_INACTIVE_DAYS):
+    """
+    車隊作戰室：成員近期活動摘要、每週總量、距離 / 爬升 / TSS 本週排行與未活動名單。
+    由 athlete_weekly_rollups 週彙總產生，一個車隊一次回應
+    """
+    if not 1 <= weeks <= 52:
+        raise HTTPException(status_code=400, detail="weeks must be between 1 and 52")
+    try:
+        return await run_in_threadpool(team_dashboard.get_dashboard, team_name, weeks, inactive_days)
+    except Exception as e:
+        print(f"[ERROR] Get team dashboard error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/dashboard/rebuild", dependencies=[Depends(require_admin)])
+def rebuild_team_dashboard(background_tasks: BackgroundTasks, days: int = 28):
+    """依來源表重建最近 days 天的週彙總修正漂移 (供排程呼叫，需 admin 或排程密鑰，於背景執行)"""
+    if not 1 <= days <= team_dashboard.MAX_REBUILD_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {team_dashboard.MAX_REBUILD_DAYS}")
+    background_tasks.add_task(team_dashboard.rebuild_rollups, date.today() - timedelta(days=days))
+    return {"success": True, "message": "Weekly rollup rebuild started"}
 
 @router.post("/races")
 async def create_team_race(request: Request, background_tasks: BackgroundTasks):
@@ -206,6 +186,7 @@ async def create_team_race(request: Request, background_tasks: BackgroundTasks):
     建立車隊賽事 (Admin Only)
     使用 team_name + strava_id 驗證權限
     """
+    db = get_async_db()
     try:
         body = await request.json()
         strava_id = str(body.get("strava_id"))
@@ -223,46 +204,15 @@ async def create_team_race(request: Request, background_tasks: BackgroundTasks):
         if not all([strava_id, team_name, segment_id, start_date, end_date]):
             raise HTTPException(status_code=400, detail="缺少必要參數")
         
-        # 1. 從 strava_member_bindings 取得 tcu_member_email
-        binding_res = supabase.table("strava_member_bindings").select("tcu_member_email, tcu_account").eq("strava_id", strava_id).execute()
-        if not binding_res.data:
-            raise HTTPException(status_code=403, detail="未綁定 Strava 帳號")
-        
-        binding = binding_res.data[0]
-        email = binding.get("tcu_member_email")
-        tcu_account = binding.get("tcu_account")
-        
-        # 2. 從 tcu_members 驗證是否為該車隊的管理員/隊長
-        member = None
-        if tcu_account:
-            member_res = supabase.table("tcu_members").select("team, member_type").eq("account", tcu_account).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        if not member and email:
-            member_res = supabase.table("tcu_members").select("team, member_type").eq("email", email).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        if not member:
-            raise HTTPException(status_code=403, detail="找不到 TCU 成員資料")
-        
-        # 3. 驗證是否為該車隊成員
-        if member.get("team") != team_name:
-            raise HTTPException(status_code=403, detail="您不屬於此車隊")
-        
-        # 4. 驗證是否為隊長或管理員
-        member_type = member.get("member_type") or ""
-        is_authorized = "隊長" in member_type or "管理員" in member_type
-        if not is_authorized:
-            raise HTTPException(status_code=403, detail="只有隊長或管理員可以建立賽事")
-        
-        # 5. 檢查是否已有進行中的賽事（一個車隊只能有一個賽事）
-        existing_race = supabase.table("team_races").select("id").eq("team_name", team_name).eq("is_active", True).execute()
+        # 1. 驗證是否為該車隊的隊長或管理員
+        await _require_team_manager(strava_id, team_name, "建立")
+        
+        # 2. 檢查是否已有進行中的賽事（一個車隊只能有一個賽事）
+        existing_race = await db.table("team_races").select("id").eq("team_name", team_name).eq("is_active", True).execute()
         if existing_race.data and len(existing_race.data) > 0:
             raise HTTPException(status_code=400, detail="車隊已有進行中的賽事，請先結束現有賽事")
         
-        # 6. 建立賽事資料（包含路段統計）
+        # 3. 建立賽事資料（包含路段統計）
         data = {
             "team_name": team_name,
             "segment_id": int(segment_id),
@@ -277,7 +227,7 @@ async def create_team_race(request: Request, background_tasks: BackgroundTasks):
             "polyline": body.get("polyline")
         }
         
-        res = supabase.table("team_races").insert(data).execute()
+        res = await db.table("team_races").insert(data).execute()
         
         # 觸發 OG Image 產生
         if res.data:
@@ -291,9 +241,9 @@ async def create_team_race(request: Request, background_tasks: BackgroundTasks):
                 elevation_gain
             )
         
-        # 7. 同步到 segments 表讓賽事出現在挑戰列表
+        # 4. 同步到 segments 表讓賽事出現在挑戰列表
         # 先檢查 segment 是否已存在
-        existing_segment = supabase.table("segments").select("id").eq("id", int(segment_id)).execute()
+        existing_segment = await db.table("segments").select("id").eq("id", int(segment_id)).execute()
         
         segment_data = {
             "id": int(segment_id),
@@ -309,15 +259,16 @@ async def create_team_race(request: Request, background_tasks: BackgroundTasks):
         
         if existing_segment.data:
             # 更新現有 segment 的日期
-            supabase.table("segments").update({
+            await db.table("segments").update({
                 "start_date": start_date,
                 "end_date": end_date,
                 "is_active": True
             }).eq("id", int(segment_id)).execute()
         else:
             # 建立新 segment
-            supabase.table("segments").insert(segment_data).execute()
+            await db.table("segments").insert(segment_data).execute()
         
+        invalidate_share_page(segment_id)
         return {"success": True, "data": res.data}
         
     except HTTPException:
@@ -329,40 +280,45 @@ async def create_team_race(request: Request, background_tasks: BackgroundTasks):
 @router.get("/races")
 async def get_team_races(team_name: str):
     """取得車隊賽事列表 (含報名人數)"""
+    db = get_async_db()
     try:
         # 1. 取得賽事列表
-        res = supabase.table("team_races").select("*").eq("team_name", team_name).order("created_at", desc=True).execute()
+        res = await db.table("team_races").select("*").eq("team_name", team_name).order("created_at", desc=True).execute()
         races = res.data if res.data else []
 
         if not races:
             return []
 
-        # 2. 取得每場賽事的報名人數
-        # 由於 Supabase client 不容易直接 group by count，這裡先用迴圈查詢，或是直接撈所有相關報名紀錄 (如果資料量不大)
-        # 考量效能，這裡先針對每場賽事查詢 count (N+1 query, 但預期賽事數量很少)
-        
+        # 2. 報名人數：由觸發器維護的 registration_counts 一次讀取
+        segment_ids = list({race["segment_id"] for race in races if race.get("segment_id")})
+        counts = {}
+        segments = {}
+        if segment_ids:
+            counts = await run_in_threadpool(registration_counts.get_totals, segment_ids)
+
+            # 3. 路段詳細資料 (description, link)：一次 in_ 查詢
+            seg_res = await db.table("segments").select("id, description, link, distance, average_grade, total_elevation_gain, polyline") \
+                .in_("id", segment_ids).execute()
+            segments = {seg["id"]: seg for seg in seg_res.data or []}
+
         enriched_races = []
         for race in races:
             segment_id = race.get("segment_id")
-            count_res = supabase.table("registrations").select("id", count="exact").eq("segment_id", segment_id).execute()
-            
-            
+
             # 將 participant_count 加入賽事物件
-            race["participant_count"] = count_res.count if count_res.count is not None else 0
-            
-            # 取得路段詳細資料 (description, link)
-            if segment_id:
-                seg_res = supabase.table("segments").select("description, link, distance, average_grade, total_elevation_gain, polyline").eq("id", segment_id).maybe_single().execute()
-                if seg_res.data:
-                    # Merge segment data, prioritizing segment table's current data
-                    race["description"] = seg_res.data.get("description")
-                    race["link"] = seg_res.data.get("link")
-                    # Also update these technical fields to ensure latest data from segment
-                    race["distance"] = seg_res.data.get("distance")
-                    race["average_grade"] = seg_res.data.get("average_grade")
-                    race["elevation_gain"] = seg_res.data.get("total_elevation_gain")
-                    # Polyline might be stored as map or polyline in frontend expectations, keeping consistent with create
-                    race["polyline"] = seg_res.data.get("polyline")
+            race["participant_count"] = counts.get(segment_id, 0)
+
+            seg = segments.get(segment_id)
+            if seg:
+                # Merge segment data, prioritizing segment table's current data
+                race["description"] = seg.get("description")
+                race["link"] = seg.get("link")
+                # Also update these technical fields to ensure latest data from segment
+                race["distance"] = seg.get("distance")
+                race["average_grade"] = seg.get("average_grade")
+                race["elevation_gain"] = seg.get("total_elevation_gain")
+                # Polyline might be stored as map or polyline in frontend expectations, keeping consistent with create
+                race["polyline"] = seg.get("polyline")
 
             enriched_races.append(race)
             
@@ -372,14 +328,56 @@ async def get_team_races(team_name: str):
         print(f"[ERROR] Get races error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/registration-counts")
+def get_registration_counts(segment_ids: str, team: Optional[str] = None):
+    """
+    批次取得報名人數 (segment_ids 以逗號分隔)。
+    回傳 { segment_id: { total, by_team } }；指定 team 時另附該車隊人數 team_count。
+    """
+    try:
+        ids = [int(s) for s in segment_ids.split(",") if s.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="segment_ids must be comma-separated integers")
+    try:
+        counts = registration_counts.get_counts(ids)
+        if team:
+            for entry in counts.values():
+                entry["team_count"] = entry["by_team"].get(team, 0)
+        return counts
+    except Exception as e:
+        print(f"[ERROR] Get registration counts error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/registration-counts/repair", dependencies=[Depends(require_admin)])
+def repair_registration_counts(background_tasks: BackgroundTasks):
+    """依 registrations 重新計算計數表修正漂移 (供排程呼叫，於背景執行；需 admin 或排程密鑰)"""
+    background_tasks.add_task(registration_counts.repair)
+    return {"success": True, "message": "Registration count repair started"}
+
+@router.get("/races/{race_id}/standings")
+async def get_race_standings(race_id: int):
+    """取得車隊賽事團體成績 (依名次排序)"""
+    try:
+        return await run_in_threadpool(TeamRaceScoring.get_standings, race_id)
+    except Exception as e:
+        print(f"[ERROR] Get race standings error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/races/{race_id}/standings/recompute", dependencies=[Depends(require_admin)])
+def recompute_race_standings(race_id: int, background_tasks: BackgroundTasks):
+    """完整重算車隊賽事團體成績 (需 admin 或排程密鑰，於背景執行)"""
+    background_tasks.add_task(TeamRaceScoring.recompute, race_id)
+    return {"success": True, "message": "Standings recompute started"}
+
 @router.get("/races/{segment_id}/participants")
 async def get_race_participants(segment_id: int):
     """取得賽事報名名單"""
+    db = get_async_db()
     try:
         # 關聯 registraitons 與 athletes (透過 strava_athlete_id) 或是 tcu_members (透過 tcu_id 或是 name)
         # 目前 registrations table 有: segment_id, strava_athlete_id, athlete_name, athlete_profile, team, number, status, tcu_id
         
-        res = supabase.table("registrations").select("*").eq("segment_id", segment_id).order("registered_at", desc=True).execute()
+        res = await db.table("registrations").select("*").eq("segment_id", segment_id).order("registered_at", desc=True).execute()
         return res.data if res.data else []
     except Exception as e:
         print(f"[ERROR] Get participants error: {str(e)}")
@@ -390,6 +388,7 @@ async def update_team_race(race_id: int, request: Request, background_tasks: Bac
     """
     更新車隊賽事 (僅限隊長)
     """
+    db = get_async_db()
     try:
         body = await request.json()
         strava_id = str(body.get("strava_id"))
@@ -402,7 +401,7 @@ async def update_team_race(race_id: int, request: Request, background_tasks: Bac
             raise HTTPException(status_code=400, detail="缺少必要參數")
         
         # 1. 驗證賽事是否存在且屬於該車隊
-        race_res = supabase.table("team_races").select("*").eq("id", race_id).execute()
+        race_res = await db.table("team_races").select("*").eq("id", race_id).execute()
         if not race_res.data:
             raise HTTPException(status_code=404, detail="賽事不存在")
         
@@ -411,32 +410,7 @@ async def update_team_race(race_id: int, request: Request, background_tasks: Bac
             raise HTTPException(status_code=403, detail="您無權更新此賽事")
         
         # 2. 驗證權限（僅限隊長/管理員）
-        binding_res = supabase.table("strava_member_bindings").select("tcu_member_email, tcu_account").eq("strava_id", strava_id).execute()
-        if not binding_res.data:
-            raise HTTPException(status_code=403, detail="未綁定 Strava 帳號")
-        
-        binding = binding_res.data[0]
-        email = binding.get("tcu_member_email")
-        tcu_account = binding.get("tcu_account")
-        
-        member = None
-        if tcu_account:
-            member_res = supabase.table("tcu_members").select("team, member_type").eq("account", tcu_account).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        if not member and email:
-            member_res = supabase.table("tcu_members").select("team, member_type").eq("email", email).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        if not member or member.get("team") != team_name:
-            raise HTTPException(status_code=403, detail="您不屬於此車隊")
-        
-        member_type = member.get("member_type") or ""
-        is_authorized = "隊長" in member_type or "管理員" in member_type
-        if not is_authorized:
-            raise HTTPException(status_code=403, detail="只有隊長或管理員可以更新賽事")
+        await _require_team_manager(strava_id, team_name, "更新")
         
         # 3. 更新賽事
         update_data = {
@@ -445,9 +419,32 @@ async def update_team_race(race_id: int, request: Request, background_tasks: Bac
             "end_date": end_date,
             "og_image": body.get("og_image")
         }
+
+        # 團體計分規則 (有傳入時才更新)
+        if "scoring_rule" in body:
+            if body["scoring_rule"] not in SCORING_RULES:
+                raise HTTPException(status_code=400, detail=f"scoring_rule 必須為 {', '.join(SCORING_RULES)}")
+            update_data["scoring_rule"] = body["scoring_rule"]
+        _validate_scoring(body)
+        for key in ("scoring_top_n", "scoring_points"):
+            if key in body:
+                update_data[key] = body[key]
+        try:
+            period_changed = parse_race_time(start_date) != parse_race_time(race.get("start_date")) \
+                or parse_race_time(end_date) != parse_race_time(race.get("end_date"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="日期格式錯誤")
+        scoring_changed = period_changed or any(
+            key in update_data and update_data[key] != race.get(key)
+            for key in ("scoring_rule", "scoring_top_n", "scoring_points")
+        )
         
         # 更新 team_races
-        supabase.table("team_races").update(update_data).eq("id", race_id).execute()
+        await db.table("team_races").update(update_data).eq("id", race_id).execute()
+        
+        # 計分規則或賽事期間變更時重算團體成績
+        if scoring_changed:
+            background_tasks.add_task(TeamRaceScoring.recompute, race_id)
         
         # 觸發 OG Image 產生 (重新產圖以反映可能的名稱變更)
         background_tasks.add_task(
@@ -474,7 +471,8 @@ async def update_team_race(race_id: int, request: Request, background_tasks: Bac
             # But let's be safe and only update if present in body to support partial updates if needed, 
             # though here we expect full update.
             
-            supabase.table("segments").update(segment_update_data).eq("id", segment_id).execute()
+            await db.table("segments").update(segment_update_data).eq("id", segment_id).execute()
+            invalidate_share_page(segment_id)
             
         return {"success": True, "message": "賽事已更新"}
         
@@ -489,6 +487,7 @@ async def delete_team_race(race_id: int, request: Request):
     """
     刪除車隊賽事 (僅限隊長)
     """
+    db = get_async_db()
     try:
         body = await request.json()
         strava_id = str(body.get("strava_id"))
@@ -498,7 +497,7 @@ async def delete_team_race(race_id: int, request: Request):
             raise HTTPException(status_code=400, detail="缺少必要參數")
         
         # 1. 驗證賽事是否存在且屬於該車隊
-        race_res = supabase.table("team_races").select("*").eq("id", race_id).execute()
+        race_res = await db.table("team_races").select("*").eq("id", race_id).execute()
         if not race_res.data:
             raise HTTPException(status_code=404, detail="賽事不存在")
         
@@ -507,35 +506,12 @@ async def delete_team_race(race_id: int, request: Request):
             raise HTTPException(status_code=403, detail="您無權刪除此賽事")
         
         # 2. 驗證權限（僅限隊長）
-        binding_res = supabase.table("strava_member_bindings").select("tcu_member_email, tcu_account").eq("strava_id", strava_id).execute()
-        if not binding_res.data:
-            raise HTTPException(status_code=403, detail="未綁定 Strava 帳號")
-        
-        binding = binding_res.data[0]
-        email = binding.get("tcu_member_email")
-        tcu_account = binding.get("tcu_account")
-        
-        member = None
-        if tcu_account:
-            member_res = supabase.table("tcu_members").select("team, member_type").eq("account", tcu_account).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        if not member and email:
-            member_res = supabase.table("tcu_members").select("team, member_type").eq("email", email).execute()
-            if member_res.data:
-                member = member_res.data[0]
-        
-        if not member or member.get("team") != team_name:
-            raise HTTPException(status_code=403, detail="您不屬於此車隊")
-        
-        member_type = member.get("member_type") or ""
-        is_authorized = "隊長" in member_type or "管理員" in member_type
-        if not is_authorized:
-            raise HTTPException(status_code=403, detail="只有隊長或管理員可以刪除賽事")
+        await _require_team_manager(strava_id, team_name, "刪除")
         
         # 3. 刪除賽事
-        supabase.table("team_races").delete().eq("id", race_id).execute()
+        await db.table("team_races").delete().eq("id", race_id).execute()
+        if race.get("segment_id"):
+            invalidate_share_page(race["segment_id"])
         return {"success": True, "message": "賽事已刪除"}
         
     except HTTPException:
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Query, HTTPException, Request, Response
 from pydantic import BaseModel
 from typing import Optional, Dict, List, Any
-from database import supabase
+from database import supabase, get_async_db
 from strava_service import StravaService
+from metrics_pipeline import MetricsPipeline
+from effort_profile_service import EffortProfileService
+from team_race_scoring import TeamRaceScoring
 from datetime import datetime, timezone
+from starlette.concurrency import run_in_threadpool
+import httpx
 import json
 
 router = APIRouter(prefix="/webhook", tags=["webhooks"])
@@ -39,8 +44,14 @@ async def receive_webhook(event: StravaEvent):
     """
     處理 Strava Webhook 事件
     """
+    db = get_async_db()
     print(f"Received Webhook Event: {event}")
 
+    # 活動刪除：扣除該活動的 TSS 並移除衍生指標
+    if event.object_type == "activity" and event.aspect_type == "delete":
+        MetricsPipeline.submit_removal(event.object_id)
+        return {"status": "ok", "message": f"Activity {event.object_id} removal queued"}
+
     # 1. 只處理新活動建立 (create activity)
     if event.object_type != "activity" or event.aspect_type != "create":
         return {"status": "ignored", "reason": "Not an activity create event"}
@@ -51,7 +62,7 @@ async def receive_webhook(event: StravaEvent):
     try:
         # 2. 檢查是否為已報名選手 (Query registrations table)
         # 用 supabase 查詢
-        reg_response = supabase.table("registrations").select("*").eq("strava_athlete_id", athlete_id).execute()
+        reg_response = await db.table("registrations").select("*").eq("strava_athlete_id", athlete_id).execute()
         
         if not reg_response.data:
             return {"status": "ignored", "reason": "Athlete not registered"}
@@ -63,7 +74,7 @@ async def receive_webhook(event: StravaEvent):
         print(f"Processing activity {activity_id} for athlete {athlete_id} ({athlete_name}). Registered segments: {registered_segment_ids}")
 
         # 3. 取得活動詳情
-        activity_data = StravaService.get_activity(athlete_id, activity_id)
+        activity_data = await run_in_threadpool(StravaService.get_activity, athlete_id, activity_id)
         
         if not activity_data:
             return {"status": "error", "message": "Failed to fetch activity details"}
@@ -95,6 +106,14 @@ async def receive_webhook(event: StravaEvent):
         if not matched_efforts:
             return {"status": "ok", "message": "No matching segment efforts found"}
 
+        # 記錄 effort 的 stream 視窗，配速剖面於 streams 可用時產生
+        try:
+            matched_ids = {e["id"] for e in matched_efforts}
+            if await run_in_threadpool(EffortProfileService.register_efforts, activity_id, [e for e in efforts if e["id"] in matched_ids]):
+                MetricsPipeline.submit_effort_profiles(activity_id)
+        except Exception as e:
+            print(f"Error registering effort profiles: {e}")
+
         # 5. 寫入資料庫 (UPSERT segment_efforts)
         # 逐筆寫入或批次寫入
         print(f"Upserting {len(matched_efforts)} efforts...")
@@ -109,7 +128,7 @@ async def receive_webhook(event: StravaEvent):
             
             # Upsert effort (resolution=merge-duplicates is handled by supabase-py if configured? 
             # supabase-py upsert default is merge if PK exists)
-            supabase.table("segment_efforts_v2").upsert(data_to_upsert).execute()
+            await db.table("segment_efforts_v2").upsert(data_to_upsert).execute()
 
             # 6. 更新同步狀態 (sync_metadata)
             # n8n 邏輯: 
@@ -131,16 +150,64 @@ async def receive_webhook(event: StravaEvent):
             }
             try:
                 # 嘗試 upsert sync_metadata
-                supabase.table("sync_metadata").upsert(metadata).execute()
+                await db.table("sync_metadata").upsert(metadata).execute()
             except Exception as e:
                 print(f"Error updating sync_metadata: {e}")
 
+        # 更新該路段車隊賽事的團體成績 (背景執行)
+        TeamRaceScoring.submit_efforts(matched_efforts)
+
         return {"status": "ok", "message": f"Processed {len(matched_efforts)} efforts"}
 
     except Exception as e:
         print(f"Error processing webhook: {e}")
         return {"status": "error", "message": str(e)}
 
+def _is_storage_only_update(body: dict) -> bool:
+    """
+    StreamStore.compact 只會寫入 streams_bin (drop_json 時另清空 streams)，
+    這類 UPDATE 不代表 streams 內容變動，不需再計算一次指標。
+    """
+    record = body.get("record")
+    old_record = body.get("old_record")
+    if body.get("type") != "UPDATE" or not isinstance(record, dict) or not isinstance(old_record, dict):
+        return False
+    changed = {k for k in set(record) | set(old_record) if record.get(k) != old_record.get(k)}
+    if record.get("streams") is None:
+        changed.discard("streams")
+    return changed <= {"streams_bin"}
+
+@router.post("/strava-streams")
+async def receive_streams_ingested(request: Request):
+    """
+    strava_streams 寫入後的 post-ingest 通知，將活動排入指標計算 worker pool。
+    支援兩種格式：
+    1. n8n 同步流程：{ "activity_id": 123 } 或 { "activity_ids": [123, 456] }
+    2. Supabase Database Webhook：{ "type": "INSERT" | "UPDATE", "record": { "activity_id": 123, ... } }
+       只改動 streams_bin 的 UPDATE (compact 產生) 會被忽略
+    """
+    try:
+        body = await request.json()
+        if _is_storage_only_update(body):
+            return {"status": "ignored", "reason": "Storage-only update"}
+        activity_ids = {int(a) for a in body.get("activity_ids") or []}
+        if body.get("activity_id"):
+            activity_ids.add(int(body["activity_id"]))
+        record = body.get("record")
+        if isinstance(record, dict) and record.get("activity_id"):
+            activity_ids.add(int(record["activity_id"]))
+
+        if not activity_ids:
+            return {"status": "ignored", "reason": "No activity_id"}
+
+        for activity_id in activity_ids:
+            MetricsPipeline.submit(activity_id)
+
+        return {"status": "ok", "queued": len(activity_ids)}
+    except Exception as e:
+        print(f"Error in strava-streams webhook: {e}")
+        return {"status": "error", "message": str(e)}
+
 @router.post("/segment_set")
 async def segment_set(request: Request):
     """
@@ -156,7 +223,7 @@ async def segment_set(request: Request):
         print(f"Fetching segment details for {segment_id}...")
         
         # 使用 StravaService 取得路段資料
-        segment_data = StravaService.get_segment(int(segment_id))
+        segment_data = await run_in_threadpool(StravaService.get_segment, int(segment_id))
         
         if not segment_data:
              return Response(content="Failed to fetch segment data from Strava", status_code=404)
@@ -175,8 +242,6 @@ async def segment_set(request: Request):
 # ====================================================================
 
 import os
-import urllib.request
-import ssl
 import requests
 from fastapi.responses import RedirectResponse, HTMLResponse
 
@@ -186,6 +251,7 @@ async def proxy_member_binding(request: Request):
     處理會員綁定邏輯 (Replica of auth.py proxy_member_binding but under /webhook)
     URL: /webhook/member-binding
     """
+    db = get_async_db()
     try:
         body = await request.json()
         print(f"[DEBUG][Webhook] Received binding body: {body}")
@@ -200,7 +266,7 @@ async def proxy_member_binding(request: Request):
              return {"success": False, "message": "Missing email or stravaId"}
 
         # 1. Verify Member
-        member_res = supabase.table("tcu_members").select("email, real_name, account").eq("email", email).execute()
+        member_res = await db.table("tcu_members").select("email, real_name, account").eq("email", email).execute()
         if not member_res.data:
             return {
                 "success": False, 
@@ -208,7 +274,7 @@ async def proxy_member_binding(request: Request):
             }
 
         # 2. Check Existing Binding
-        binding_res = supabase.table("strava_member_bindings").select("*").eq("tcu_member_email", email).execute()
+        binding_res = await db.table("strava_member_bindings").select("*").eq("tcu_member_email", email).execute()
         bindings = binding_res.data
         
         if action == "generate_otp":
@@ -236,17 +302,12 @@ async def proxy_member_binding(request: Request):
         n8n_url = os.getenv("N8N_MEMBER_BINDING_URL", "https://service.criterium.tw/webhook/member-binding")
         # If n8n domain is down, this will timeout.
         
-        req = urllib.request.Request(
-            n8n_url,
-            data=json.dumps(body).encode('utf-8'),
-            headers={'Content-Type': 'application/json', 'User-Agent': 'TCU-Backend'},
-            method='POST'
-        )
-        
         try:
              # Use shorter timeout if suspecting dead service
-            with urllib.request.urlopen(req, context=ssl._create_unverified_context(), timeout=10) as response:
-                res_data = response.read().decode('utf-8')
+            async with httpx.AsyncClient(verify=False, timeout=10) as client:
+                response = await client.post(n8n_url, json=body, headers={'User-Agent': 'TCU-Backend'})
+                response.raise_for_status()
+                res_data = response.text
                 try:
                     return json.loads(res_data)
                 except:
@@ -387,6 +448,7 @@ async def strava_auth_cancel(request: Request):
     Handle Strava Disconnect/Cancel
     URL: /webhook/strava/auth/cancel
     """
+    db = get_async_db()
     try:
         body = await request.json()
         athlete_id = body.get("athlete_id")
@@ -399,7 +461,7 @@ async def strava_auth_cancel(request: Request):
         # 清除 tokens 但保留基本資料? 或是做其他登出處理
         # 這裡簡單回傳成功，並嘗試更新 DB 狀態 (可選)
         try:
-             supabase.table("athletes").update({
+             await db.table("athletes").update({
                  "access_token": None,
                  "refresh_token": None,
                  "expires_at": None
@@ -0,0 +1,59 @@
+import sys
+from typing import Optional, Dict, Any
+from database import supabase
+from utils.stream_codec import encode_streams, to_pg_bytea
+from utils.streams import STREAM_COLUMNS, load_streams
+
+class StreamStore:
+    """
+    strava_streams 的讀寫入口。
+    讀取時優先解碼 streams_bin (TCUS 二進位格式)，沒有時才解析 JSON；
+    ingest 時會順便補上 streams_bin，讓之後的讀取不必再解析大型 JSON。
+    """
+
+    @staticmethod
+    def fetch_row(activity_id: int, extra_columns: str = "") -> Optional[Dict[str, Any]]:
+        columns = STREAM_COLUMNS + (f", {extra_columns}" if extra_columns else "")
+        res = supabase.table("strava_streams").select(columns).eq("activity_id", activity_id).execute()
+        return res.data[0] if res.data else None
+
+    @staticmethod
+    def fetch_streams(activity_id: int) -> Any:
+        row = StreamStore.fetch_row(activity_id)
+        return load_streams(row) if row else None
+
+    @staticmethod
+    def compact(activity_id: int, streams: Any, drop_json: bool = False) -> int:
+        """將 JSON streams 編碼後寫入 streams_bin，回傳編碼後大小 (bytes)"""
+        blob = encode_streams(streams)
+        update = {"streams_bin": to_pg_bytea(blob)}
+        if drop_json:
+            update["streams"] = None
+        supabase.table("strava_streams").update(update).eq("activity_id", activity_id).execute()
+        return len(blob)
+
+    @staticmethod
+    def compact_backlog(batch_size: int = 20, drop_json: bool = False) -> int:
+        """批次將尚未編碼的 strava_streams 轉為 streams_bin"""
+        total = 0
+        while True:
+            res = supabase.table("strava_streams").select("activity_id, streams") \
+                .is_("streams_bin", "null").not_.is_("streams", "null").limit(batch_size).execute()
+            rows = res.data or []
+            if not rows:
+                break
+            for row in rows:
+                try:
+                    size = StreamStore.compact(row["activity_id"], row["streams"], drop_json=drop_json)
+                    total += 1
+                    print(f"Compacted activity {row['activity_id']}: {size} bytes")
+                except Exception as e:
+                    print(f"[ERROR] Compact streams for activity {row['activity_id']} failed: {e}")
+                    return total
+        return total
+
+if __name__ == "__main__":
+    # 批次轉換：python stream_store.py [--drop-json]
+    # --drop-json 會清空原本的 JSON 欄位，請確認前端已改用 /api/analytics/streams 再使用
+    count = StreamStore.compact_backlog(drop_json="--drop-json" in sys.argv)
+    print(f"Compacted {count} stream rows")
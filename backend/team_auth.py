@@ -0,0 +1,68 @@
+import os
+from typing import Dict, Any, Optional
+from database import supabase
+from utils.ttl_cache import TTLCache
+
+# 車隊權限上下文：strava_id -> 綁定、TCU 成員、車隊與角色 (routers/teams.py 所有車隊路由共用)
+# 短 TTL 快取；綁定 / 解除綁定時由 routers/auth.py 呼叫 invalidate()，會員匯入後整批清除
+TEAM_AUTH_TTL = int(os.getenv("TEAM_AUTH_TTL", "60"))
+_context_cache = TTLCache(ttl=TEAM_AUTH_TTL, maxsize=4096)
+
+# 可看到車隊管理介面的角色 (/my-team is_admin)
+ADMIN_MEMBER_TYPES = ["付費車隊管理員", "隊長", "管理員"]
+
+def _can_manage(member_type: str) -> bool:
+    """可建立 / 修改 / 刪除車隊賽事：角色名稱含「隊長」或「管理員」"""
+    return "隊長" in member_type or "管理員" in member_type
+
+def _fetch_member(tcu_account: Optional[str], email: Optional[str]) -> Optional[Dict[str, Any]]:
+    """從 tcu_members 取得成員資料，優先以 account 查詢，找不到再以 email 查詢"""
+    columns = "team, real_name, member_type"
+    if tcu_account:
+        res = supabase.table("tcu_members").select(columns).eq("account", tcu_account).execute()
+        if res.data:
+            return res.data[0]
+    if email:
+        res = supabase.table("tcu_members").select(columns).eq("email", email).execute()
+        if res.data:
+            return res.data[0]
+    return None
+
+def build_context(strava_id: str) -> Dict[str, Any]:
+    binding_res = supabase.table("strava_member_bindings").select("tcu_member_email, tcu_account, member_name") \
+        .eq("strava_id", strava_id).execute()
+    if not binding_res.data:
+        return {"strava_id": strava_id, "is_bound": False, "member": None, "team": None,
+                "member_type": None, "is_admin": False, "can_manage": False}
+
+    binding = binding_res.data[0]
+    member = _fetch_member(binding.get("tcu_account"), binding.get("tcu_member_email"))
+    member_type = (member or {}).get("member_type") or ""
+    return {
+        "strava_id": strava_id,
+        "is_bound": True,
+        "email": binding.get("tcu_member_email"),
+        "tcu_account": binding.get("tcu_account"),
+        "member_name": (member or {}).get("real_name") or binding.get("member_name"),
+        "member": member,
+        "team": (member or {}).get("team"),
+        "member_type": member_type or None,
+        "is_admin": member_type in ADMIN_MEMBER_TYPES,
+        "can_manage": _can_manage(member_type),
+    }
+
+def get_context(strava_id: Any) -> Dict[str, Any]:
+    """取得 (可能為快取的) 權限上下文；未綁定時 is_bound 為 False"""
+    strava_id = str(strava_id)
+    context = _context_cache.get(strava_id)
+    if context is None:
+        context = build_context(strava_id)
+        _context_cache.set(strava_id, context)
+    return context
+
+def invalidate(strava_id: Optional[Any] = None):
+    """清除指定選手 (未指定時為全部) 的權限快取"""
+    if strava_id is None:
+        _context_cache.clear()
+    else:
+        _context_cache.invalidate(str(strava_id))
@@ -0,0 +1,154 @@
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from database import supabase
+import team_roster
+from utils.ttl_cache import TTLCache
+
+# 車隊作戰室彙總 (GET /api/teams/dashboard)
+# 讀取觸發器維護的 athlete_weekly_rollups (migrations/021)，不再由前端逐筆讀取 strava_activities
+
+DASHBOARD_TTL = int(os.getenv("TEAM_DASHBOARD_TTL", "60"))
+DEFAULT_WEEKS = 8
+DEFAULT_INACTIVE_DAYS = 14
+LEADER_COUNT = 5
+# POST /dashboard/rebuild 可重建的天數上限；全部重建僅能由本檔命令列執行
+MAX_REBUILD_DAYS = 365
+QUERY_CHUNK = 200
+ROLLUP_FIELDS = ("activities", "moving_time", "distance", "elevation_gain", "tss")
+LEADER_FIELDS = ("distance", "elevation_gain", "tss")
+
+_dashboard_cache = TTLCache(ttl=DASHBOARD_TTL, maxsize=256)
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def _empty_totals() -> Dict[str, float]:
+    return {f: 0 for f in ROLLUP_FIELDS}
+
+def _add(totals: Dict[str, float], row: Dict[str, Any]):
+    for f in ROLLUP_FIELDS:
+        totals[f] += row.get(f) or 0
+
+def _rounded(totals: Dict[str, float]) -> Dict[str, Any]:
+    return {
+        "activities": int(totals["activities"]),
+        "moving_time": int(totals["moving_time"]),
+        "distance": round(totals["distance"]),
+        "elevation_gain": round(totals["elevation_gain"]),
+        "tss": round(totals["tss"], 1),
+    }
+
+def fetch_rollups(athlete_ids: List[int], since: date) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(0, len(athlete_ids), QUERY_CHUNK):
+        res = supabase.table("athlete_weekly_rollups").select("*") \
+            .in_("athlete_id", athlete_ids[i:i + QUERY_CHUNK]) \
+            .gte("week_start", since.isoformat()).execute()
+        rows.extend(res.data or [])
+    return rows
+
+def build_dashboard(team_name: str, weeks: int = DEFAULT_WEEKS, inactive_days: int = DEFAULT_INACTIVE_DAYS,
+                    today: Optional[date] = None) -> Dict[str, Any]:
+    today = today or date.today()
+    current_week = week_start(today)
+    week_list = [current_week - timedelta(weeks=w) for w in range(weeks - 1, -1, -1)]
+    now = datetime.now(timezone.utc)
+
+    roster = [m for m in team_roster.get_roster(team_name) if str(m.get("strava_id") or "").isdigit()]
+    members = {int(m["strava_id"]): m for m in roster}
+    rollups = fetch_rollups(list(members), week_list[0])
+
+    by_member: Dict[int, Dict[str, Any]] = defaultdict(lambda: {"weeks": {}, "last_activity_at": None})
+    team_weeks = {w: _empty_totals() for w in week_list}
+    active_members = defaultdict(set)
+    for r in rollups:
+        aid = r["athlete_id"]
+        week = date.fromisoformat(str(r["week_start"])[:10])
+        entry = by_member[aid]
+        entry["weeks"][week] = r
+        if r.get("last_activity_at") and (entry["last_activity_at"] is None or r["last_activity_at"] > entry["last_activity_at"]):
+            entry["last_activity_at"] = r["last_activity_at"]
+        if week in team_weeks:
+            _add(team_weeks[week], r)
+            if r.get("activities"):
+                active_members[week].add(aid)
+
+    member_summaries = []
+    inactive = []
+    for aid, m in members.items():
+        entry = by_member.get(aid, {"weeks": {}, "last_activity_at": None})
+        period = _empty_totals()
+        for r in entry["weeks"].values():
+            _add(period, r)
+        this_week = _empty_totals()
+        if current_week in entry["weeks"]:
+            _add(this_week, entry["weeks"][current_week])
+
+        last_at = entry["last_activity_at"]
+        days_since = None
+        if last_at:
+            days_since = (now - datetime.fromisoformat(str(last_at).replace("Z", "+00:00"))).days
+
+        summary = {
+            "strava_id": aid,
+            "real_name": m.get("real_name"),
+            "nickname": m.get("nickname"),
+            "avatar": m.get("avatar"),
+            "member_type": m.get("member_type"),
+            "this_week": _rounded(this_week),
+            "period": _rounded(period),
+            "last_activity_at": last_at,
+            "days_since_activity": days_since,
+        }
+        member_summaries.append(summary)
+        # 期間內沒有活動者 days_since_activity 為 None (超過 weeks 週)
+        if days_since is None or days_since >= inactive_days:
+            inactive.append({k: summary[k] for k in ("strava_id", "real_name", "avatar", "last_activity_at", "days_since_activity")})
+
+    leaders = {
+        field: [
+            {"strava_id": s["strava_id"], "real_name": s["real_name"], "value": s["this_week"][field]}
+            for s in sorted(member_summaries, key=lambda s: s["this_week"][field], reverse=True)[:LEADER_COUNT]
+            if s["this_week"][field] > 0
+        ]
+        for field in LEADER_FIELDS
+    }
+    inactive.sort(key=lambda x: (x["days_since_activity"] is not None, -(x["days_since_activity"] or 0)))
+    member_summaries.sort(key=lambda s: s["period"]["tss"], reverse=True)
+
+    return {
+        "team_name": team_name,
+        "generated_at": now.isoformat(),
+        "week_start": current_week.isoformat(),
+        "member_count": len(members),
+        "weekly": [
+            {"week_start": w.isoformat(), **_rounded(team_weeks[w]), "active_members": len(active_members[w])}
+            for w in week_list
+        ],
+        "leaders": leaders,
+        "inactive": inactive,
+        "members": member_summaries,
+    }
+
+def get_dashboard(team_name: str, weeks: int = DEFAULT_WEEKS, inactive_days: int = DEFAULT_INACTIVE_DAYS) -> Dict[str, Any]:
+    key = (team_name, weeks, inactive_days)
+    dashboard = _dashboard_cache.get(key)
+    if dashboard is None:
+        dashboard = build_dashboard(team_name, weeks, inactive_days)
+        _dashboard_cache.set(key, dashboard)
+    return dashboard
+
+def rebuild_rollups(since: Optional[date] = None) -> int:
+    """依 strava_activities / activity_metrics 重建週彙總 (修正漂移，供排程執行)"""
+    res = supabase.rpc("rebuild_weekly_rollups", {"p_since": since.isoformat() if since else None}).execute()
+    count = res.data or 0
+    print(f"Rebuilt {count} weekly rollups since {since.isoformat() if since else 'beginning'}")
+    return count
+
+if __name__ == "__main__":
+    # python team_dashboard.py [天數]：重建最近 N 天的週彙總，未指定時全部重建
+    import sys
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    rebuild_rollups(date.today() - timedelta(days=days) if days else None)
@@ -0,0 +1,261 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+import numpy as np
+from database import supabase
+from utils.team_scoring import score_teams, SCORING_RULES, DEFAULT_RULE, DEFAULT_TOP_N
+from utils.ttl_cache import TTLCache
+from utils.data_loader import BatchLoader
+from utils.race_time import in_race_window, parse_race_time
+
+# 車隊賽事團體成績：由報名選手在賽事期間的最佳成績計算 (utils/team_scoring.py)
+# 每場賽事的最佳成績表保留在記憶體，新成績只有刷新個人最佳時才重算，且只寫入名次或成績有變動的隊伍
+
+STATE_TTL = int(os.getenv("RACE_SCORING_STATE_TTL", "900"))
+QUERY_PAGE = 1000
+
+# 單一 worker：同一場賽事的更新依序進行
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="race-scoring")
+_state_cache = TTLCache(ttl=STATE_TTL, maxsize=256)
+_state_lock = threading.Lock()
+# 沒有成績資料列的賽事 (尚無報名或成績) 由 GET 排入背景重算，每場在 STATE_TTL 內最多排一次
+_recompute_queued = TTLCache(ttl=STATE_TTL, maxsize=1024)
+_queue_lock = threading.Lock()
+
+def _log_failure(label: str, future: Future):
+    e = future.exception()
+    if e:
+        print(f"[ERROR] Team race scoring for {label} failed: {e}")
+
+def _races_by_segment_loader() -> BatchLoader:
+    return BatchLoader("team_races", key="segment_id", columns="id, start_date, end_date", many=True)
+
+class RaceState:
+    """單場賽事的計分狀態：每位報名選手的最佳成績與上次寫入的各隊成績"""
+
+    def __init__(self, race: Dict[str, Any], registrations: Dict[int, Dict[str, Any]]):
+        self.race = race
+        self.registrations = registrations            # athlete_id -> { team, athlete_name }
+        self.best: Dict[int, Dict[str, Any]] = {}     # athlete_id -> { effort_id, elapsed_time }
+        self.standings: Dict[str, Dict[str, Any]] = {}
+
+    def offer(self, athlete_id: int, effort_id: Any, elapsed_time: int) -> bool:
+        """新成績為個人最佳時更新並回傳 True"""
+        current = self.best.get(athlete_id)
+        if current is not None and current["elapsed_time"] <= elapsed_time:
+            return False
+        self.best[athlete_id] = {"effort_id": effort_id, "elapsed_time": elapsed_time}
+        return True
+
+class TeamRaceScoring:
+
+    @staticmethod
+    def fetch_race(race_id: int) -> Optional[Dict[str, Any]]:
+        res = supabase.table("team_races").select(
+            "id, segment_id, start_date, end_date, scoring_rule, scoring_top_n, scoring_points"
+        ).eq("id", race_id).execute()
+        return res.data[0] if res.data else None
+
+    @staticmethod
+    def fetch_registrations(segment_id: int, athlete_ids: Optional[List[int]] = None) -> Dict[int, Dict[str, Any]]:
+        """報名且有填車隊的選手"""
+        query = supabase.table("registrations").select("strava_athlete_id, team, athlete_name") \
+            .eq("segment_id", segment_id).not_.is_("team", "null")
+        if athlete_ids:
+            query = query.in_("strava_athlete_id", athlete_ids)
+        res = query.execute()
+        return {
+            r["strava_athlete_id"]: {"team": r["team"], "athlete_name": r.get("athlete_name")}
+            for r in res.data or [] if r.get("team")
+        }
+
+    @staticmethod
+    def fetch_efforts(race: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """賽事期間該路段的所有成績 (依秒數排序，分頁讀取)"""
+        rows = []
+        offset = 0
+        while True:
+            query = supabase.table("segment_efforts_v2").select("id, athlete_id, elapsed_time, start_date") \
+                .eq("segment_id", race["segment_id"])
+            if race.get("start_date"):
+                query = query.gte("start_date", race["start_date"])
+            if race.get("end_date"):
+                # 只有日期的結束日包含當天整天 (與 apply_effort 的 in_race_window 一致)
+                query = query.lte("start_date", parse_race_time(race["end_date"], end_of_day=True).isoformat())
+            res = query.order("elapsed_time").range(offset, offset + QUERY_PAGE).execute()
+            page = res.data or []
+            rows.extend(page)
+            if len(page) < QUERY_PAGE:
+                return rows
+            offset += QUERY_PAGE
+
+    @staticmethod
+    def load_state(race_id: int) -> Optional[RaceState]:
+        state = _state_cache.get(race_id)
+        if state is not None:
+            return state
+        race = TeamRaceScoring.fetch_race(race_id)
+        if not race:
+            return None
+        state = RaceState(race, TeamRaceScoring.fetch_registrations(race["segment_id"]))
+        for e in TeamRaceScoring.fetch_efforts(race):
+            if e["athlete_id"] in state.registrations and e.get("elapsed_time"):
+                state.offer(e["athlete_id"], e["id"], e["elapsed_time"])
+        prev = supabase.table("team_race_standings").select("team, rank, score, finishers, counted, complete, riders") \
+            .eq("race_id", race_id).execute()
+        state.standings = {r["team"]: r for r in prev.data or []}
+        _state_cache.set(race_id, state)
+        return state
+
+    @staticmethod
+    def compute_standings(state: RaceState) -> Dict[str, Dict[str, Any]]:
+        race = state.race
+        athlete_ids = [aid for aid in state.best if aid in state.registrations]
+        if not athlete_ids:
+            return {}
+        team_names = sorted({state.registrations[aid]["team"] for aid in athlete_ids})
+        team_pos = {t: i for i, t in enumerate(team_names)}
+        team_idx = np.array([team_pos[state.registrations[aid]["team"]] for aid in athlete_ids], dtype=np.int64)
+        times = np.array([state.best[aid]["elapsed_time"] for aid in athlete_ids], dtype=np.float64)
+
+        rule = race.get("scoring_rule") or DEFAULT_RULE
+        if rule not in SCORING_RULES:
+            print(f"[WARN] Unknown scoring rule {rule} for race {race['id']}, using {DEFAULT_RULE}")
+            rule = DEFAULT_RULE
+        top_n = race.get("scoring_top_n")
+        if top_n is None and rule == "top_n":
+            top_n = DEFAULT_TOP_N
+        result = score_teams(team_idx, times, len(team_names), rule, top_n, race.get("scoring_points"))
+
+        riders: Dict[str, List[Dict[str, Any]]] = {t: [] for t in team_names}
+        for i in np.lexsort((times, team_idx)):
+            aid = athlete_ids[i]
+            riders[team_names[team_idx[i]]].append({
+                "athlete_id": aid,
+                "athlete_name": state.registrations[aid].get("athlete_name"),
+                "effort_id": state.best[aid]["effort_id"],
+                "elapsed_time": int(times[i]),
+                "counted": bool(result["rider_counted"][i]),
+                "points": int(result["rider_points"][i]) if rule == "points" else None,
+            })
+
+        standings = {}
+        for t, name in enumerate(team_names):
+            score = result["score"][t]
+            standings[name] = {
+                "team": name,
+                "rank": int(result["rank"][t]),
+                "score": round(float(score), 1) if np.isfinite(score) else None,
+                "finishers": int(result["finishers"][t]),
+                "counted": int(result["counted"][t]),
+                "complete": bool(result["complete"][t]),
+                "riders": riders[name],
+            }
+        return standings
+
+    @staticmethod
+    def _save(race_id: int, state: RaceState, standings: Dict[str, Dict[str, Any]], full: bool = False) -> int:
+        """只寫入有變動的隊伍 (full=True 時全部重寫)，並刪除已無成績的隊伍"""
+        now = datetime.now(timezone.utc).isoformat()
+        changed = [
+            {**row, "race_id": race_id, "computed_at": now}
+            for team, row in standings.items()
+            if full or state.standings.get(team) != row
+        ]
+        if changed:
+            supabase.table("team_race_standings").upsert(changed).execute()
+        stale = [t for t in state.standings if t not in standings]
+        if stale:
+            supabase.table("team_race_standings").delete().eq("race_id", race_id).in_("team", stale).execute()
+        state.standings = {t: dict(row) for t, row in standings.items()}
+        return len(changed)
+
+    @staticmethod
+    def recompute(race_id: int) -> List[Dict[str, Any]]:
+        """重新讀取賽事成績並完整重算 (計分規則變更或手動修正時使用)"""
+        with _state_lock:
+            _state_cache.invalidate(race_id)
+            state = TeamRaceScoring.load_state(race_id)
+            if not state:
+                return []
+            standings = TeamRaceScoring.compute_standings(state)
+            TeamRaceScoring._save(race_id, state, standings, full=True)
+        return sorted(standings.values(), key=lambda r: r["rank"])
+
+    @staticmethod
+    def apply_effort(effort: Dict[str, Any], races_by_segment: Optional[BatchLoader] = None) -> int:
+        """
+        新成績寫入 segment_efforts_v2 後呼叫：找出該路段進行中的車隊賽事，
+        成績為個人最佳時重算並只寫入變動的隊伍，回傳更新的隊伍數。
+        races_by_segment: 批次處理多筆成績時共用，路段的賽事只查一次
+        """
+        seg_id = effort.get("segment_id")
+        athlete_id = effort.get("athlete_id")
+        elapsed = effort.get("elapsed_time")
+        if not seg_id or not athlete_id or not elapsed:
+            return 0
+        started = effort.get("start_date")
+        races_by_segment = races_by_segment or _races_by_segment_loader()
+        races = races_by_segment.load(seg_id)
+
+        updated = 0
+        for race in races:
+            if not in_race_window(started, race.get("start_date"), race.get("end_date")):
+                continue
+            with _state_lock:
+                state = TeamRaceScoring.load_state(race["id"])
+                if not state:
+                    continue
+                if athlete_id not in state.registrations:
+                    # 快取建立後才報名的選手
+                    state.registrations.update(TeamRaceScoring.fetch_registrations(seg_id, [athlete_id]))
+                    if athlete_id not in state.registrations:
+                        continue
+                if not state.offer(athlete_id, effort.get("id"), elapsed):
+                    continue
+                updated += TeamRaceScoring._save(race["id"], state, TeamRaceScoring.compute_standings(state))
+        return updated
+
+    @staticmethod
+    def submit_efforts(efforts: List[Dict[str, Any]]) -> Future:
+        """將新成績排入背景 worker"""
+        def run():
+            # 所有成績的路段賽事以一次 in_ 查詢取得
+            races_by_segment = _races_by_segment_loader()
+            races_by_segment.load_many({e.get("segment_id") for e in efforts if e.get("segment_id")})
+            for e in efforts:
+                TeamRaceScoring.apply_effort(e, races_by_segment)
+        future = _executor.submit(run)
+        future.add_done_callback(lambda f: _log_failure(f"{len(efforts)} efforts", f))
+        return future
+
+    @staticmethod
+    def submit_recompute(race_id: int) -> Optional[Future]:
+        """將完整重算排入背景 worker；同一場賽事最近已排入時略過並回傳 None"""
+        with _queue_lock:
+            if _recompute_queued.get(race_id):
+                return None
+            _recompute_queued.set(race_id, True)
+        future = _executor.submit(TeamRaceScoring.recompute, race_id)
+        future.add_done_callback(lambda f: _log_failure(f"race {race_id}", f))
+        return future
+
+    @staticmethod
+    def get_standings(race_id: int) -> List[Dict[str, Any]]:
+        """
+        讀取已寫入的團體成績。尚無資料列時回傳空陣列並於背景重算，
+        不在讀取請求中同步重算 (沒有報名或成績的賽事永遠不會產生資料列)
+        """
+        res = supabase.table("team_race_standings").select("*").eq("race_id", race_id).order("rank").execute()
+        if res.data:
+            return res.data
+        TeamRaceScoring.submit_recompute(race_id)
+        return []
+
+if __name__ == "__main__":
+    # python team_race_scoring.py <race_id>：完整重算一場賽事
+    import sys
+    for row in TeamRaceScoring.recompute(int(sys.argv[1])):
+        print(f"{row['rank']:>3}  {row['team']}  score={row['score']}  counted={row['counted']}/{row['finishers']}")
@@ -0,0 +1,70 @@
+import os
+from datetime import date
+from typing import Dict, Any, List, Optional
+from database import supabase
+from utils.ttl_cache import TTLCache
+
+# 車隊成員名單快取 (routers/teams.py /members)
+# 名單只在每日會員匯入與綁定 / 解除綁定時改變：匯入完成後以 X-Cron-Secret 呼叫 POST /api/teams/roster/invalidate，
+# 綁定事件由 routers/auth.py 呼叫 invalidate()；TTL 只是保險
+ROSTER_TTL = int(os.getenv("TEAM_ROSTER_TTL", str(6 * 3600)))
+_roster_cache = TTLCache(ttl=ROSTER_TTL, maxsize=512)
+
+# 排序：付費車隊管理員 > 隊長 > 其他
+ROLE_ORDER = ["付費車隊管理員", "隊長"]
+
+def _age(birthday: Any, today: date) -> Optional[int]:
+    if not birthday:
+        return None
+    try:
+        birth_date = date.fromisoformat(str(birthday)[:10])
+    except ValueError:
+        return None
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+def _role_rank(role: str) -> int:
+    return next((i for i, r in enumerate(ROLE_ORDER) if r in role), len(ROLE_ORDER))
+
+def build_roster(team_name: str, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """以 team_roster view (migrations/020) 單一查詢組出名單，計算年齡並依角色排序"""
+    today = today or date.today()
+    res = supabase.table("team_roster").select("*").eq("team", team_name).execute()
+
+    members = []
+    for m in res.data or []:
+        sid = m.get("strava_id")
+        role = m.get("member_type") or "隊員"
+        members.append({
+            "real_name": m.get("real_name"),
+            "nickname": m.get("nickname"),
+            "age": _age(m.get("birthday"), today),
+            "self_intro": m.get("self_introduction"),
+            "skills": m.get("skills"),
+            "tcu_id": m.get("tcu_id"),
+            "member_type": role,
+            "strava_id": sid,
+            # 頭像優先使用 profile_photo，否則使用 Strava 頭像
+            "avatar": m.get("profile_photo") or (m.get("strava_avatar") if sid else None),
+        })
+    members.sort(key=lambda x: _role_rank(x["member_type"]))
+    return members
+
+def get_roster(team_name: str) -> List[Dict[str, Any]]:
+    """
+    讀取快取的車隊名單。
+    key 含日期，跨日後自動重建，年齡不會過期。
+    """
+    today = date.today()
+    key = (team_name, today)
+    roster = _roster_cache.get(key)
+    if roster is None:
+        roster = build_roster(team_name, today)
+        _roster_cache.set(key, roster)
+    return roster
+
+def invalidate(team_name: Optional[str] = None):
+    """清除指定車隊 (未指定時為全部) 的名單快取"""
+    if team_name is None:
+        _roster_cache.clear()
+    else:
+        _roster_cache.invalidate_where(lambda key: key[0] == team_name)
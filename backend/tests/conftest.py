@@ -0,0 +1,8 @@
+import os
+import sys
+
+# database.py 在 import 時建立 Supabase client，測試只需要格式正確的設定值 (不會實際連線)
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
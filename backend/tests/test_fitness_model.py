@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from utils.fitness_model import propagate, K_CTL, K_ATL
+
+def test_propagate_matches_recurrence():
+    tss = np.array([100.0, 0.0, 50.0, 0.0, 0.0])
+    ctl, atl, tsb = propagate(tss, 40.0, 60.0)
+
+    c, a = 40.0, 60.0
+    for i, t in enumerate(tss):
+        assert tsb[i] == pytest.approx(c - a)
+        c += (t - c) * K_CTL
+        a += (t - a) * K_ATL
+        assert ctl[i] == pytest.approx(c)
+        assert atl[i] == pytest.approx(a)
+
+def test_propagate_decays_without_training():
+    ctl, atl, _ = propagate(np.zeros(7), 50.0, 50.0)
+    assert np.all(np.diff(ctl) < 0)
+    assert atl[-1] < ctl[-1]   # ATL 時間常數較短，衰減較快
+
+def test_propagate_can_resume_from_any_day():
+    tss = np.array([80.0, 0.0, 120.0, 30.0, 0.0, 60.0])
+    ctl, atl, tsb = propagate(tss)
+    ctl2, atl2, tsb2 = propagate(tss[3:], ctl[2], atl[2])
+    np.testing.assert_allclose(ctl2, ctl[3:])
+    np.testing.assert_allclose(atl2, atl[3:])
+    np.testing.assert_allclose(tsb2, tsb[3:])
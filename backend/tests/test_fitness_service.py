@@ -0,0 +1,116 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import fitness_service
+from fitness_service import FitnessService
+from utils.fitness_model import propagate
+
+class FakeQuery:
+    """athlete_fitness_daily 的最小記憶體替身，只支援 apply_tss 使用到的查詢"""
+
+    def __init__(self, store):
+        self.store = store
+        self.filters = []
+        self.desc = False
+        self.limit_n = None
+        self.window = None
+        self.upsert_rows = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, col, value):
+        self.filters.append(lambda r: r[col] == value)
+        return self
+
+    def lt(self, col, value):
+        self.filters.append(lambda r: r[col] < value)
+        return self
+
+    def gte(self, col, value):
+        self.filters.append(lambda r: r[col] >= value)
+        return self
+
+    def order(self, col, desc=False):
+        self.desc = desc
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end)
+        return self
+
+    def upsert(self, rows):
+        self.upsert_rows = rows
+        return self
+
+    def execute(self):
+        if self.upsert_rows is not None:
+            for row in self.upsert_rows:
+                self.store[(row["athlete_id"], row["date"])] = dict(row)
+            return SimpleNamespace(data=self.upsert_rows)
+        rows = sorted(
+            (r for r in self.store.values() if all(f(r) for f in self.filters)),
+            key=lambda r: r["date"], reverse=self.desc,
+        )
+        if self.window:
+            rows = rows[self.window[0]:self.window[1]]
+        if self.limit_n is not None:
+            rows = rows[:self.limit_n]
+        return SimpleNamespace(data=[dict(r) for r in rows])
+
+@pytest.fixture
+def store(monkeypatch):
+    rows = {}
+    monkeypatch.setattr(fitness_service, "supabase", SimpleNamespace(table=lambda name: FakeQuery(rows)))
+    return rows
+
+def _series(store, athlete_id=1):
+    return sorted((r for r in store.values() if r["athlete_id"] == athlete_id), key=lambda r: r["date"])
+
+def test_apply_tss_on_empty_history_starts_from_zero(store):
+    day = date.today() - timedelta(days=2)
+    FitnessService.apply_tss(1, day, 100)
+
+    rows = _series(store)
+    assert [r["date"] for r in rows] == [(day + timedelta(days=i)).isoformat() for i in range(3)]
+    ctl, atl, _ = propagate(np.array([100.0, 0.0, 0.0]))
+    assert rows[-1]["ctl"] == pytest.approx(round(ctl[-1], 2))
+    assert rows[-1]["atl"] == pytest.approx(round(atl[-1], 2))
+
+def test_apply_tss_after_gap_decays_seed_and_fills_missing_days(store):
+    today = date.today()
+    seed_day = today - timedelta(days=10)
+    store[(1, seed_day.isoformat())] = {"athlete_id": 1, "date": seed_day.isoformat(), "tss": 80, "ctl": 50.0, "atl": 70.0, "tsb": 0}
+    day = today - timedelta(days=3)
+
+    FitnessService.apply_tss(1, day, 100)
+
+    rows = _series(store)
+    # 種子之後到今天每天都有紀錄，沒有缺口
+    assert [r["date"] for r in rows] == [(seed_day + timedelta(days=i)).isoformat() for i in range(11)]
+
+    tss = np.zeros(10)
+    tss[(day - seed_day).days - 1] = 100
+    ctl, atl, _ = propagate(tss, 50.0, 70.0)
+    by_date = {r["date"]: r for r in rows}
+    assert by_date[day.isoformat()]["ctl"] == pytest.approx(round(ctl[6], 2))
+    assert by_date[day.isoformat()]["atl"] == pytest.approx(round(atl[6], 2))
+    assert by_date[today.isoformat()]["ctl"] == pytest.approx(round(ctl[-1], 2))
+
+def test_remove_activity_restores_previous_series(store):
+    day = date.today() - timedelta(days=5)
+    FitnessService.apply_tss(1, day, 60)
+    before = {k: dict(v) for k, v in store.items()}
+
+    FitnessService.add_activity(1, day + timedelta(days=2), 90)
+    FitnessService.remove_activity(1, day + timedelta(days=2), 90)
+
+    # 重算以已四捨五入至 0.01 的前一天數值為起點，容許進位誤差
+    for key, row in before.items():
+        assert store[key]["ctl"] == pytest.approx(row["ctl"], abs=0.02)
+        assert store[key]["atl"] == pytest.approx(row["atl"], abs=0.02)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from utils.ftp_estimator import critical_power_fit, estimate_ftp
+from utils.power_curve import MMP_DURATIONS
+
+def _cp_curve(cp: float, w_prime: float):
+    # 依 CP 模型產生理想曲線：P(t) = CP + W'/t
+    return [int(round(cp + w_prime / d)) for d in MMP_DURATIONS]
+
+def test_critical_power_fit_recovers_model_parameters():
+    fit = critical_power_fit(_cp_curve(280, 20000))
+    assert fit["cp"] == pytest.approx(280, abs=1)
+    assert fit["w_prime"] == pytest.approx(20000, rel=0.02)
+    assert fit["r2"] > 0.999
+
+def test_critical_power_fit_needs_enough_points():
+    curve = [0] * len(MMP_DURATIONS)
+    curve[MMP_DURATIONS.index(180)] = 350
+    curve[MMP_DURATIONS.index(300)] = 320
+    assert critical_power_fit(curve) is None
+
+def test_estimate_ftp_takes_the_lower_estimate():
+    curve = _cp_curve(280, 20000)
+    result = estimate_ftp(curve)
+    p20 = curve[MMP_DURATIONS.index(1200)]
+    assert result["ftp"] == min(round(p20 * 0.95), round(result["cp"]))
+    assert result["method"] in ("cp", "p20")
+
+def test_estimate_ftp_falls_back_to_p20():
+    curve = [0] * len(MMP_DURATIONS)
+    curve[MMP_DURATIONS.index(1200)] = 300
+    assert estimate_ftp(curve) == {"ftp": 285, "method": "p20", "p20": 300, "cp": None, "w_prime": None}
+
+def test_estimate_ftp_without_power():
+    assert estimate_ftp([0] * len(MMP_DURATIONS)) is None
+    assert estimate_ftp([]) is None
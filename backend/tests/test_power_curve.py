@@ -0,0 +1,39 @@
+import numpy as np
+from utils.power_curve import compute_mmp, merge_curves, curve_to_points, MMP_DURATIONS
+
+def _brute_force_mmp(watts, durations):
+    out = []
+    for d in durations:
+        if d > len(watts):
+            out.append(0)
+            continue
+        out.append(int(round(max(np.mean(watts[i:i + d]) for i in range(len(watts) - d + 1)))))
+    return out
+
+def test_compute_mmp_matches_brute_force():
+    watts = np.random.default_rng(3).integers(0, 1000, 400).astype(np.float64)
+    durations = (1, 2, 5, 30, 60, 120, 300, 400, 600)
+    np.testing.assert_array_equal(compute_mmp(watts, durations), _brute_force_mmp(watts, durations))
+
+def test_compute_mmp_finds_best_interval():
+    watts = np.full(600, 150.0)
+    watts[200:260] = 400
+    curve = dict(zip(MMP_DURATIONS, compute_mmp(watts)))
+    assert curve[1] == 400 and curve[60] == 400
+    assert curve[120] == 275
+    assert curve[3600] == 0   # 超過活動長度
+
+def test_compute_mmp_empty_stream():
+    assert not compute_mmp(np.zeros(0)).any()
+
+def test_merge_curves_takes_elementwise_max_and_skips_invalid():
+    size = len(MMP_DURATIONS)
+    a = [300] * size
+    b = [250] * size
+    b[0] = 900
+    merged = merge_curves([a, None, [1, 2, 3], b])
+    assert merged[0] == 900 and merged[1] == 300
+
+def test_curve_to_points_drops_unreached_durations():
+    points = curve_to_points([500, 0], durations=(1, 2))
+    assert points == [{"duration": 1, "watts": 500}]
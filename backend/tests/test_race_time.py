@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+import pytest
+from utils.race_time import parse_race_time, in_race_window
+
+def test_parse_race_time_normalizes_formats():
+    expected = datetime(2026, 10, 1, 8, 30, tzinfo=timezone.utc)
+    assert parse_race_time("2026-10-01T08:30:00Z") == expected
+    assert parse_race_time("2026-10-01T08:30:00+00:00") == expected
+    assert parse_race_time("2026-10-01 16:30:00+08") == expected
+    assert parse_race_time("2026-10-01T08:30:00") == expected
+    assert parse_race_time("2026-10-01T08:30:00.1234+00:00").microsecond == 123400
+    assert parse_race_time(None) is None
+
+def test_date_only_end_covers_the_whole_day():
+    assert parse_race_time("2026-10-31") == datetime(2026, 10, 31, tzinfo=timezone.utc)
+    assert parse_race_time("2026-10-31", end_of_day=True).hour == 23
+    assert in_race_window("2026-10-31T18:00:00Z", "2026-10-01", "2026-10-31")
+
+def test_in_race_window_respects_offsets():
+    # 台灣時間 11/01 07:00 = UTC 10/31 23:00，仍在 UTC 結束時間之前
+    assert in_race_window("2026-11-01T07:00:00+08:00", "2026-10-01T00:00:00+00:00", "2026-10-31T23:30:00+00:00")
+    assert not in_race_window("2026-11-01T08:00:00+08:00", "2026-10-01T00:00:00+00:00", "2026-10-31T23:30:00+00:00")
+    assert not in_race_window("2026-09-30T23:59:59Z", "2026-10-01T00:00:00Z", None)
+    assert in_race_window(None, "2026-10-01", "2026-10-31")
+
+def test_parse_race_time_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_race_time("not a date")
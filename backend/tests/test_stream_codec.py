@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from utils.stream_codec import (
+    encode_streams, decode_streams, decoded_to_json, to_pg_bytea, from_pg_bytea,
+    ENC_RAW, ENC_DELTA, ENC_DELTA_VARINT, _encode_payload,
+)
+
+def _sample_streams(n=600, seed=7):
+    rng = np.random.default_rng(seed)
+    time = np.arange(n)
+    distance = np.round(np.cumsum(rng.uniform(5, 12, n)), 1)
+    altitude = np.round(100 + np.cumsum(rng.normal(0, 0.3, n)), 1)
+    latlng = np.round(np.column_stack([
+        25.03 + np.cumsum(rng.normal(0, 1e-5, n)),
+        121.56 + np.cumsum(rng.normal(0, 1e-5, n)),
+    ]), 6)
+    return [
+        {"type": "time", "data": time.tolist()},
+        {"type": "watts", "data": rng.integers(0, 900, n).tolist()},
+        {"type": "distance", "data": distance.tolist()},
+        {"type": "altitude", "data": altitude.tolist()},
+        {"type": "velocity_smooth", "data": np.round(rng.uniform(0, 15, n), 3).tolist()},
+        {"type": "latlng", "data": latlng.tolist()},
+        {"type": "moving", "data": (rng.random(n) > 0.1).tolist()},
+    ]
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_preserves_values(compress):
+    streams = _sample_streams()
+    decoded = decode_streams(encode_streams(streams, compress=compress))
+
+    assert list(decoded) == [s["type"] for s in streams]
+    for s in streams:
+        np.testing.assert_allclose(np.asarray(decoded[s["type"]], dtype=np.float64), np.asarray(s["data"], dtype=np.float64), atol=1e-9)
+    assert decoded["latlng"].shape == (600, 2)
+    assert decoded["moving"].dtype == bool
+
+def test_key_by_type_input_matches_array_input():
+    streams = _sample_streams(n=50)
+    keyed = {s["type"]: {"data": s["data"]} for s in streams}
+    a = decode_streams(encode_streams(streams))
+    b = decode_streams(encode_streams(keyed))
+    for name in a:
+        np.testing.assert_array_equal(np.asarray(a[name]), np.asarray(b[name]))
+
+def test_nulls_round_trip_as_none():
+    streams = [{"type": "heartrate", "data": [120, None, 125, 130, None]}]
+    decoded = decode_streams(encode_streams(streams))
+    assert decoded_to_json(decoded) == [{"type": "heartrate", "data": [120, None, 125, 130, None]}]
+
+def test_monotonic_stream_uses_delta_encoding():
+    flat = np.arange(0, 100_000, 3, dtype=np.int64)
+    encoding, _, payload = _encode_payload(flat, 1)
+    assert encoding in (ENC_DELTA, ENC_DELTA_VARINT)
+    assert len(payload) < flat.astype("<i4").nbytes
+
+def test_noisy_small_integers_stay_raw():
+    # 值域在 int8 內但前後跳動大：差分不會比原始值更省空間
+    flat = np.random.default_rng(1).integers(-100, 100, 500).astype(np.int64)
+    encoding, dtype, payload = _encode_payload(flat, 1)
+    assert encoding == ENC_RAW
+    assert dtype.itemsize == 1 and len(payload) == 500
+
+def test_pg_bytea_round_trip():
+    blob = encode_streams(_sample_streams(n=20))
+    assert from_pg_bytea(to_pg_bytea(blob)) == blob
+    assert from_pg_bytea(None) is None
+
+def test_rejects_foreign_blob():
+    with pytest.raises(ValueError):
+        decode_streams(b"NOPE" + b"\0" * 8)
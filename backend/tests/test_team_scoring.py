@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from utils.team_scoring import score_teams, overall_positions, rank_within_team
+
+# 三隊：0 隊 4 人、1 隊 3 人、2 隊 2 人
+TEAMS = np.array([0, 0, 0, 0, 1, 1, 1, 2, 2])
+TIMES = np.array([300, 320, 340, 400, 290, 330, 350, 280, 310], dtype=np.float64)
+
+def test_overall_positions_share_ties():
+    np.testing.assert_array_equal(overall_positions(np.array([30.0, 10.0, 20.0, 10.0])), [3, 0, 2, 0])
+
+def test_rank_within_team():
+    np.testing.assert_array_equal(rank_within_team(TEAMS, TIMES, 3), [0, 1, 2, 3, 0, 1, 2, 0, 1])
+
+def test_top_n_sums_fastest_riders_and_ranks_incomplete_teams_last():
+    result = score_teams(TEAMS, TIMES, 3, rule="top_n", top_n=3)
+    np.testing.assert_allclose(result["score"][:2], [960, 970])
+    np.testing.assert_array_equal(result["counted"], [3, 3, 2])
+    np.testing.assert_array_equal(result["complete"], [True, True, False])
+    # 2 隊只有兩人，總時間雖最少仍排在最後
+    np.testing.assert_array_equal(result["rank"], [1, 2, 3])
+    assert not result["rider_counted"][3]
+
+def test_average_uses_every_finisher():
+    result = score_teams(TEAMS, TIMES, 3, rule="average")
+    np.testing.assert_allclose(result["score"], [340, 970 / 3, 295])
+    np.testing.assert_array_equal(result["counted"], [4, 3, 2])
+    np.testing.assert_array_equal(result["rank"], [3, 2, 1])
+
+def test_points_follow_overall_positions():
+    table = [10, 8, 6, 5, 4, 3, 2, 1]
+    result = score_teams(TEAMS, TIMES, 3, rule="points", top_n=2, points=table)
+    # 總排名：280(2) 290(1) 300(0) 310(2) 320(0) 330(1) 340(0) 350(1) 400(0)
+    np.testing.assert_allclose(result["rider_points"], [6, 4, 2, 0, 8, 3, 1, 10, 5])
+    np.testing.assert_allclose(result["score"], [10, 11, 15])
+    np.testing.assert_array_equal(result["rank"], [3, 2, 1])
+
+def test_team_without_finishers_is_ranked_last():
+    result = score_teams(np.array([0, 0]), np.array([300.0, 310.0]), 2, rule="average")
+    assert result["finishers"][1] == 0
+    np.testing.assert_array_equal(result["rank"], [1, 2])
+
+def test_unknown_rule_is_rejected():
+    with pytest.raises(ValueError):
+        score_teams(TEAMS, TIMES, 3, rule="fastest")
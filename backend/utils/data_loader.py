@@ -0,0 +1,204 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from database import supabase, get_async_db
+
+# DataLoader 風格的批次查詢：以 key 查單筆資料 (.eq("id", x)) 時改用 loader，
+# 同一個 event loop tick 內的 load() 會合併為一次 in_ 查詢，同一請求內重複的 key 只查一次。
+#
+#   loaders = Loaders()                                  # 每個請求一份 (FastAPI: Depends(get_loaders))
+#   athlete, segment = await asyncio.gather(
+#       loaders.athletes.load(athlete_id), loaders.segments.load(segment_id))
+#   profiles = await loaders.athletes.load_many(athlete_ids)   # 一次 in_ 查詢
+#
+# 背景工作 (同步) 使用 BatchLoader.load_many()，明確地一次查詢一批 key。
+
+QUERY_CHUNK = 200
+
+def _norm(key: Any) -> str:
+    # strava_id 等欄位在不同表分別為 BIGINT / TEXT，統一以字串比對
+    return str(key)
+
+def _columns_with_key(columns: str, key: str) -> str:
+    if columns.strip() == "*" or key in [c.strip() for c in columns.split(",")]:
+        return columns
+    return f"{columns}, {key}"
+
+def _group(rows: List[Dict[str, Any]], key: str) -> Dict[str, List[Dict[str, Any]]]:
+    grouped: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        grouped[_norm(row.get(key))].append(row)
+    return grouped
+
+class DataLoader:
+    """
+    單一資料表、單一欄位的 async 批次 loader。
+    many=False 時每個 key 回傳一筆 (多筆時取第一筆，找不到為 None)；many=True 時回傳 list。
+    """
+
+    def __init__(self, table: str, key: str = "id", columns: str = "*", many: bool = False):
+        self.table = table
+        self.key = key
+        self.columns = _columns_with_key(columns, key)
+        self.many = many
+        self._cache: Dict[str, asyncio.Future] = {}
+        self._queue: Dict[str, Tuple[Any, asyncio.Future]] = {}
+        # event loop 對 task 只保留弱參照：進行中的查詢需由 loader 持有，避免執行到一半被回收
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, key: Any) -> "asyncio.Future":
+        k = _norm(key)
+        future = self._cache.get(k)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[k] = future
+        if not self._queue:
+            # 等目前這一輪的其他 load() 都排入後再送出查詢
+            loop.call_soon(self._start_dispatch)
+        self._queue[k] = (key, future)
+        return future
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(k) for k in keys)))
+
+    def prime(self, key: Any, value: Any):
+        """將已取得的資料放入快取 (例如剛寫入的列)"""
+        k = _norm(key)
+        if k not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._cache[k] = future
+
+    def clear(self, key: Any = None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(_norm(key), None)
+
+    def _start_dispatch(self):
+        batch, self._queue = self._queue, {}
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._dispatch_done(t, batch))
+
+    def _dispatch_done(self, task: asyncio.Task, batch: Dict[str, Tuple[Any, asyncio.Future]]):
+        """查詢 task 結束：被取消或拋出未處理的例外時轉交給仍在等待的 future"""
+        self._tasks.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if not task.cancelled() and error is None:
+            return
+        for k, (_, future) in batch.items():
+            if self._cache.get(k) is future:
+                self._cache.pop(k)
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    async def _dispatch(self, batch: Dict[str, Tuple[Any, asyncio.Future]]):
+        keys = [original for original, _ in batch.values()]
+        try:
+            db = get_async_db()
+            rows: List[Dict[str, Any]] = []
+            for i in range(0, len(keys), QUERY_CHUNK):
+                res = await db.table(self.table).select(self.columns).in_(self.key, keys[i:i + QUERY_CHUNK]).execute()
+                rows.extend(res.data or [])
+        except Exception as e:
+            for k, (_, future) in batch.items():
+                self._cache.pop(k, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        grouped = _group(rows, self.key)
+        for k, (_, future) in batch.items():
+            if not future.done():
+                found = grouped.get(k, [])
+                future.set_result(found if self.many else (found[0] if found else None))
+
+class BatchLoader:
+    """
+    同步版本，給背景工作與 thread pool 內的程式使用。
+    load_many() 一次以 in_ 查詢所有尚未快取的 key；同一個 loader 內重複的 key 不會再查。
+    """
+
+    def __init__(self, table: str, key: str = "id", columns: str = "*", many: bool = False):
+        self.table = table
+        self.key = key
+        self.columns = _columns_with_key(columns, key)
+        self.many = many
+        self._cache: Dict[str, Any] = {}
+
+    def load_many(self, keys: Iterable[Any]) -> List[Any]:
+        keys = list(keys)
+        missing = list({_norm(k): k for k in keys if _norm(k) not in self._cache}.values())
+        for i in range(0, len(missing), QUERY_CHUNK):
+            chunk = missing[i:i + QUERY_CHUNK]
+            res = supabase.table(self.table).select(self.columns).in_(self.key, chunk).execute()
+            grouped = _group(res.data or [], self.key)
+            for k in chunk:
+                found = grouped.get(_norm(k), [])
+                self._cache[_norm(k)] = found if self.many else (found[0] if found else None)
+        return [self._cache[_norm(k)] for k in keys]
+
+    def load(self, key: Any) -> Any:
+        return self.load_many([key])[0]
+
+    def prime(self, key: Any, value: Any):
+        self._cache.setdefault(_norm(key), value)
+
+    def clear(self, key: Any = None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(_norm(key), None)
+
+class Loaders:
+    """
+    一個請求內共用的 loader 集合 (不可跨請求共用，快取不會失效)。
+    常用的查詢以屬性提供，其他表以 get() 建立。
+    """
+
+    def __init__(self):
+        self._loaders: Dict[Hashable, DataLoader] = {}
+
+    def get(self, table: str, key: str = "id", columns: str = "*", many: bool = False) -> DataLoader:
+        cache_key = (table, key, columns, many)
+        loader = self._loaders.get(cache_key)
+        if loader is None:
+            loader = self._loaders[cache_key] = DataLoader(table, key, columns, many)
+        return loader
+
+    @property
+    def athletes(self) -> DataLoader:
+        return self.get("athletes")
+
+    @property
+    def segments(self) -> DataLoader:
+        return self.get("segments")
+
+    @property
+    def tcu_members_by_account(self) -> DataLoader:
+        return self.get("tcu_members", "account")
+
+    @property
+    def tcu_members_by_email(self) -> DataLoader:
+        return self.get("tcu_members", "email")
+
+    @property
+    def bindings_by_strava_id(self) -> DataLoader:
+        return self.get("strava_member_bindings", "strava_id")
+
+    @property
+    def bindings_by_email(self) -> DataLoader:
+        return self.get("strava_member_bindings", "tcu_member_email")
+
+def get_loaders() -> Loaders:
+    """FastAPI dependency：每個請求一份新的 Loaders"""
+    return Loaders()
@@ -0,0 +1,67 @@
+import numpy as np
+from typing import Any, Dict, Optional
+from utils.streams import extract_stream, to_array
+
+# 路段 effort 的配速剖面：以 Strava effort 的 start_index / end_index 切出 streams 視窗，
+# 再以「路段距離的固定比例」重新取樣，同一路段的所有 effort 都對齊到相同的格點，
+# 兩兩比較時只需逐點相減，不必重新讀取完整活動 streams。
+
+PROFILE_VERSION = 1
+PROFILE_POINTS = 100   # 每 1% 路段距離一個區間
+
+def _cumulative(values: np.ndarray, dt: np.ndarray) -> np.ndarray:
+    """以時間加權的累積量 (例如功率 -> 焦耳)，長度與樣本數相同"""
+    return np.concatenate(([0.0], np.cumsum(values[1:] * dt)))
+
+def build_profile(streams: Any, start_index: int, end_index: int, points: int = PROFILE_POINTS) -> Optional[Dict[str, Any]]:
+    """
+    切出 [start_index, end_index] 的樣本並依距離降採樣為 points 個區間。
+    回傳：
+        distance   每個區間終點距路段起點的距離 (m)
+        time       到達該點的經過秒數
+        watts / heartrate / speed   區間內的時間加權平均 (無該 stream 時為 None)
+    沒有 distance / time stream 或視窗不合理時回傳 None。
+    """
+    distance = to_array(extract_stream(streams, "distance"))
+    time = to_array(extract_stream(streams, "time"))
+    end = min(int(end_index), len(distance) - 1, len(time) - 1)
+    start = int(start_index)
+    if start < 0 or end - start < 2:
+        return None
+
+    d = distance[start:end + 1] - distance[start]
+    t = time[start:end + 1] - time[start]
+    # 距離需單調遞增才能內插 (GPS 偶有回退)
+    d = np.maximum.accumulate(d)
+    total = float(d[-1])
+    if total <= 0:
+        return None
+
+    dt = np.diff(t)
+    edges = np.linspace(0, total, points + 1)
+    t_edges = np.interp(edges, d, t)
+    bin_time = np.diff(t_edges)
+
+    profile: Dict[str, Any] = {
+        "points": points,
+        "distance": np.round(edges[1:], 1).tolist(),
+        "time": np.round(t_edges[1:], 1).tolist(),
+        "speed": None,
+        "watts": None,
+        "heartrate": None,
+    }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(bin_time > 0, np.diff(edges) / bin_time, 0)
+    profile["speed"] = np.round(speed, 2).tolist()
+
+    for name in ("watts", "heartrate"):
+        values = to_array(extract_stream(streams, name))
+        if len(values) <= end:
+            continue
+        window = values[start:end + 1]
+        cum = np.interp(edges, d, _cumulative(window, dt))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg = np.where(bin_time > 0, np.diff(cum) / bin_time, 0)
+        profile[name] = np.round(avg).astype(int).tolist()
+
+    return profile
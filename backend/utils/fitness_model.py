@@ -0,0 +1,33 @@
+import math
+import numpy as np
+from typing import Tuple
+
+# Performance Management Chart 常數
+CTL_DAYS = 42  # 體能 (Chronic Training Load) 時間常數
+ATL_DAYS = 7   # 疲勞 (Acute Training Load) 時間常數
+
+K_CTL = 1 - math.exp(-1 / CTL_DAYS)
+K_ATL = 1 - math.exp(-1 / ATL_DAYS)
+
+def propagate(daily_tss: np.ndarray, ctl0: float = 0.0, atl0: float = 0.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    由前一天的 CTL/ATL 起算，依指數遞迴往後推算每日數值：
+        CTL[t] = CTL[t-1] + (TSS[t] - CTL[t-1]) x k_ctl
+        ATL[t] = ATL[t-1] + (TSS[t] - ATL[t-1]) x k_atl
+        TSB[t] = CTL[t-1] - ATL[t-1]   (當天訓練前的狀態)
+    只需要變動日前一天的狀態即可重算，不必從頭累加。
+    """
+    n = len(daily_tss)
+    ctl = np.empty(n, dtype=np.float64)
+    atl = np.empty(n, dtype=np.float64)
+    tsb = np.empty(n, dtype=np.float64)
+
+    c, a = ctl0, atl0
+    for i in range(n):
+        tsb[i] = c - a
+        tss = daily_tss[i]
+        c += (tss - c) * K_CTL
+        a += (tss - a) * K_ATL
+        ctl[i] = c
+        atl[i] = a
+    return ctl, atl, tsb
@@ -0,0 +1,66 @@
+import numpy as np
+from typing import Dict, Any, Optional, Sequence
+from utils.power_curve import MMP_DURATIONS
+
+# 由 MMP 曲線估計 FTP：
+# 1. 臨界功率 (CP) 模型：做功 = CP x t + W'，以 3 ~ 20 分鐘的最佳功率線性迴歸
+# 2. 資料不足以擬合時，退回 20 分鐘最佳功率 x 95%
+
+P20_FACTOR = 0.95
+CP_MIN_DURATION = 180
+CP_MAX_DURATION = 1200
+CP_MIN_POINTS = 3
+P20_DURATION = 1200
+
+_DURATIONS = np.asarray(MMP_DURATIONS, dtype=np.float64)
+
+def critical_power_fit(curve: Sequence[int], min_duration: int = CP_MIN_DURATION, max_duration: int = CP_MAX_DURATION) -> Optional[Dict[str, float]]:
+    """
+    以 work = CP x t + W' 線性迴歸擬合臨界功率。
+    回傳 { cp, w_prime, r2 }；有效點數不足或結果不合理 (CP 或 W' 非正值) 時回傳 None。
+    """
+    power = np.asarray(curve, dtype=np.float64)
+    if len(power) != len(_DURATIONS):
+        return None
+    mask = (_DURATIONS >= min_duration) & (_DURATIONS <= max_duration) & (power > 0)
+    if mask.sum() < CP_MIN_POINTS:
+        return None
+
+    t = _DURATIONS[mask]
+    work = power[mask] * t
+    cp, w_prime = np.polyfit(t, work, 1)
+    if cp <= 0 or w_prime <= 0:
+        return None
+
+    predicted = cp * t + w_prime
+    ss_res = float(np.sum((work - predicted) ** 2))
+    ss_tot = float(np.sum((work - work.mean()) ** 2))
+    r2 = 1 - ss_res / ss_tot if ss_tot > 0 else 0.0
+    return {"cp": float(cp), "w_prime": float(w_prime), "r2": r2}
+
+def estimate_ftp(curve: Sequence[int]) -> Optional[Dict[str, Any]]:
+    """
+    回傳 { ftp, method, p20, cp, w_prime }，method 為 'cp' 或 'p20'。
+    CP 一般略高於 FTP，與 20 分鐘 x 95% 取較低者以免高估。
+    """
+    if not curve or len(curve) != len(_DURATIONS):
+        return None
+    p20 = int(curve[MMP_DURATIONS.index(P20_DURATION)])
+    fit = critical_power_fit(curve)
+
+    candidates = []
+    if p20 > 0:
+        candidates.append((p20 * P20_FACTOR, "p20"))
+    if fit:
+        candidates.append((fit["cp"], "cp"))
+    if not candidates:
+        return None
+
+    ftp, method = min(candidates)
+    return {
+        "ftp": int(round(ftp)),
+        "method": method,
+        "p20": p20 or None,
+        "cp": round(fit["cp"], 1) if fit else None,
+        "w_prime": int(round(fit["w_prime"])) if fit else None,
+    }
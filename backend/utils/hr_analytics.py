@@ -0,0 +1,169 @@
+import numpy as np
+from typing import List, Optional, Sequence, Dict, Any
+
+# 心率區間 (% 最大心率)，與 migrations/power_zone_functions.sql 的 calculate_hr_zones() 一致
+HR_ZONES = [
+    {"zone": 1, "name": "恢復區", "min_pct": 0.50, "max_pct": 0.60},
+    {"zone": 2, "name": "有氧區", "min_pct": 0.60, "max_pct": 0.70},
+    {"zone": 3, "name": "節奏區", "min_pct": 0.70, "max_pct": 0.80},
+    {"zone": 4, "name": "閾值區", "min_pct": 0.80, "max_pct": 0.90},
+    {"zone": 5, "name": "無氧區", "min_pct": 0.90, "max_pct": 1.00},
+]
+
+DEFAULT_MAX_HR = 190   # 與 athletes.max_heartrate 預設值一致
+DEFAULT_REST_HR = 60
+LTHR_PCT = 0.90        # 未設定乳酸閾值心率時以最大心率的 90% 估計
+
+# Banister TRIMP 係數 (男 / 女)
+TRIMP_COEFFICIENTS = {"M": (0.64, 1.92), "F": (0.86, 1.67)}
+
+def zone_upper_bounds(max_hr: float) -> List[float]:
+    """由最大心率計算 Z1 ~ Z4 的上限 (Z5 無上限)"""
+    return [round(max_hr * z["max_pct"]) for z in HR_ZONES[:-1]]
+
+def zone_bounds_from_strava(strava_zones: Any) -> Optional[List[float]]:
+    """
+    從 strava_streams.strava_zones 取出心率區間上限。
+    格式可能為 [{ "type": "heartrate", "distribution_buckets": [{min, max, time}, ...] }]
+    或直接為 buckets 陣列；區間數與 HR_ZONES 不同時回傳 None 改用最大心率計算。
+    """
+    if not strava_zones or not isinstance(strava_zones, list):
+        return None
+    buckets = strava_zones
+    if isinstance(strava_zones[0], dict) and "distribution_buckets" in strava_zones[0]:
+        hr_entry = next((z for z in strava_zones if z.get("type") == "heartrate"), None)
+        if not hr_entry:
+            return None
+        buckets = hr_entry.get("distribution_buckets") or []
+    if len(buckets) != len(HR_ZONES):
+        return None
+    try:
+        return [float(b["max"]) for b in buckets[:-1]]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _trimp_weights(hrr: np.ndarray, sex: np.ndarray) -> np.ndarray:
+    a = np.where(sex == 1, TRIMP_COEFFICIENTS["F"][0], TRIMP_COEFFICIENTS["M"][0])
+    b = np.where(sex == 1, TRIMP_COEFFICIENTS["F"][1], TRIMP_COEFFICIENTS["M"][1])
+    return hrr * a * np.exp(b * hrr)
+
+def analyze_batch(
+    hr_streams: Sequence[np.ndarray],
+    max_hrs: Sequence[float],
+    rest_hrs: Optional[Sequence[float]] = None,
+    zone_bounds: Optional[Sequence[Optional[Sequence[float]]]] = None,
+    output_streams: Optional[Sequence[Optional[np.ndarray]]] = None,
+    sexes: Optional[Sequence[Optional[str]]] = None,
+    lthrs: Optional[Sequence[Optional[float]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    一次分析多筆活動的心率 (每秒一筆)。
+    所有活動串接為單一陣列並以活動索引分組，區間秒數、TRIMP、平均值與前後半段統計
+    都以 np.bincount 一次完成，不需逐活動迴圈，適合大量回補。
+
+    output_streams: 與心率對齊的功率 (或速度)，用於計算 Pa:Hr decoupling；無則只算心率漂移
+    回傳每筆活動的 dict：
+        avg_heartrate, hr_zone_seconds, trimp, hr_tss, hr_drift, decoupling
+    """
+    n_act = len(hr_streams)
+    if n_act == 0:
+        return []
+
+    n_zones = len(HR_ZONES)
+    max_hr = np.asarray([m or DEFAULT_MAX_HR for m in max_hrs], dtype=np.float64)
+    rest_hr = np.asarray([r or DEFAULT_REST_HR for r in rest_hrs] if rest_hrs else [DEFAULT_REST_HR] * n_act, dtype=np.float64)
+    sex = np.asarray([1 if (s or "").upper() == "F" else 0 for s in sexes] if sexes else [0] * n_act)
+    lthr = np.asarray(
+        [l or m * LTHR_PCT for l, m in zip(lthrs, max_hr)] if lthrs else max_hr * LTHR_PCT,
+        dtype=np.float64,
+    )
+    bounds = np.asarray([
+        list(b) if b else zone_upper_bounds(m)
+        for b, m in zip(zone_bounds or [None] * n_act, max_hr)
+    ], dtype=np.float64)
+
+    lengths = np.asarray([len(h) for h in hr_streams], dtype=np.int64)
+    hr = np.concatenate([np.asarray(h, dtype=np.float64) for h in hr_streams]) if lengths.sum() else np.zeros(0)
+    seg = np.repeat(np.arange(n_act), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    pos = np.arange(len(hr)) - starts[seg]
+    half = (pos >= (lengths[seg] // 2)).astype(np.int64)
+
+    valid = hr > 0
+    hr_v, seg_v, half_v = hr[valid], seg[valid], half[valid]
+
+    # 區間秒數：每個樣本與所屬活動的區間上限比較 (Z5 為超過所有上限)
+    zone_idx = (hr_v[:, None] > bounds[seg_v]).sum(axis=1)
+    zone_seconds = np.bincount(seg_v * n_zones + zone_idx, minlength=n_act * n_zones).reshape(n_act, n_zones)
+
+    counts = np.bincount(seg_v, minlength=n_act)
+    hr_sum = np.bincount(seg_v, weights=hr_v, minlength=n_act)
+
+    # Banister TRIMP (每秒權重 / 60 = 分鐘)
+    span = np.maximum(max_hr - rest_hr, 1)
+    hrr = np.clip((hr_v - rest_hr[seg_v]) / span[seg_v], 0, 1)
+    trimp = np.bincount(seg_v, weights=_trimp_weights(hrr, sex[seg_v]), minlength=n_act) / 60
+
+    # hrTSS：TRIMP 相對於在乳酸閾值心率騎一小時的 TRIMP
+    hrr_lthr = np.clip((lthr - rest_hr) / span, 0, 1)
+    trimp_lthr_hour = _trimp_weights(hrr_lthr, sex) * 60
+    hr_tss = np.where(trimp_lthr_hour > 0, trimp / np.maximum(trimp_lthr_hour, 1e-9) * 100, 0)
+
+    # 前後半段心率
+    half_key = seg_v * 2 + half_v
+    half_cnt = np.bincount(half_key, minlength=n_act * 2).reshape(n_act, 2)
+    half_hr = np.bincount(half_key, weights=hr_v, minlength=n_act * 2).reshape(n_act, 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        half_avg = half_hr / half_cnt
+        drift = (half_avg[:, 1] - half_avg[:, 0]) / half_avg[:, 0] * 100
+
+    # Pa:Hr decoupling：前後半段 (輸出 / 心率) 效率比的下降百分比
+    decoupling = np.full(n_act, np.nan)
+    if output_streams is not None:
+        out = np.concatenate([
+            np.asarray(o, dtype=np.float64) if o is not None and len(o) == l else np.full(l, np.nan)
+            for o, l in zip(output_streams, lengths)
+        ]) if lengths.sum() else np.zeros(0)
+        out_v = out[valid]
+        has_out = ~np.isnan(out_v)
+        key = half_key[has_out]
+        out_sum = np.bincount(key, weights=out_v[has_out], minlength=n_act * 2).reshape(n_act, 2)
+        hr_sum_o = np.bincount(key, weights=hr_v[has_out], minlength=n_act * 2).reshape(n_act, 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ef = out_sum / hr_sum_o
+            decoupling = (ef[:, 0] - ef[:, 1]) / ef[:, 0] * 100
+
+    results = []
+    for i in range(n_act):
+        if counts[i] == 0:
+            results.append({
+                "avg_heartrate": None,
+                "hr_zone_seconds": None,
+                "trimp": None,
+                "hr_tss": None,
+                "hr_drift": None,
+                "decoupling": None,
+            })
+            continue
+        results.append({
+            "avg_heartrate": int(round(hr_sum[i] / counts[i])),
+            "hr_zone_seconds": zone_seconds[i].tolist(),
+            "trimp": round(float(trimp[i]), 1),
+            "hr_tss": round(float(hr_tss[i]), 1),
+            "hr_drift": round(float(drift[i]), 2) if np.isfinite(drift[i]) else None,
+            "decoupling": round(float(decoupling[i]), 2) if np.isfinite(decoupling[i]) else None,
+        })
+    return results
+
+def hr_zone_seconds(hr: np.ndarray, max_hr: float) -> List[int]:
+    """各心率區間秒數 (Z1 ~ Z5)，低於 Z1 下限者計入 Z1，高於最大心率者計入 Z5"""
+    result = analyze_batch([hr], [max_hr])[0]
+    return result["hr_zone_seconds"] or [0] * len(HR_ZONES)
+
+def banister_trimp(hr: np.ndarray, max_hr: float, rest_hr: float = DEFAULT_REST_HR) -> float:
+    """
+    Banister TRIMP (男性係數 0.64 / 1.92)：
+        sum( 分鐘 x HRr x 0.64 x e^(1.92 x HRr) ), HRr = (HR - 安靜心率) / (最大心率 - 安靜心率)
+    """
+    result = analyze_batch([hr], [max_hr], [rest_hr])[0]
+    return result["trimp"] or 0.0
@@ -1,14 +1,92 @@
-import os
-import polyline
-from staticmap import StaticMap, Line
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from staticmap import Line
+from PIL import Image, ImageDraw
 import io
+from utils.render_assets import get_font, bottom_shade
+from utils.render_cache import render_key
+from utils.renditions import make_rendition
+from utils.route_geometry import decode, simplify_latlon
+from utils.tile_cache import CachedStaticMap
 
 # 設定
 OG_WIDTH = 1200
 OG_HEIGHT = 630
 TCU_ORANGE = (252, 82, 0) # Strava Orange
-FONT_PATH = os.path.join(os.path.dirname(__file__), "..", "assets", "fonts", "NotoSansTC-Bold.otf")
+TITLE_FONT_SIZE = 72
+META_FONT_SIZE = 42
+SHADE_MAX_ALPHA = 180 # 底部遮罩最大透明度 (大約 70%)
+
+# 版面、底圖或繪製方式變更時遞增，og_prerender.py 會重新產生所有賽事的 OG Image
+OG_TEMPLATE_VERSION = 1
+
+def og_image_key(race_name, polyline_str, distance_m, elevation_m):
+    """OG Image 的內容雜湊，與 team_races.og_image_hash 比對以略過未變更的賽事"""
+    return render_key(OG_TEMPLATE_VERSION, {
+        "name": race_name,
+        "polyline": polyline_str,
+        "distance": float(distance_m or 0),
+        "elevation": int(elevation_m or 0),
+    })
+
+def preload():
+    bottom_shade(OG_WIDTH, OG_HEIGHT, SHADE_MAX_ALPHA)
+    get_font(TITLE_FONT_SIZE)
+    get_font(META_FONT_SIZE)
+
+def prepare_path(polyline_str):
+    """
+    解碼 Polyline，依輸出尺寸的像素誤差簡化 (長路線可從數千點降到數百點)，
+    回傳 staticmap 使用的 (lon, lat) 座標列表。
+    """
+    latlon = decode(polyline_str)
+    if len(latlon) == 0:
+        raise ValueError("Invalid polyline")
+    latlon = simplify_latlon(latlon, OG_WIDTH, OG_HEIGHT)
+    return latlon[:, ::-1].tolist()
+
+def draw_race_og_image(race_name, path, distance_m, elevation_m, tile_cache=None):
+    """繪製地圖底圖、路線、遮罩與文字，回傳 RGB Image"""
+    # 1. 建立靜態地圖
+    # CartoDB 深色底圖，圖磚經由本機快取 (utils/tile_cache.py)，相同區域重複渲染不需連網
+    m = CachedStaticMap(OG_WIDTH, OG_HEIGHT, tile_cache=tile_cache)
+    
+    # 加入路段線條
+    line = Line(path, '#FC5200', 6) # TCU Orange
+    m.add_line(line)
+    
+    # 渲染地圖
+    base_img = m.render()
+    base_img = base_img.convert("RGBA")
+    
+    # 2. 疊加底部漸層遮罩 (預先產生的圖層，方便閱讀文字)
+    combined = Image.alpha_composite(base_img, bottom_shade(OG_WIDTH, OG_HEIGHT, SHADE_MAX_ALPHA))
+    draw = ImageDraw.Draw(combined)
+    
+    # 3. 繪製文字 (字型每個行程只載入一次)
+    title_font = get_font(TITLE_FONT_SIZE)
+    meta_font = get_font(META_FONT_SIZE)
+        
+    # 繪製標題 (賽事名稱)
+    # 限制長度
+    display_name = race_name[:20] + "..." if len(race_name) > 20 else race_name
+    draw.text((60, OG_HEIGHT - 180), display_name, font=title_font, fill=(255, 255, 255))
+    
+    # 繪製數據 (里程 & 爬升)
+    dist_km = f"{distance_m / 1000:.1f} km"
+    elev_m = f"{int(elevation_m)} m"
+    stats_text = f"距離 {dist_km}  |  總爬升 {elev_m}"
+    
+    # 數據底下的橘色小條
+    draw.rectangle([60, OG_HEIGHT - 90, 100, OG_HEIGHT - 85], fill=TCU_ORANGE)
+    draw.text((120, OG_HEIGHT - 105), stats_text, font=meta_font, fill=(200, 200, 200))
+    
+    # 加上 TCU 水印
+    draw.text((OG_WIDTH - 250, 40), "TCU 賽事小幫手", font=meta_font, fill=(255, 255, 255, 120))
+    return combined.convert("RGB")
+
+def encode_jpeg(img):
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='JPEG', quality=85)
+    return img_byte_arr.getvalue()
 
 def generate_race_og_image(race_name, polyline_str, distance_m, elevation_m):
     """
@@ -16,69 +94,28 @@ def generate_race_og_image(race_name, polyline_str, distance_m, elevation_m):
     回傳圖片的 bytes。
     """
     try:
-        # 1. 解碼 Polyline
-        path = polyline.decode(polyline_str)
-        if not path:
-            raise ValueError("Invalid polyline")
-            
-        # 2. 建立靜態地圖
-        # 使用 OpenStreetMap 或 CartoDB 樣式
-        # 由於是背景，我們可以使用比較深色的底圖或標準地圖
-        m = StaticMap(OG_WIDTH, OG_HEIGHT, url_template='https://basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png')
-        
-        # 加入路段線條
-        line = Line(path, '#FC5200', 6) # TCU Orange
-        m.add_line(line)
-        
-        # 渲染地圖
-        base_img = m.render()
-        base_img = base_img.convert("RGBA")
-        
-        # 3. 疊加遮罩與漸層 (底部深色方便閱讀文字)
-        overlay = Image.new('RGBA', (OG_WIDTH, OG_HEIGHT), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-        
-        # 繪製底部漸層
-        for y in range(OG_HEIGHT // 2, OG_HEIGHT):
-            alpha = int((y - (OG_HEIGHT // 2)) / (OG_HEIGHT // 2) * 180) # 最大透明度 180 (大約 70%)
-            draw.line([(0, y), (OG_WIDTH, y)], fill=(0, 0, 0, alpha))
-            
-        # 合併遮罩
-        combined = Image.alpha_composite(base_img, overlay)
-        draw = ImageDraw.Draw(combined)
-        
-        # 4. 繪製文字
-        try:
-            # 嘗試載入字體
-            title_font = ImageFont.truetype(FONT_PATH, 72)
-            meta_font = ImageFont.truetype(FONT_PATH, 42)
-        except Exception as e:
-            print(f"Font load error: {e}. Falling back to default.")
-            title_font = ImageFont.load_default()
-            meta_font = ImageFont.load_default()
-            
-        # 繪製標題 (賽事名稱)
-        # 限制長度
-        display_name = race_name[:20] + "..." if len(race_name) > 20 else race_name
-        draw.text((60, OG_HEIGHT - 180), display_name, font=title_font, fill=(255, 255, 255))
-        
-        # 繪製數據 (里程 & 爬升)
-        dist_km = f"{distance_m / 1000:.1f} km"
-        elev_m = f"{int(elevation_m)} m"
-        stats_text = f"距離 {dist_km}  |  總爬升 {elev_m}"
-        
-        # 數據底下的橘色小條
-        draw.rectangle([60, OG_HEIGHT - 90, 100, OG_HEIGHT - 85], fill=TCU_ORANGE)
-        draw.text((120, OG_HEIGHT - 105), stats_text, font=meta_font, fill=(200, 200, 200))
-        
-        # 加上 TCU 水印
-        draw.text((OG_WIDTH - 250, 40), "TCU 賽事小幫手", font=meta_font, fill=(255, 255, 255, 120))
-        
-        # 5. 輸出為 Bytes
-        img_byte_arr = io.BytesIO()
-        combined.convert("RGB").save(img_byte_arr, format='JPEG', quality=85)
-        return img_byte_arr.getvalue()
-        
+        path = prepare_path(polyline_str)
+        return encode_jpeg(draw_race_og_image(race_name, path, distance_m, elevation_m))
+    except Exception as e:
+        print(f"OG Image generation failed: {e}")
+        return None
+
+# OG Image 另外產生的 App 內版本：(尺寸, 格式)
+OG_RENDITIONS = (("card", "webp"), ("thumb", "webp"))
+
+def generate_race_og_renditions(race_name, polyline_str, distance_m, elevation_m):
+    """
+    產生 OG Image 主圖 (1200x630 JPEG) 與賽事卡片 / 縮圖用的 WebP 版本 (同一次渲染)。
+    各版本皆由記憶體中的原始圖片編碼，不經過 JPEG 再壓縮。
+    回傳 { "og.jpg": bytes, "card.webp": bytes, ... }，失敗時回傳 None。
+    """
+    try:
+        path = prepare_path(polyline_str)
+        img = draw_race_og_image(race_name, path, distance_m, elevation_m)
+        files = {"og.jpg": encode_jpeg(img)}
+        for size, fmt in OG_RENDITIONS:
+            files[f"{size}.{fmt}"] = make_rendition(img, size, fmt)
+        return files
     except Exception as e:
         print(f"OG Image generation failed: {e}")
         return None
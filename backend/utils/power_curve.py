@@ -0,0 +1,51 @@
+import numpy as np
+from typing import Iterable, List, Optional, Dict
+
+# 平均最大功率 (Mean-Maximal Power) 曲線的標準秒數：1 秒 ~ 5 小時
+# NOTE: 更動此清單時必須遞增 CURVE_VERSION，舊版本的快取曲線不會與新版本合併
+MMP_DURATIONS = (
+    1, 2, 3, 5, 8, 10, 15, 20, 30, 45,
+    60, 90, 120, 180, 240, 300, 360, 480, 600, 720,
+    900, 1200, 1500, 1800, 2400, 2700, 3600, 5400, 7200, 10800,
+    14400, 18000,
+)
+CURVE_VERSION = 1
+
+def compute_mmp(watts: np.ndarray, durations: Iterable[int] = MMP_DURATIONS) -> np.ndarray:
+    """
+    計算每個秒數的最佳平均功率。
+    使用前綴和：任一視窗總和 = cumsum[i + d] - cumsum[i]，每個秒數只需一次向量化相減與 max，
+    整體為 O(n x 秒數數量)，取代逐點展開的 O(n²)。
+    超過活動長度的秒數以 0 表示 (未達成)。
+    """
+    durations = tuple(durations)
+    curve = np.zeros(len(durations), dtype=np.int16)
+    n = len(watts)
+    if n == 0:
+        return curve
+
+    csum = np.empty(n + 1, dtype=np.float64)
+    csum[0] = 0.0
+    np.cumsum(watts, dtype=np.float64, out=csum[1:])
+
+    for i, d in enumerate(durations):
+        if d > n:
+            break
+        best = (csum[d:] - csum[:-d]).max() / d
+        curve[i] = min(int(round(best)), np.iinfo(np.int16).max)
+    return curve
+
+def merge_curves(curves: Iterable[Optional[List[int]]], size: int = len(MMP_DURATIONS)) -> np.ndarray:
+    """以逐元素取最大值合併多條曲線 (賽季 / 42 天曲線)"""
+    rows = [c for c in curves if c and len(c) == size]
+    if not rows:
+        return np.zeros(size, dtype=np.int16)
+    return np.asarray(rows, dtype=np.int16).max(axis=0)
+
+def curve_to_points(curve: Iterable[int], durations: Iterable[int] = MMP_DURATIONS) -> List[Dict[str, int]]:
+    """轉為前端圖表格式，略過未達成的秒數"""
+    return [
+        {"duration": int(d), "watts": int(w)}
+        for d, w in zip(durations, curve)
+        if w > 0
+    ]
@@ -0,0 +1,51 @@
+import numpy as np
+from typing import List
+
+# 功率區間定義 (Coggan)，與 n8n-workflows/power-analysis-code-node.js 及 calculate_power_zones() 一致
+POWER_ZONES = [
+    {"zone": 1, "name": "主動恢復", "min_pct": 0, "max_pct": 0.55},
+    {"zone": 2, "name": "耐力", "min_pct": 0.56, "max_pct": 0.75},
+    {"zone": 3, "name": "節奏", "min_pct": 0.76, "max_pct": 0.90},
+    {"zone": 4, "name": "乳酸閾值", "min_pct": 0.91, "max_pct": 1.05},
+    {"zone": 5, "name": "VO2max", "min_pct": 1.06, "max_pct": 1.20},
+    {"zone": 6, "name": "無氧", "min_pct": 1.21, "max_pct": 1.50},
+    {"zone": 7, "name": "神經肌肉", "min_pct": 1.51, "max_pct": None},
+]
+
+DEFAULT_FTP = 200
+NP_WINDOW = 30
+
+def normalized_power(watts: np.ndarray) -> int:
+    """Normalized Power：30 秒滑動平均後取 4 次方平均再開 4 次方根 (包含 0 功率)"""
+    n = len(watts)
+    if n == 0:
+        return 0
+    if n < NP_WINDOW:
+        return int(round(float(np.mean(watts))))
+    csum = np.concatenate(([0.0], np.cumsum(watts, dtype=np.float64)))
+    rolling = (csum[NP_WINDOW:] - csum[:-NP_WINDOW]) / NP_WINDOW
+    return int(round(float(np.mean(rolling ** 4)) ** 0.25))
+
+def intensity_factor(np_watts: float, ftp: float) -> float:
+    if ftp <= 0:
+        return 0.0
+    return round(np_watts / ftp, 2)
+
+def training_stress_score(np_watts: float, ftp: float, duration_seconds: float) -> float:
+    """TSS = (秒數 x NP x IF) / (FTP x 3600) x 100"""
+    if ftp <= 0 or np_watts <= 0:
+        return 0.0
+    intensity = np_watts / ftp
+    tss = (duration_seconds * np_watts * intensity) / (ftp * 3600) * 100
+    return round(tss, 1)
+
+def zone_seconds(watts: np.ndarray, ftp: float) -> List[int]:
+    """
+    各功率區間秒數 (Z1 ~ Z7)。
+    以各區間上限作為分界，避免 0.55 與 0.56 之間的四捨五入縫隙漏算秒數。
+    """
+    if len(watts) == 0 or ftp <= 0:
+        return [0] * len(POWER_ZONES)
+    upper = [round(ftp * z["max_pct"]) for z in POWER_ZONES if z["max_pct"] is not None]
+    idx = np.searchsorted(np.asarray(upper, dtype=np.float64), watts, side="left")
+    return np.bincount(idx, minlength=len(POWER_ZONES)).tolist()
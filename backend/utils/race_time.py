@@ -0,0 +1,40 @@
+import re
+from datetime import datetime, time, timezone
+from typing import Any, Optional
+
+# 車隊賽事期間的時間比較 (routers/teams.py、team_race_scoring.py 共用)
+# 賽事日期可能是 "2026-10-01"、"...Z"、或 PostgREST 回傳的 "+00:00" / 去尾零的小數秒，
+# 一律轉為帶時區的 datetime 再比較，不以字串切片比較。
+
+_FRACTION = re.compile(r"\.(\d+)")
+_SHORT_OFFSET = re.compile(r"([+-]\d{2})$")
+
+def parse_race_time(value: Any, end_of_day: bool = False) -> Optional[datetime]:
+    """
+    解析賽事或成績時間；沒有時區者視為 UTC。
+    只有日期時為當天 00:00，end_of_day=True 時為當天最後一刻 (賽期結束日包含整天)。
+    無法解析時拋出 ValueError。
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value).strip().replace("Z", "+00:00")
+        if len(text) == 10:
+            parsed = datetime.combine(datetime.fromisoformat(text).date(), time.max if end_of_day else time.min)
+        else:
+            # Python 3.10 的 fromisoformat 只接受 3 或 6 位小數秒與 ±HH:MM 時區
+            text = _FRACTION.sub(lambda m: "." + (m.group(1) + "000000")[:6], text)
+            text = _SHORT_OFFSET.sub(r"\1:00", text)
+            parsed = datetime.fromisoformat(text)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def in_race_window(started: Any, start_date: Any, end_date: Any) -> bool:
+    """成績時間是否落在賽期內 (含頭尾)；缺少的一端不限制"""
+    at = parse_race_time(started)
+    if at is None:
+        return True
+    start = parse_race_time(start_date)
+    end = parse_race_time(end_date, end_of_day=True)
+    return (start is None or at >= start) and (end is None or at <= end)
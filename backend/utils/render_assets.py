@@ -0,0 +1,71 @@
+import os
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageFont
+
+# OG / 分享卡片共用的模板素材：每個行程只載入一次
+# 字型、縮放後的 logo、漸層與遮罩圖層都以 lru_cache 保存，render process pool 啟動時先行 preload()，
+# 每次渲染只需複製底圖並疊上文字與路線。
+# NOTE: 快取的 Image 物件為共用，繪製前必須 .copy()
+
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), "..", "assets")
+FONT_PATH = os.path.join(ASSETS_DIR, "fonts", "NotoSansTC-Bold.otf")
+LOGO_PATH = os.path.join(ASSETS_DIR, "images", "logo.png")
+# 本機開發 (macOS) 沒有內附字型時的備援
+SYSTEM_FONT_PATH = "/System/Library/Fonts/HelveticaNeue.ttc"
+
+@lru_cache(maxsize=None)
+def get_font(size: int, bold: bool = True) -> ImageFont.ImageFont:
+    """依序嘗試內附 Noto Sans TC、系統字型，最後使用 Pillow 預設字型"""
+    if os.path.exists(FONT_PATH):
+        try:
+            return ImageFont.truetype(FONT_PATH, size)
+        except Exception as e:
+            print(f"Failed to load bundled font: {e}")
+    try:
+        return ImageFont.truetype(SYSTEM_FONT_PATH, size, index=1 if bold else 0)
+    except Exception:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=None)
+def get_logo(height: int) -> Image.Image:
+    """等比例縮放至指定高度的 logo (RGBA)，檔案不存在時回傳 None"""
+    if not os.path.exists(LOGO_PATH):
+        return None
+    try:
+        logo = Image.open(LOGO_PATH).convert("RGBA")
+    except Exception as e:
+        print(f"Failed to load logo: {e}")
+        return None
+    width = int(height * logo.width / logo.height)
+    return logo.resize((width, height), Image.Resampling.LANCZOS)
+
+@lru_cache(maxsize=None)
+def vertical_gradient(width: int, height: int, top: tuple, bottom: tuple) -> Image.Image:
+    """
+    由上到下的線性漸層 (RGB)。
+    以 NumPy 一次產生整張圖，取代逐行 draw.line；數值與原本 int(top - y/H x (top - bottom)) 相同。
+    """
+    t = np.arange(height, dtype=np.float64)[:, None] / height
+    top_arr = np.asarray(top, dtype=np.float64)
+    bottom_arr = np.asarray(bottom, dtype=np.float64)
+    rows = (top_arr - t * (top_arr - bottom_arr)).astype(np.uint8)           # (height, 3)
+    pixels = np.broadcast_to(rows[:, None, :], (height, width, 3))
+    return Image.fromarray(np.ascontiguousarray(pixels), "RGB")
+
+@lru_cache(maxsize=None)
+def bottom_shade(width: int, height: int, max_alpha: int) -> Image.Image:
+    """下半部由透明漸變為黑色的遮罩 (RGBA)，讓底部文字在地圖上清楚可讀"""
+    half = height // 2
+    alpha = np.zeros(height, dtype=np.uint8)
+    y = np.arange(half, height)
+    alpha[half:] = ((y - half) / half * max_alpha).astype(np.uint8)
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    pixels[:, :, 3] = alpha[:, None]
+    return Image.fromarray(pixels, "RGBA")
+
+def preload():
+    """render process pool 的 initializer：預先建立各模板用到的素材"""
+    from utils import share_card, og_generator
+    share_card.preload()
+    og_generator.preload()
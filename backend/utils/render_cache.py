@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# OG / 分享圖片的渲染快取：以「渲染輸入 + 模板版本」的雜湊為 key，
+# 同一張圖不論被爬蟲抓幾次只渲染一次。
+# 本機磁碟為 LRU (以檔案 mtime 排序，超過容量上限時淘汰最久未使用者)，
+# 設定 RENDER_MIRROR_BUCKET 時另外鏡像到 Supabase Storage，容器重啟或多實例時可共用。
+
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join("/tmp", "tcu-render-cache"))
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_MB", "200")) * 1024 * 1024
+RENDER_MIRROR_BUCKET = os.getenv("RENDER_MIRROR_BUCKET")   # 例如 race-previews
+MIRROR_PREFIX = "renders"
+
+# render_key 產生的 16 字元雜湊，衍生尺寸另加 "-card" 之類的後綴；其他 key 一律拒絕，避免組出快取目錄以外的路徑
+KEY_PATTERN = re.compile(r"[0-9a-f]{16}(-[a-z]+)?")
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+def render_key(template_version: int, inputs: Dict[str, Any]) -> str:
+    """渲染輸入的內容雜湊 (16 字元)，輸入或模板版本不變時 key 不變"""
+    payload = json.dumps({"v": template_version, **inputs}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+class RenderCache:
+    def __init__(self, directory: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES, mirror_bucket: Optional[str] = RENDER_MIRROR_BUCKET):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mirror_bucket = mirror_bucket
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._size: Optional[int] = None
+
+    def _path(self, key: str, ext: str) -> str:
+        if not KEY_PATTERN.fullmatch(key) or ext not in CONTENT_TYPES:
+            raise ValueError(f"Invalid render cache key: {key!r}.{ext!r}")
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def _scan_size(self) -> int:
+        if self._size is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._size = sum(e.stat().st_size for e in os.scandir(self.directory) if e.is_file())
+        return self._size
+
+    def _evict(self):
+        """淘汰最久未使用的檔案直到低於容量上限 (呼叫端需持有 lock)"""
+        if self._scan_size() <= self.max_bytes:
+            return
+        entries = sorted(
+            (e for e in os.scandir(self.directory) if e.is_file()),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for e in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                size = e.stat().st_size
+                os.remove(e.path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str, ext: str) -> Optional[bytes]:
+        path = self._path(key, ext)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)   # 更新 mtime 作為 LRU 的最近使用時間
+            return data
+        except FileNotFoundError:
+            pass
+
+        data = self._mirror_download(key, ext)
+        if data is not None:
+            self._write_local(key, ext, data)
+        return data
+
+    def put(self, key: str, ext: str, data: bytes, mirror: bool = True):
+        self._write_local(key, ext, data)
+        if mirror:
+            self._mirror_upload(key, ext, data)
+
+    def get_or_render(self, key: str, ext: str, render: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """快取未命中時才渲染；同一 key 的並行請求等待第一個渲染結果，不重複渲染"""
+        data = self.get(key, ext)
+        if data is not None:
+            return data
+        with self._lock:
+            key_lock = self._key_locks.setdefault(f"{key}.{ext}", threading.Lock())
+        with key_lock:
+            data = self.get(key, ext)
+            if data is None:
+                data = render()
+                if data is not None:
+                    self.put(key, ext, data)
+        with self._lock:
+            self._key_locks.pop(f"{key}.{ext}", None)
+        return data
+
+    def _write_local(self, key: str, ext: str, data: bytes):
+        path = self._path(key, ext)
+        with self._lock:
+            self._scan_size()
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            existed = os.path.exists(path)
+            old_size = os.path.getsize(path) if existed else 0
+            os.replace(tmp, path)
+            self._size += len(data) - old_size
+            self._evict()
+
+    def _bucket(self):
+        from database import supabase
+        return supabase.storage.from_(self.mirror_bucket)
+
+    def _mirror_download(self, key: str, ext: str) -> Optional[bytes]:
+        if not self.mirror_bucket:
+            return None
+        try:
+            return self._bucket().download(f"{MIRROR_PREFIX}/{key}.{ext}")
+        except Exception:
+            return None
+
+    def _mirror_upload(self, key: str, ext: str, data: bytes):
+        if not self.mirror_bucket:
+            return
+        try:
+            self._bucket().upload(
+                path=f"{MIRROR_PREFIX}/{key}.{ext}",
+                file=data,
+                file_options={"content-type": CONTENT_TYPES.get(ext, "application/octet-stream"), "x-upsert": "true"},
+            )
+        except Exception as e:
+            print(f"[WARN] Mirror render {key}.{ext} to {self.mirror_bucket} failed: {e}")
+
+render_cache = RenderCache()
@@ -0,0 +1,127 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+from utils import render_assets
+
+# Pillow / staticmap 渲染為 CPU 密集工作，統一交給獨立的 process pool，
+# 避免阻塞 FastAPI event loop，也不受 GIL 限制。
+# 排隊數量有上限 (RENDER_QUEUE_SIZE)：爆量時直接回報 RenderQueueFull，讓呼叫端回 503，
+# 而不是無限堆積；單次渲染超過 timeout 時回報 RenderTimeout。
+# NOTE: timeout 只是不再等待結果，已開始的渲染仍會在子行程中跑完。
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "16"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "30"))
+
+class RenderQueueFull(Exception):
+    pass
+
+class RenderTimeout(Exception):
+    pass
+
+class RenderCancelled(Exception):
+    """共用渲染的發起請求被取消 (例如連線中斷)，等待同一結果的其他請求收到此例外"""
+    pass
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(RENDER_QUEUE_SIZE)
+_inflight: Dict[str, asyncio.Future] = {}
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 使用 spawn：主行程已有 event loop 與 HTTP client 執行緒，fork 後的子行程狀態不安全
+            # 子行程啟動時先載入字型與模板圖層 (utils/render_assets.py)
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=render_assets.preload,
+            )
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def shutdown():
+    """應用程式關閉時呼叫"""
+    _reset_pool()
+
+def _submit(fn: Callable, *args: Any):
+    if not _slots.acquire(blocking=False):
+        raise RenderQueueFull(f"Render queue is full ({RENDER_QUEUE_SIZE} pending)")
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BrokenProcessPool:
+        # 子行程異常結束 (例如記憶體不足被砍) 後重建 pool
+        _reset_pool()
+        try:
+            future = _get_pool().submit(fn, *args)
+        except Exception:
+            _slots.release()
+            raise
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda f: _slots.release())
+    return future
+
+async def render(fn: Callable, *args: Any, timeout: float = RENDER_TIMEOUT) -> Any:
+    """於 process pool 執行渲染函式 (async 端點使用)"""
+    future = _submit(fn, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        raise RenderTimeout(f"{getattr(fn, '__name__', fn)} exceeded {timeout}s")
+
+def render_sync(fn: Callable, *args: Any, timeout: float = RENDER_TIMEOUT) -> Any:
+    """於 process pool 執行渲染函式 (背景執行緒 / 批次工作使用)"""
+    future = _submit(fn, *args)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        raise RenderTimeout(f"{getattr(fn, '__name__', fn)} exceeded {timeout}s")
+
+async def render_cached(cache, key: str, ext: str, fn: Callable, *args: Any, timeout: float = RENDER_TIMEOUT) -> Optional[bytes]:
+    """
+    先查渲染快取，未命中時於 process pool 渲染並寫回快取。
+    同一 key 的並行請求共用同一次渲染 (爬蟲同時湧入時只渲染一次)。
+    快取讀寫可能涉及 Storage 鏡像的網路 I/O，放在 thread pool 執行。
+    """
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(None, cache.get, key, ext)
+    if data is not None:
+        return data
+
+    inflight_key = f"{key}.{ext}"
+    pending = _inflight.get(inflight_key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = loop.create_future()
+    _inflight[inflight_key] = pending
+    try:
+        data = await render(fn, *args, timeout=timeout)
+        if data is not None:
+            await loop.run_in_executor(None, cache.put, key, ext, data)
+        pending.set_result(data)
+        return data
+    except BaseException as e:
+        # 發起者被取消 (CancelledError 不是 Exception) 時也必須結束 pending，否則等待者會永遠卡住；
+        # 等待者本身並未被取消，改以一般例外通知，讓呼叫端照常走錯誤處理
+        if not pending.done():
+            pending.set_exception(e if isinstance(e, Exception) else RenderCancelled(f"Render of {inflight_key} was cancelled"))
+            # 沒有其他等待者時避免 "exception was never retrieved" 警告
+            pending.exception()
+        raise
+    finally:
+        _inflight.pop(inflight_key, None)
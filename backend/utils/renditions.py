@@ -0,0 +1,52 @@
+import io
+from typing import Optional, Tuple, Union
+from PIL import Image
+
+# 同一次渲染 (1200x630 主圖) 衍生的多尺寸、多格式版本
+# og：社群分享預覽；card：App 內賽事卡片；thumb：列表縮圖
+
+SIZES = {
+    "og": (1200, 630),
+    "card": (600, 315),
+    "thumb": (320, 168),
+}
+
+# 副檔名 -> (Pillow 格式, Content-Type, 儲存參數)
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+    "png": ("PNG", "image/png", {"optimize": True}),
+}
+
+FORMAT_ALIASES = {"jpeg": "jpg"}
+
+def normalize_format(fmt: Optional[str]) -> Optional[str]:
+    if not fmt:
+        return None
+    fmt = FORMAT_ALIASES.get(fmt.lower(), fmt.lower())
+    return fmt if fmt in FORMATS else None
+
+def negotiate_format(accept: str, default: str = "png") -> str:
+    """依 Accept 標頭選擇格式：支援 WebP 的瀏覽器優先 WebP，其餘 (包含社群爬蟲) 使用預設格式"""
+    accept = (accept or "").lower()
+    if "image/webp" in accept:
+        return "webp"
+    if default == "png" and "image/png" not in accept and "image/jpeg" in accept:
+        return "jpg"
+    return default
+
+def content_type(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+def make_rendition(master: Union[bytes, Image.Image], size: str, fmt: str) -> bytes:
+    """將主圖縮放至指定尺寸並編碼 (可於 render process pool 執行)"""
+    img = Image.open(io.BytesIO(master)) if isinstance(master, (bytes, bytearray)) else master
+    target: Tuple[int, int] = SIZES[size]
+    if img.size != target:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+    pil_format, _, options = FORMATS[fmt]
+    if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format=pil_format, **options)
+    return buf.getvalue()
@@ -0,0 +1,97 @@
+import numpy as np
+import polyline
+from typing import List, Tuple
+
+# 路線幾何：polyline 解碼、Mercator 投影到像素、Douglas-Peucker 簡化
+# 分享卡片 (utils/share_card.py) 與 OG 地圖 (utils/og_generator.py) 共用。
+# 所有座標一次以 NumPy 陣列運算，投影的範圍與比例只計算一次。
+
+DEFAULT_TOLERANCE_PX = 1.0
+
+def decode(poly_str: str) -> np.ndarray:
+    """解碼為 (n, 2) 的 [lat, lon] 陣列，無效時回傳空陣列"""
+    if not poly_str:
+        return np.zeros((0, 2))
+    return np.asarray(polyline.decode(poly_str), dtype=np.float64).reshape(-1, 2)
+
+def _mercator_y(lat_rad: np.ndarray) -> np.ndarray:
+    return np.log(np.tan(np.pi / 4 + lat_rad / 2))
+
+def project(latlon: np.ndarray, width: int, height: int, padding: int) -> np.ndarray:
+    """
+    以 Mercator 投影將整條路線置中縮放到畫布 (保持長寬比)，回傳 (n, 2) 的 [x, y] 像素座標。
+    路線退化為一點或一條經 / 緯線時所有點置於畫布中央。
+    """
+    if len(latlon) == 0:
+        return np.zeros((0, 2))
+    rad = np.radians(latlon)
+    x = rad[:, 1]
+    y = _mercator_y(rad[:, 0])
+
+    x_min, y_min = x.min(), y.min()
+    x_span = x.max() - x_min
+    y_span = y.max() - y_min
+    if x_span == 0 or y_span == 0:
+        return np.tile([width / 2, height / 2], (len(latlon), 1))
+
+    available_w = width - 2 * padding
+    available_h = height - 2 * padding
+    scale = min(available_w / x_span, available_h / y_span)
+    offset_x = padding + (available_w - x_span * scale) / 2
+    offset_y = padding + (available_h - y_span * scale) / 2
+
+    px = (x - x_min) * scale + offset_x
+    py = height - ((y - y_min) * scale + offset_y)   # 影像座標 Y 軸向下
+    return np.column_stack((px, py))
+
+def simplify_mask(points: np.ndarray, tolerance: float = DEFAULT_TOLERANCE_PX) -> np.ndarray:
+    """
+    Douglas-Peucker：回傳要保留的點的布林遮罩 (首尾一定保留)。
+    以堆疊取代遞迴，每個區段到弦的距離以 NumPy 一次計算。
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if n < 3 or tolerance <= 0:
+        keep[:] = True
+        return keep
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = points[start]
+        b = points[end]
+        seg = points[start + 1:end]
+        ab = b - a
+        length = np.hypot(ab[0], ab[1])
+        if length == 0:
+            dist = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        else:
+            dist = np.abs(ab[0] * (seg[:, 1] - a[1]) - ab[1] * (seg[:, 0] - a[0])) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return keep
+
+def route_pixels(poly_str: str, width: int, height: int, padding: int, tolerance: float = DEFAULT_TOLERANCE_PX) -> List[Tuple[float, float]]:
+    """解碼、投影並簡化，回傳可直接交給 ImageDraw.line 的座標列表"""
+    pixels = project(decode(poly_str), width, height, padding)
+    if len(pixels) == 0:
+        return []
+    return [tuple(p) for p in pixels[simplify_mask(pixels, tolerance)].tolist()]
+
+def simplify_latlon(latlon: np.ndarray, width: int, height: int, padding: int = 0, tolerance: float = DEFAULT_TOLERANCE_PX) -> np.ndarray:
+    """
+    依指定畫布大小下的像素誤差簡化經緯度路線 (供 staticmap 等自行投影的繪圖使用)，
+    回傳保留的 [lat, lon] 點。
+    """
+    if len(latlon) < 3:
+        return latlon
+    return latlon[simplify_mask(project(latlon, width, height, padding), tolerance)]
@@ -0,0 +1,146 @@
+import io
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from PIL import Image, ImageDraw, ImageFont
+from utils.render_assets import get_font, get_logo, vertical_gradient
+from utils.render_cache import render_key
+from utils.route_geometry import route_pixels
+
+# 分享頁 (GET /api/share/image/{segment_id}) 的 1200x630 卡片渲染
+# 不存取資料庫：輸入由 share_card_inputs() 從賽事資料取出，同時作為渲染快取的 key
+
+# 版面或繪製方式變更時遞增，舊的快取圖片與 URL 會自然失效
+SHARE_TEMPLATE_VERSION = 2
+
+def find_polyline_in_data(data: dict) -> str:
+    """
+    Recursively find a polyline string in a dictionary.
+    Prioritizes 'polyline', 'summary_polyline', 'map.polyline'.
+    """
+    if not data:
+        return ""
+    
+    # Direct keys
+    if isinstance(data.get("polyline"), str) and len(data["polyline"]) > 5:
+        return data["polyline"]
+    if isinstance(data.get("summary_polyline"), str) and len(data["summary_polyline"]) > 5:
+        return data["summary_polyline"]
+    
+    # Map object
+    map_obj = data.get("map")
+    if isinstance(map_obj, dict):
+        if isinstance(map_obj.get("polyline"), str) and len(map_obj["polyline"]) > 5:
+            return map_obj["polyline"]
+        if isinstance(map_obj.get("summary_polyline"), str) and len(map_obj["summary_polyline"]) > 5:
+            return map_obj["summary_polyline"]
+    elif isinstance(map_obj, str) and len(map_obj) > 5:
+        return map_obj
+        
+    return ""
+
+def share_card_inputs(race_data: Dict[str, Any]) -> Dict[str, Any]:
+    """取出影響卡片內容的欄位 (team_races 或 segments 資料列)"""
+    description = race_data.get("description")
+    name = race_data.get("name", "Unknown Race")
+    return {
+        "title": description if description and description.strip() else name,
+        "distance": f"{float(race_data.get('distance', 0)) / 1000:.1f}km",
+        "elevation": f"{race_data.get('total_elevation_gain', race_data.get('elevation_gain', 0))}m",
+        "grade": f"{race_data.get('average_grade', 0)}%",
+        "polyline": find_polyline_in_data(race_data),
+    }
+
+def share_page_data(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    share_pages view (migrations/017) 的資料列轉為分享頁使用的 race_data：
+    team_races 優先，回退至 segments 時 og_image 取自 segment_metadata；另附 race_description。
+    /api/share 與 og_prerender.py 共用，確保預先渲染的卡片與實際提供的相同。
+    """
+    race_data = row.get("team_race")
+    if race_data:
+        race_data = dict(race_data)
+    else:
+        if not row.get("segment"):
+            return None
+        race_data = dict(row["segment"])
+        race_data["og_image"] = row.get("metadata_og_image")
+    race_data["race_description"] = row.get("race_description") or ""
+    return race_data
+
+def share_card_key(inputs: Dict[str, Any]) -> str:
+    return render_key(SHARE_TEMPLATE_VERSION, inputs)
+
+W, H = 1200, 630
+BACKGROUND_TOP = (30, 41, 59)
+BACKGROUND_BOTTOM = (15, 23, 42)
+
+TITLE_FONT_SIZE = 60
+STAT_LABEL_FONT_SIZE = 24
+STAT_VALUE_FONT_SIZE = 64
+FOOTER_FONT_SIZE = 20
+LOGO_HEIGHT = 80
+ROUTE_PADDING = 50
+
+# 統計欄位的 X 座標與標籤 (label Y=510，value Y=560，footer 從 580 開始)
+STAT_COLUMNS = ((300, "DISTANCE", "distance"), (600, "ELEVATION", "elevation"), (900, "AVG GRADE", "grade"))
+
+@lru_cache(maxsize=1)
+def base_layer() -> Image.Image:
+    """
+    與賽事無關的靜態部分：背景漸層、統計標籤、footer 與 logo。
+    每個行程只繪製一次，渲染時複製後再畫上標題、數值與路線。
+    """
+    img = vertical_gradient(W, H, BACKGROUND_TOP, BACKGROUND_BOTTOM).copy()
+    draw = ImageDraw.Draw(img)
+
+    label_font = get_font(STAT_LABEL_FONT_SIZE, bold=False)
+    for x, label, _ in STAT_COLUMNS:
+        draw.text((x, 510), label, font=label_font, fill="#94a3b8", anchor="md")
+
+    draw.rectangle([(0, 580), (W, 630)], fill="#38bdf8")
+    draw.text((600, 605), "JOIN THE CHALLENGE AT STRAVA.CRITERIUM.TW", font=get_font(FOOTER_FONT_SIZE), fill="#0f172a", anchor="mm")
+
+    logo = get_logo(LOGO_HEIGHT)
+    if logo is not None:
+        img.paste(logo, (40, 40), logo)
+    return img
+
+def preload():
+    base_layer()
+    get_font(TITLE_FONT_SIZE)
+    get_font(STAT_VALUE_FONT_SIZE)
+
+def draw_share_card(inputs: Dict[str, Any], pixels) -> Image.Image:
+    """在底圖上繪製標題、數值與已投影的路線座標"""
+    img = base_layer().copy()
+    draw = ImageDraw.Draw(img)
+
+    # 1. Title & Stats
+    try:
+        # Center Title: X=W/2, anchor='mm' (middle-middle)
+        draw.text((W/2, 200), inputs["title"], font=get_font(TITLE_FONT_SIZE), fill="white", anchor="mm")
+
+        value_font = get_font(STAT_VALUE_FONT_SIZE)
+        for x, _, field in STAT_COLUMNS:
+            draw.text((x, 560), inputs[field], font=value_font, fill="white", anchor="md")
+    except UnicodeEncodeError:
+        print("Font encoding error, falling back to ASCII")
+        try:
+            draw.text((W/2, 200), "Race Info Available", font=ImageFont.load_default(), fill="white", anchor="mm")
+        except Exception as e2:
+            print(f"Fallback text drawing failed: {e2}")
+
+    # 2. Draw Polyline (Foreground Layer - On Top)
+    if len(pixels) > 1:
+        draw.line(pixels, fill="#fc4c02", width=10)
+    return img
+
+def encode_png(img: Image.Image) -> bytes:
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+def render_share_card(inputs: Dict[str, Any]) -> bytes:
+    """依 share_card_inputs() 的結果繪製 PNG"""
+    pixels = route_pixels(inputs.get("polyline"), W, H, ROUTE_PADDING)
+    return encode_png(draw_share_card(inputs, pixels))
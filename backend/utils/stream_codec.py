@@ -0,0 +1,266 @@
+"""
+strava_streams 的精簡二進位格式 (TCUS)。
+
+版面 (little-endian)：
+    header  : b"TCUS" | version u8 | flags u8 | stream 數量 u16
+    body    : 每個 stream 依序為
+              name_len u8 | name | encoding u8 | dtype u8 | columns u8 | has_nulls u8
+              | scale f64 | length u32 | payload_len u32 | (8 byte 對齊) payload
+              | (has_nulls 時) null bitmap (np.packbits)
+    flags bit0 = body 以 zlib 壓縮
+
+編碼方式 (每個 stream 取最小者)：
+    RAW          固定寬度整數陣列，解碼為 np.frombuffer 的零複製 view
+    DELTA        差分後以最窄整數寬度存放，解碼為 frombuffer + cumsum
+    DELTA_VARINT 差分 + zigzag + varint，以向量化方式解碼
+
+浮點數 stream 依 STREAM_SCALES 量化為整數 (例如海拔 0.1 m、座標 1e-6 度)，
+精度與 Strava API 回傳值相同。
+"""
+import struct
+import zlib
+import numpy as np
+from typing import Dict, Any, List, Optional, Union
+
+MAGIC = b"TCUS"
+VERSION = 1
+FLAG_ZLIB = 0x01
+MEDIA_TYPE = "application/x-tcu-streams"
+
+ENC_RAW = 0
+ENC_DELTA = 1
+ENC_DELTA_VARINT = 2
+
+# dtype 代碼
+_DTYPES = {
+    0: np.dtype("<i1"),
+    1: np.dtype("<i2"),
+    2: np.dtype("<i4"),
+    3: np.dtype("<i8"),
+    4: np.dtype("<f8"),
+    5: np.dtype("<u1"),
+}
+_DTYPE_CODES = {v: k for k, v in _DTYPES.items()}
+
+# 量化倍率：儲存值 = round(原始值 x scale)
+STREAM_SCALES = {
+    "time": 1,
+    "watts": 1,
+    "heartrate": 1,
+    "cadence": 1,
+    "temp": 1,
+    "moving": 1,
+    "distance": 10,          # 0.1 m
+    "altitude": 10,          # 0.1 m
+    "velocity_smooth": 1000, # 0.001 m/s
+    "grade_smooth": 10,      # 0.1 %
+    "latlng": 1_000_000,     # 1e-6 度 (約 0.1 m)
+}
+
+_HEADER = struct.Struct("<4sBBH")
+_STREAM_META = struct.Struct("<BBBBdII")
+
+StreamArray = Union[np.ndarray, np.ma.MaskedArray]
+
+def _zigzag_encode(v: np.ndarray) -> np.ndarray:
+    v = v.astype(np.int64)
+    return ((v << 1) ^ (v >> 63)).astype(np.uint64)
+
+def _zigzag_decode(u: np.ndarray) -> np.ndarray:
+    u = u.astype(np.uint64)
+    return ((u >> np.uint64(1)).astype(np.int64) ^ -(u & np.uint64(1)).astype(np.int64))
+
+def _varint_encode(u: np.ndarray) -> bytes:
+    """向量化 varint 編碼：每 7 bit 一組，最高位元表示後面還有位元組"""
+    if len(u) == 0:
+        return b""
+    u = u.astype(np.uint64)
+    nbytes = np.ones(len(u), dtype=np.int64)
+    rest = u >> np.uint64(7)
+    while np.any(rest):
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    max_bytes = int(nbytes.max())
+
+    k = np.arange(max_bytes, dtype=np.uint64)
+    groups = ((u[:, None] >> (np.uint64(7) * k)) & np.uint64(0x7F)).astype(np.uint8)
+    more = k[None, :].astype(np.int64) < (nbytes[:, None] - 1)
+    groups[more] |= 0x80
+    keep = k[None, :].astype(np.int64) < nbytes[:, None]
+    return groups[keep].tobytes()
+
+def _varint_decode(buf: np.ndarray) -> np.ndarray:
+    """向量化 varint 解碼：以結尾位元組切分群組，再以 reduceat 組回數值"""
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = (buf & 0x80) == 0
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    group = np.cumsum(np.concatenate(([0], ends[:-1].astype(np.int64))))
+    pos = np.arange(len(buf)) - starts[group]
+    parts = (buf & 0x7F).astype(np.uint64) << (np.uint64(7) * pos.astype(np.uint64))
+    return np.add.reduceat(parts, starts)
+
+def _narrowest_int(values: np.ndarray) -> np.dtype:
+    if len(values) == 0:
+        return np.dtype("<i1")
+    lo, hi = int(values.min()), int(values.max())
+    for code in (0, 1, 2, 3):
+        info = np.iinfo(_DTYPES[code])
+        if info.min <= lo and hi <= info.max:
+            return _DTYPES[code]
+    return _DTYPES[3]
+
+def _quantize(name: str, data: List[Any]):
+    """JSON 陣列 -> (整數或浮點陣列, 欄數, scale, null mask)"""
+    columns = 1
+    if data and isinstance(data[0], (list, tuple)):
+        columns = len(data[0])
+    if name == "moving" or (data and isinstance(data[0], bool)):
+        arr = np.asarray([bool(v) for v in data], dtype=np.uint8)
+        return arr, 1, 1.0, None
+
+    raw = np.array(data, dtype=np.float64)
+    nulls = np.isnan(raw) if raw.ndim == 1 else np.isnan(raw).any(axis=1)
+    if nulls.any():
+        raw[np.isnan(raw)] = 0
+    else:
+        nulls = None
+
+    scale = STREAM_SCALES.get(name)
+    if scale is None:
+        scale = 1 if np.all(raw == np.round(raw)) else None
+    if scale is None:
+        return raw.reshape(-1), columns, 0.0, nulls
+    return np.round(raw * scale).astype(np.int64).reshape(-1), columns, float(scale), nulls
+
+def _encode_payload(flat: np.ndarray, columns: int):
+    """回傳 (encoding, dtype, payload) 中最小者"""
+    if flat.dtype == np.float64 or flat.dtype == np.uint8:
+        return ENC_RAW, flat.dtype.newbyteorder("<"), flat.tobytes()
+
+    raw_dtype = _narrowest_int(flat)
+    best = (ENC_RAW, raw_dtype, flat.astype(raw_dtype).tobytes())
+
+    # 多欄位 (latlng) 以欄為單位差分，避免緯度與經度互相相減
+    per_column = flat.reshape(-1, columns)
+    deltas = np.diff(per_column, axis=0, prepend=np.zeros((1, columns), dtype=np.int64)).reshape(-1)
+    zz = _zigzag_encode(deltas)
+
+    delta_dtype = _narrowest_int(deltas)
+    delta_payload = deltas.astype(delta_dtype).tobytes()
+    if len(delta_payload) < len(best[2]):
+        best = (ENC_DELTA, delta_dtype, delta_payload)
+
+    varint_payload = _varint_encode(zz)
+    if len(varint_payload) < len(best[2]):
+        best = (ENC_DELTA_VARINT, np.dtype("<i8"), varint_payload)
+    return best
+
+def encode_streams(streams: Any, compress: bool = True) -> bytes:
+    """
+    將 Strava streams (JSON 陣列或 key_by_type 格式) 編碼為 TCUS 二進位格式。
+    null 值以 bitmap 另存，解碼後以 masked array 呈現。
+    """
+    if isinstance(streams, dict):
+        items = [(k, v.get("data") if isinstance(v, dict) else v) for k, v in streams.items()]
+    else:
+        items = [(s.get("type"), s.get("data")) for s in streams or [] if isinstance(s, dict)]
+
+    body = bytearray()
+    count = 0
+    for name, data in items:
+        if not name or data is None:
+            continue
+        flat, columns, scale, nulls = _quantize(name, list(data))
+        encoding, dtype, payload = _encode_payload(flat, columns)
+        length = len(flat) // columns if columns else 0
+
+        name_bytes = name.encode("utf-8")
+        body += struct.pack("<B", len(name_bytes)) + name_bytes
+        body += _STREAM_META.pack(encoding, _DTYPE_CODES[dtype], columns, 1 if nulls is not None else 0, scale, length, len(payload))
+        body += b"\0" * (-len(body) % 8)
+        body += payload
+        if nulls is not None:
+            body += np.packbits(nulls).tobytes()
+        count += 1
+
+    flags = FLAG_ZLIB if compress else 0
+    payload = zlib.compress(bytes(body), 6) if compress else bytes(body)
+    return _HEADER.pack(MAGIC, VERSION, flags, count) + payload
+
+def decode_streams(blob: bytes) -> Dict[str, StreamArray]:
+    """
+    解碼為 { stream 名稱: NumPy 陣列 }。
+    RAW 整數 stream 直接以 np.frombuffer 指向解碼緩衝區 (零複製，唯讀)；
+    量化過的浮點數 stream 會除以 scale 還原為 float64。
+    """
+    magic, version, flags, count = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a TCUS stream blob")
+    if version > VERSION:
+        raise ValueError(f"Unsupported TCUS version {version}")
+
+    body = memoryview(blob)[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+
+    result: Dict[str, StreamArray] = {}
+    offset = 0
+    for _ in range(count):
+        name_len = body[offset]
+        offset += 1
+        name = bytes(body[offset:offset + name_len]).decode("utf-8")
+        offset += name_len
+        encoding, dtype_code, columns, has_nulls, scale, length, payload_len = _STREAM_META.unpack_from(body, offset)
+        offset += _STREAM_META.size
+        offset += -offset % 8
+
+        dtype = _DTYPES[dtype_code]
+        payload = body[offset:offset + payload_len]
+        offset += payload_len
+
+        if encoding == ENC_RAW:
+            values = np.frombuffer(payload, dtype=dtype)
+        elif encoding == ENC_DELTA:
+            values = np.cumsum(np.frombuffer(payload, dtype=dtype).reshape(-1, columns), axis=0, dtype=np.int64).reshape(-1)
+        elif encoding == ENC_DELTA_VARINT:
+            deltas = _zigzag_decode(_varint_decode(np.frombuffer(payload, dtype=np.uint8)))
+            values = np.cumsum(deltas.reshape(-1, columns), axis=0).reshape(-1)
+        else:
+            raise ValueError(f"Unknown stream encoding {encoding}")
+
+        if scale not in (0.0, 1.0):
+            values = values / scale
+        if name == "moving":
+            values = values.astype(bool)
+        if columns > 1:
+            values = values.reshape(length, columns)
+
+        if has_nulls:
+            nbytes = (length + 7) // 8
+            mask = np.unpackbits(np.frombuffer(body[offset:offset + nbytes], dtype=np.uint8), count=length).astype(bool)
+            offset += nbytes
+            if columns > 1:
+                mask = np.repeat(mask[:, None], columns, axis=1)
+            values = np.ma.masked_array(values, mask=mask)
+
+        result[name] = values
+    return result
+
+def decoded_to_json(decoded: Dict[str, StreamArray]) -> List[Dict[str, Any]]:
+    """轉回 Strava API 的 JSON 陣列格式 (null 值還原為 None)"""
+    # MaskedArray.tolist() 會將被遮罩的元素轉為 None
+    return [{"type": name, "data": values.tolist()} for name, values in decoded.items()]
+
+def to_pg_bytea(blob: bytes) -> str:
+    """PostgREST 以 \\x 十六進位字串傳遞 bytea"""
+    return "\\x" + blob.hex()
+
+def from_pg_bytea(value: Optional[str]) -> Optional[bytes]:
+    if not value:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if value.startswith("\\x"):
+        return bytes.fromhex(value[2:])
+    return None
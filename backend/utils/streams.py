@@ -0,0 +1,73 @@
+import numpy as np
+from typing import Optional, List, Any, Dict
+from utils.stream_codec import decode_streams, from_pg_bytea
+
+# strava_streams.streams 欄位為 Strava API 原始格式：
+# [{ "type": "watts", "data": [...] }, { "type": "time", "data": [...] }, ...]
+# streams_bin 欄位為 utils/stream_codec.py 的 TCUS 二進位格式，存在時優先使用
+
+STREAM_COLUMNS = "streams, streams_bin"
+
+def load_streams(row: Dict[str, Any]) -> Any:
+    """
+    取得 strava_streams 資料列的 streams。
+    有 streams_bin 時解碼為 { 名稱: NumPy 陣列 }，省去解析大型 JSON 陣列；否則回傳原始 JSON。
+    """
+    blob = from_pg_bytea(row.get("streams_bin"))
+    if blob:
+        try:
+            return decode_streams(blob)
+        except ValueError as e:
+            print(f"[WARN] Invalid streams_bin, falling back to JSON: {e}")
+    return row.get("streams")
+
+def extract_stream(streams: Any, stream_type: str) -> Optional[List[Any]]:
+    """從 streams 陣列中取出指定類型的資料，不存在時回傳 None"""
+    if not streams:
+        return None
+    # 也容許 { "watts": { "data": [...] } } 這種 key_by_type 格式
+    if isinstance(streams, dict):
+        entry = streams.get(stream_type)
+        if isinstance(entry, dict):
+            return entry.get("data")
+        return entry
+    for s in streams:
+        if isinstance(s, dict) and s.get("type") == stream_type:
+            return s.get("data")
+    return None
+
+def to_array(values: Any, dtype=np.float64) -> np.ndarray:
+    """將 stream 資料轉為 NumPy 陣列，None (斷訊) 以 0 取代"""
+    if values is None or len(values) == 0:
+        return np.zeros(0, dtype=dtype)
+    if isinstance(values, np.ma.MaskedArray):
+        return values.filled(0).astype(dtype, copy=False)
+    if isinstance(values, np.ndarray):
+        return values.astype(dtype, copy=False)
+    arr = np.array(values, dtype=np.float64)
+    arr[np.isnan(arr)] = 0
+    return arr.astype(dtype, copy=False)
+
+def to_1hz(values: np.ndarray, time: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    將資料對齊到每秒一筆。
+    Strava 在自動暫停或裝置降頻時 time 會跳秒，缺漏的秒數以 0 補齊，
+    讓滑動視窗的長度等於真實經過的秒數。
+    """
+    if time is None or len(time) != len(values) or len(values) == 0:
+        return values
+    t = np.asarray(time, dtype=np.int64)
+    t = t - t[0]
+    if t[-1] + 1 == len(t):
+        return values
+    out = np.zeros(int(t[-1]) + 1, dtype=values.dtype)
+    out[t] = values
+    return out
+
+def load_1hz_stream(streams: Any, stream_type: str, dtype=np.float64) -> np.ndarray:
+    """取出指定 stream 並對齊為每秒一筆"""
+    values = to_array(extract_stream(streams, stream_type), dtype)
+    if len(values) == 0:
+        return values
+    time = extract_stream(streams, "time")
+    return to_1hz(values, np.asarray(time) if time is not None and len(time) else None)
@@ -0,0 +1,89 @@
+import numpy as np
+from typing import Dict, Optional, Sequence
+
+# 車隊賽事團體計分 (team_race_scoring.py)
+#   top_n   : 各隊最快 N 人時間加總，越小越好；完賽不足 N 人的隊伍排在完整隊伍之後
+#   average : 各隊完賽者平均時間，越小越好
+#   points  : 依個人總排名給分 (DEFAULT_POINTS)，各隊取前 N 人 (top_n=None 為全部) 加總，越大越好
+SCORING_RULES = ("top_n", "average", "points")
+DEFAULT_RULE = "top_n"
+DEFAULT_TOP_N = 3
+DEFAULT_POINTS = (25, 20, 16, 13, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1)
+
+def overall_positions(times: np.ndarray) -> np.ndarray:
+    """個人總排名 (0 起算)，同秒數者名次相同"""
+    order = np.argsort(times, kind="stable")
+    sorted_times = times[order]
+    # 與前一名同秒數時沿用前一名的名次
+    first = np.r_[True, sorted_times[1:] != sorted_times[:-1]]
+    pos_sorted = np.maximum.accumulate(np.where(first, np.arange(len(times)), 0))
+    positions = np.empty(len(times), dtype=np.int64)
+    positions[order] = pos_sorted
+    return positions
+
+def rank_within_team(team_idx: np.ndarray, times: np.ndarray, n_teams: int) -> np.ndarray:
+    """每位選手在自己隊伍中的名次 (0 起算)"""
+    order = np.lexsort((times, team_idx))
+    counts = np.bincount(team_idx, minlength=n_teams)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = np.empty(len(times), dtype=np.int64)
+    ranks[order] = np.arange(len(times)) - starts[team_idx[order]]
+    return ranks
+
+def score_teams(
+    team_idx: np.ndarray,
+    times: np.ndarray,
+    n_teams: int,
+    rule: str = DEFAULT_RULE,
+    top_n: Optional[int] = DEFAULT_TOP_N,
+    points: Optional[Sequence[int]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    以向量運算計算所有隊伍的成績 (每位選手一筆最佳成績)。
+    team_idx: 每位選手所屬隊伍索引 (0 ~ n_teams-1)；times: 最佳成績秒數
+    回傳 score / finishers / counted / rank (1 起算) 與每位選手的 counted、points
+    """
+    if rule not in SCORING_RULES:
+        raise ValueError(f"Unknown scoring rule: {rule}")
+    team_idx = np.asarray(team_idx, dtype=np.int64)
+    times = np.asarray(times, dtype=np.float64)
+
+    finishers = np.bincount(team_idx, minlength=n_teams)
+    in_team = rank_within_team(team_idx, times, n_teams)
+    rider_points = np.zeros(len(times), dtype=np.float64)
+
+    if rule == "average":
+        counted_mask = np.ones(len(times), dtype=bool)
+    else:
+        counted_mask = in_team < top_n if top_n else np.ones(len(times), dtype=bool)
+    counted = np.bincount(team_idx, weights=counted_mask, minlength=n_teams).astype(np.int64)
+
+    if rule == "points":
+        table = np.asarray(points or DEFAULT_POINTS, dtype=np.float64)
+        pos = overall_positions(times)
+        rider_points = np.where(pos < len(table), table[np.minimum(pos, len(table) - 1)], 0)
+        score = np.bincount(team_idx, weights=rider_points * counted_mask, minlength=n_teams)
+        complete = finishers > 0
+        sort_score = -score
+    else:
+        total = np.bincount(team_idx, weights=times * counted_mask, minlength=n_teams)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = total / counted if rule == "average" else total
+        complete = finishers >= (top_n or 1) if rule == "top_n" else finishers > 0
+        sort_score = score
+
+    # 排序：完整隊伍優先 -> (top_n) 計分人數多者優先 -> 成績
+    depth = -counted if rule == "top_n" else np.zeros(n_teams, dtype=np.int64)
+    order = np.lexsort((np.nan_to_num(sort_score, nan=np.inf), depth, ~complete))
+    rank = np.empty(n_teams, dtype=np.int64)
+    rank[order] = np.arange(1, n_teams + 1)
+
+    return {
+        "score": score,
+        "finishers": finishers,
+        "counted": counted,
+        "complete": complete,
+        "rank": rank,
+        "rider_counted": counted_mask,
+        "rider_points": rider_points,
+    }
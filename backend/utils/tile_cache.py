@@ -0,0 +1,211 @@
+import math
+import os
+import sys
+import threading
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+import requests
+from PIL import Image
+from staticmap import StaticMap
+
+# OG 地圖底圖的本機圖磚快取 (z/x/y)
+# - 磁碟快取，超過容量上限時依 mtime 淘汰最久未使用的圖磚
+# - 同一圖磚的並行請求只發出一次下載 (同一行程內)；不同行程透過磁碟共用
+# - TILE_OFFLINE=1 時只使用快取或內附圖磚 (assets/tiles/{z}/{x}/{y}.png)，缺少的圖磚以底色填滿
+# 台灣熱門爬坡路段的圖磚可用 prefetch_bbox() 預先下載。
+
+TILE_URL_TEMPLATE = os.getenv("TILE_URL_TEMPLATE", "https://basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png")
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join("/tmp", "tcu-tile-cache"))
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_MB", "500")) * 1024 * 1024
+TILE_OFFLINE = os.getenv("TILE_OFFLINE", "").lower() in ("1", "true", "yes")
+BUNDLED_TILES_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "tiles")
+TILE_TIMEOUT = 10
+TILE_SIZE = 256
+BLANK_TILE_COLOR = (38, 38, 38)   # 接近 CartoDB dark_all 的底色
+
+def _blank_tile() -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (TILE_SIZE, TILE_SIZE), BLANK_TILE_COLOR).save(buf, format="PNG")
+    return buf.getvalue()
+
+class TileCache:
+    def __init__(
+        self,
+        url_template: str = TILE_URL_TEMPLATE,
+        directory: str = TILE_CACHE_DIR,
+        max_bytes: int = TILE_CACHE_MAX_BYTES,
+        offline: bool = TILE_OFFLINE,
+        bundled_dir: str = BUNDLED_TILES_DIR,
+    ):
+        self.url_template = url_template
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.bundled_dir = bundled_dir
+        self._session = requests.Session()
+        self._session.headers.update({"User-Agent": "TCU-OG-Renderer"})
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[int, int, int], threading.Event] = {}
+        self._size: Optional[int] = None
+        self._blank: Optional[bytes] = None
+        self.stats = {"hits": 0, "misses": 0, "fetches": 0}
+
+    def _path(self, root: str, z: int, x: int, y: int) -> str:
+        return os.path.join(root, str(z), str(x), f"{y}.png")
+
+    def _read(self, z: int, x: int, y: int) -> Optional[bytes]:
+        path = self._path(self.directory, z, x, y)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)   # LRU：更新最近使用時間
+            return data
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self._path(self.bundled_dir, z, x, y), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _scan_size(self) -> int:
+        if self._size is None:
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+            self._size = total
+        return self._size
+
+    def _evict(self):
+        """淘汰最久未使用的圖磚直到低於容量上限的 90% (呼叫端需持有 lock)"""
+        if self._scan_size() <= self.max_bytes:
+            return
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def _write(self, z: int, x: int, y: int, data: bytes):
+        path = self._path(self.directory, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._scan_size()
+            self._size += len(data)
+            self._evict()
+
+    def _fetch(self, z: int, x: int, y: int) -> Optional[bytes]:
+        self.stats["fetches"] += 1
+        try:
+            res = self._session.get(self.url_template.format(z=z, x=x, y=y), timeout=TILE_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"[WARN] Tile {z}/{x}/{y} fetch failed: {e}")
+            return None
+        if res.status_code != 200:
+            print(f"[WARN] Tile {z}/{x}/{y} fetch failed: HTTP {res.status_code}")
+            return None
+        self._write(z, x, y, res.content)
+        return res.content
+
+    def blank_tile(self) -> bytes:
+        if self._blank is None:
+            self._blank = _blank_tile()
+        return self._blank
+
+    def get_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """取得圖磚：快取 / 內附圖磚 -> (非離線時) 下載；離線且缺少時回傳 None"""
+        data = self._read(z, x, y)
+        if data is not None:
+            self.stats["hits"] += 1
+            return data
+        self.stats["misses"] += 1
+        if self.offline:
+            return None
+
+        key = (z, x, y)
+        with self._lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._inflight[key] = event
+        if not owner:
+            # 其他執行緒正在下載同一圖磚，等待後讀取其結果
+            event.wait(TILE_TIMEOUT * 2)
+            return self._read(z, x, y)
+
+        try:
+            return self._fetch(z, x, y)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def prefetch_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, zooms=range(8, 15)) -> int:
+        """預先下載範圍內的圖磚 (例如熱門爬坡路段周邊)，回傳圖磚數"""
+        count = 0
+        for z in zooms:
+            x0, y0 = lonlat_to_tile(min_lon, max_lat, z)
+            x1, y1 = lonlat_to_tile(max_lon, min_lat, z)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    if self.get_tile(z, x, y) is not None:
+                        count += 1
+        return count
+
+def lonlat_to_tile(lon: float, lat: float, zoom: int) -> Tuple[int, int]:
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return x, y
+
+_default_cache: Optional[TileCache] = None
+
+def default_tile_cache() -> TileCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TileCache()
+    return _default_cache
+
+class CachedStaticMap(StaticMap):
+    """
+    經由 TileCache 取得圖磚的 StaticMap。
+    staticmap 以 url_template 產生每個圖磚的「URL」再呼叫 get()，
+    這裡將 url_template 設為 z/x/y 作為快取 key，實際 URL 由 TileCache 決定。
+    """
+
+    def __init__(self, width: int, height: int, tile_cache: Optional[TileCache] = None, **kwargs):
+        super().__init__(width, height, url_template="{z}/{x}/{y}", **kwargs)
+        self.tile_cache = tile_cache or default_tile_cache()
+
+    def get(self, url, **kwargs):
+        z, x, y = (int(v) for v in url.split("/"))
+        data = self.tile_cache.get_tile(z, x, y)
+        if data is None:
+            if self.tile_cache.offline:
+                return 200, self.tile_cache.blank_tile()
+            return None, None
+        return 200, data
+
+if __name__ == "__main__":
+    # 預先下載圖磚：python -m utils.tile_cache min_lat min_lon max_lat max_lon [min_zoom max_zoom]
+    args = [float(a) for a in sys.argv[1:5]]
+    zooms = range(int(sys.argv[5]), int(sys.argv[6]) + 1) if len(sys.argv) > 6 else range(8, 15)
+    count = default_tile_cache().prefetch_bbox(*args, zooms=zooms)
+    print(f"Cached {count} tiles")